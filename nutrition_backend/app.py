@@ -1,30 +1,84 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import BackgroundTasks, FastAPI, File, UploadFile, HTTPException, Request, Header, Query, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List
-import joblib
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import List, Literal, Optional
+from urllib.parse import quote
+from contextlib import asynccontextmanager
+import os
 import pandas as pd
 import uvicorn
 from io import BytesIO
 import base64
+import hmac
+import json
+import time
+from datetime import datetime
 
-from db import SessionLocal
-from database_models import Prediction  # SQLAlchemy model
-from sqlalchemy import desc, func
+from db import dispose_async_engine, get_async_engine, get_async_session_factory, get_db
+from database_models import Prediction, check_prediction_id_sequence, format_user_id  # SQLAlchemy model
+from sqlalchemy import desc, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from services.nutrients_predictor import predict_nutrients_from_image
 from services.ingredient_predictor import predict_ingredients_from_image
-from services.meal_plan_predictor import generate_meal_plan
+from services.nutrition_model import get_fast_predictor, get_nutrition_model_status, load_nutrition_model
+from services.meal_plan_predictor import (
+    generate_meal_plan,
+    generate_weekly_meal_plan,
+    iter_meal_plan,
+    macro_ratios_from_grams,
+)
+from services.dish_catalog import (
+    CatalogWatcher,
+    get_catalog_status,
+    get_dish_catalog,
+    get_dish_thumbnail,
+    read_dish_image,
+    reload_dish_catalog,
+)
+from services.meal_plan_cache import meal_plan_cache
+from services.prediction_writer import PREDICTION_WRITE_BEHIND, prediction_writer
+from services.prediction_history import get_history_trends
+from services.history_cache import history_cache
+from services.prediction_archive import archived_user_months_query, read_archived_history
+from services.prediction_export import EXPORT_MEDIA_TYPES, stream_predictions
+from services.meal_analysis_store import ANONYMOUS_USER_ID, find_meal_analysis, image_hash, save_meal_analysis
+from services.metrics import MetricsMiddleware, observe_since_request_start, observe_stage, render_metrics, time_stage
 from models import (  # Pydantic models
     UserInput,
+    HistoryTrendsResponse,
     MealSuggestionRequest,
+    WeeklyMealPlanRequest,
+    ProfileMealPlanRequest,
     Nutrient,
     Ingredient,
     MealAnalysisResponse,
     MealNutrient,
     MealSuggestion,
+    DailyMealPlan,
+    ProfileMealPlanResponse,
 )
 
-app = FastAPI(title="Nutrition & Meal Prediction API")
+catalog_watcher = CatalogWatcher()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reload the dish catalog in the background when the dataset files change
+    catalog_watcher.start()
+    # Opt-in write-behind queue for saved predictions (drained before the engine closes)
+    if PREDICTION_WRITE_BEHIND:
+        # The queue reserves ids up front; refuse to start where the database could reuse them
+        async with get_async_engine().connect() as connection:
+            await connection.run_sync(check_prediction_id_sequence)
+        prediction_writer.start(get_async_session_factory())
+    yield
+    catalog_watcher.stop()
+    await prediction_writer.stop()
+    await dispose_async_engine()
+
+
+app = FastAPI(title="Nutrition & Meal Prediction API", lifespan=lifespan)
 
 # CORS Middleware - Combined origins from both files
 app.add_middleware(
@@ -40,13 +94,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Load nutrition model once when server starts (if exists)
-try:
-    model = joblib.load("artifacts/nutrition_model.pkl")
-except FileNotFoundError:
-    model = None
+# Request latency and in-flight gauges per route, served with the stage timings at /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Shared secret for the admin endpoints (unset = admin endpoints are disabled)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: Optional[str]) -> None:
+    """Reject admin calls without the configured token, and all of them when no token is configured."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+# Largest number of profiles accepted by /predict/batch
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "1000"))
+
+# Rows per /history/{user_id} page (default and largest allowed ?limit)
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "100"))
+# Largest ?periods / ?window of /history/{user_id}/trends
+HISTORY_TRENDS_MAX_PERIODS = int(os.getenv("HISTORY_TRENDS_MAX_PERIODS", "366"))
+
+
+# Load nutrition model once when server starts (if exists); the compiled export is memory-mapped
+model = load_nutrition_model()
+if model is None:
     print("Warning: nutrition_model.pkl not found. Nutrition prediction endpoints will not work.")
 
 
@@ -56,85 +134,246 @@ def home():
     return {"status": "OK", "message": "Nutrition Model API running. Visit /docs"}
 
 
-@app.post("/predict")
-def predict(data: UserInput):
+def predict_nutrition(data: UserInput) -> dict:
+    """Run the nutrition model on one user profile."""
+    return predict_nutrition_batch([data])[0]
+
+
+def predict_nutrition_batch(profiles: List[UserInput]) -> list:
+    """Run the nutrition model once on a stack of user profiles."""
     if model is None:
         raise HTTPException(status_code=503, detail="Nutrition model not available")
     
-    X = pd.DataFrame([data.model_dump()])
-    pred = model.predict(X)[0]
+    rows = [data.model_dump() for data in profiles]
+    fast_predictor = get_fast_predictor(model)
+    if fast_predictor is not None:
+        preds = fast_predictor.predict_batch(rows)
+    else:
+        with time_stage("nutrition_model", "pipeline_inference"):
+            X = pd.DataFrame(rows)
+            preds = model.predict(X)
 
-    return {
-        "daily_kcal_need": int(round(pred[0])),
-        "protein_g_per_day": float(round(pred[1], 1)),
-        "carbs_g_per_day": float(round(pred[2], 1)),
-        "fat_g_per_day": float(round(pred[3], 1)),
-    }
+    return [
+        {
+            "daily_kcal_need": int(round(pred[0])),
+            "protein_g_per_day": float(round(pred[1], 1)),
+            "carbs_g_per_day": float(round(pred[2], 1)),
+            "fat_g_per_day": float(round(pred[3], 1)),
+        }
+        for pred in preds
+    ]
 
 
-@app.post("/predict-and-save")
-def predict_and_save(data: UserInput):
-    if model is None:
-        raise HTTPException(status_code=503, detail="Nutrition model not available")
-    
-    X = pd.DataFrame([data.model_dump()])
-    pred = model.predict(X)[0]
-
-    result = {
-        "daily_kcal_need": int(round(pred[0])),
-        "protein_g_per_day": float(round(pred[1], 1)),
-        "carbs_g_per_day": float(round(pred[2], 1)),
-        "fat_g_per_day": float(round(pred[3], 1)),
-    }
+async def save_prediction(db: AsyncSession, data: UserInput, result: dict) -> dict:
+    """Persist a nutrition prediction and return its saved id and generated user id."""
+    return (await save_predictions(db, [data], [result]))[0]
 
-    db = SessionLocal()
-    try:
-        # ✅ AUTO user_id generation (user_000001, user_000002...)
-        last_id = db.query(func.max(Prediction.id)).scalar()
-        next_num = (last_id or 0) + 1
-        auto_user_id = f"user_{next_num:06d}"
-
-        row = Prediction(
-            user_id=auto_user_id,   # ✅ now automatic
-            **data.model_dump(),
-            **result
+
+async def save_predictions(db: AsyncSession, profiles: List[UserInput], results: list) -> list:
+    """
+    Persist nutrition predictions with one INSERT ... RETURNING (executemany for several rows),
+    or queue them on the write-behind writer when it is running.
+    """
+    rows = [{**data.model_dump(), **result} for data, result in zip(profiles, results)]
+    if prediction_writer.running:
+        # Ids come from a reserved block; the rows are inserted by the next background flush
+        return await prediction_writer.save(rows)
+
+    # ✅ AUTO user_id generation (user_000001, user_000002...): the database derives it
+    # from the new row id inside the INSERT, so concurrent saves never share a user_id
+    with time_stage("db", "insert_predictions"):
+        saved = (await db.execute(
+            insert(Prediction).returning(Prediction.id, Prediction.user_id, sort_by_parameter_order=True),
+            rows
+        )).all()
+        await db.commit()
+
+    # SQLite assigns user_id after the insert, so RETURNING only sees the id there
+    saved = [
+        {"saved_id": row.id, "user_id": row.user_id or format_user_id(row.id)}  # ✅ return user_id too
+        for row in saved
+    ]
+    history_cache.invalidate(row["user_id"] for row in saved)
+    return saved
+
+
+@app.post("/predict")
+def predict(data: UserInput):
+    return predict_nutrition(data)
+
+
+@app.post("/predict/batch")
+async def predict_batch(profiles: List[UserInput], save: bool = False, db: AsyncSession = Depends(get_db)):
+    """
+    Predict nutrition needs for many user profiles in one model call.
+    With save=true all predictions are stored with a single bulk insert.
+    """
+    if not profiles:
+        return []
+    if len(profiles) > PREDICT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(profiles)} profiles exceeds the limit of {PREDICT_BATCH_MAX_SIZE}"
         )
 
-        db.add(row)
-        db.commit()
-        db.refresh(row)
+    results = await run_in_threadpool(predict_nutrition_batch, profiles)
+    if not save:
+        return results
 
-        return {"saved_id": row.id, "user_id": row.user_id, **result}  # ✅ return user_id too
-    finally:
-        db.close()
+    saved = await save_predictions(db, profiles, results)
+    return [{**saved_row, **result} for saved_row, result in zip(saved, results)]
 
 
-@app.get("/history/{user_id}")
-def get_history(user_id: str):
-    db = SessionLocal()
+@app.post("/predict-and-save")
+async def predict_and_save(data: UserInput, db: AsyncSession = Depends(get_db)):
+    result = await run_in_threadpool(predict_nutrition, data)
+    return {**await save_prediction(db, data, result), **result}
+
+
+def encode_history_cursor(row: dict) -> str:
+    """Opaque cursor pointing just past history row `row` in the history order."""
+    payload = json.dumps([row["created_at"].isoformat(), row["id"]]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> tuple:
+    """Return (created_at, id) of a history cursor, or raise 400."""
     try:
-        rows = (
-            db.query(Prediction)
-            .filter(Prediction.user_id == user_id)
-            .order_by(desc(Prediction.created_at))
-            .limit(20)
-            .all()
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
+
+# Fields of a /history row
+HISTORY_FIELDS = [
+    "id", "user_id", "created_at", "daily_kcal_need", "protein_g_per_day", "carbs_g_per_day", "fat_g_per_day"
+]
+
+
+async def load_history_page(db: AsyncSession, user_id: str, page_size: int, cursor: Optional[str] = None) -> dict:
+    """
+    One history page: {"rows": [...], "next_cursor": str or None}.
+    Archived predictions are older than every row left in the table, so a page continues
+    into the monthly archive files once the user's rows in the table run out (only into
+    the months archived_user_months lists for the user).
+    """
+    position = decode_history_cursor(cursor) if cursor else None
+    query = (
+        select(Prediction)
+        .where(Prediction.user_id == user_id)
+        .order_by(desc(Prediction.created_at), Prediction.id)
+    )
+    if position:
+        created_at, row_id = position
+        query = query.where(
+            Prediction.created_at <= created_at,
+            or_(Prediction.created_at < created_at, Prediction.id > row_id)
         )
 
-        return [
-            {
-                "id": r.id,
-                "user_id": r.user_id,
-                "created_at": r.created_at,
-                "daily_kcal_need": r.daily_kcal_need,
-                "protein_g_per_day": r.protein_g_per_day,
-                "carbs_g_per_day": r.carbs_g_per_day,
-                "fat_g_per_day": r.fat_g_per_day,
-            }
-            for r in rows
+    # One extra row tells whether another page follows
+    with time_stage("db", "history_page"):
+        rows = [
+            {field: getattr(r, field) for field in HISTORY_FIELDS}
+            for r in (await db.scalars(query.limit(page_size + 1))).all()
         ]
-    finally:
-        db.close()
+    if len(rows) <= page_size:
+        # Continue after the last row of the page: a retention run interrupted before its
+        # deletes leaves rows both in the table and in the archive
+        archive_position = (rows[-1]["created_at"], rows[-1]["id"]) if rows else position
+        with time_stage("db", "archived_user_months"):
+            months = (await db.scalars(archived_user_months_query(user_id, archive_position))).all()
+        if months:
+            with time_stage("prediction_archive", "read_history"):
+                archived = await run_in_threadpool(
+                    read_archived_history, user_id, page_size + 1 - len(rows), archive_position, months=months
+                )
+            page_ids = {row["id"] for row in rows}
+            rows += [{field: row[field] for field in HISTORY_FIELDS} for row in archived if row["id"] not in page_ids]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_history_cursor(rows[-1])
+    return {"rows": rows, "next_cursor": next_cursor}
+
+
+@app.get("/history/{user_id}")
+async def get_history(
+    user_id: str,
+    response: Response,
+    limit: Optional[int] = Query(default=None, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Saved predictions of a user, newest first, one page at a time.
+
+    Pages are keyset-paginated on (created_at, id): pass the `X-Next-Cursor` header of
+    a page as ?cursor= to get the next one (no header on the last page). Every page is
+    one range scan of the (user_id, created_at DESC, id) index, however deep.
+    The first page of each user is served from the history cache until the user's next write.
+    """
+    page_size = limit or HISTORY_PAGE_SIZE
+    page = history_cache.get(user_id, page_size) if not cursor else None
+    if page is None:
+        generation = history_cache.generation(user_id)
+        page = await load_history_page(db, user_id, page_size, cursor)
+        if not cursor:
+            history_cache.put(user_id, page_size, page, generation)
+
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["rows"]
+
+
+@app.get("/history/{user_id}/trends", response_model=HistoryTrendsResponse)
+async def history_trends(
+    user_id: str,
+    bucket: Literal["day", "week", "month"] = "week",
+    periods: int = Query(default=12, ge=1, le=HISTORY_TRENDS_MAX_PERIODS),
+    window: int = Query(default=4, ge=1, le=HISTORY_TRENDS_MAX_PERIODS),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Per-period averages of a user's predicted calories and macro targets, with a rolling
+    average over the last `window` calendar periods and the change from the previous period.
+
+    Covers the `periods` most recent day / week / month buckets up to the latest prediction.
+    Aggregated in the database, so the cost depends on the range, not the history length.
+    """
+    return {
+        "user_id": user_id,
+        "bucket": bucket,
+        "window": window,
+        "periods": await get_history_trends(db, user_id, bucket, periods, window),
+    }
+
+
+@app.get("/api/export/predictions")
+async def export_predictions(
+    export_format: Literal["ndjson", "csv", "parquet"] = Query(default="ndjson", alias="format"),
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session_factory=Depends(get_async_session_factory),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Stream saved predictions (all columns, id order) as NDJSON, CSV or Parquet.
+
+    Optional filters: ?user_id= and a created_at range ?start= (inclusive) / ?end= (exclusive).
+    Rows are read through a server-side cursor batch by batch, so memory stays flat for any
+    export size. Archived months are not included (they already are Parquet files).
+    Requires X-Admin-Token (disabled when ADMIN_TOKEN is not set).
+    """
+    require_admin(x_admin_token)
+    return StreamingResponse(
+        stream_predictions(session_factory, export_format, user_id, start, end),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="predictions.{export_format}"'}
+    )
 
 
 # ============================================================================
@@ -142,18 +381,37 @@ def get_history(user_id: str):
 # ============================================================================
 
 @app.post("/api/analyze-meal", response_model=MealAnalysisResponse)
-async def analyze_meal(image: UploadFile = File(...)):
+async def analyze_meal(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    image: UploadFile = File(...),
+    user_id: Optional[str] = Query(default=None),
+    session_factory=Depends(get_async_session_factory)
+):
     """
     Analyze uploaded meal image and return ingredients, nutrients, and calories.
     Uses ML models to predict both ingredients and nutrients from the image.
+    Analyses are stored per user and image hash after the response is sent, and
+    an image analyzed before is answered from the stored result.
     """
+    # Everything before this point is routing and multipart parsing of the upload
+    observe_since_request_start(request.scope, "analyze_meal", "multipart_parsing")
     try:
         # Read image bytes once
-        image_bytes = await image.read()
+        with time_stage("analyze_meal", "read_upload"):
+            image_bytes = await image.read()
         
         # Reset file pointer for future reads if needed
         await image.seek(0)
         
+        # Reuse the stored analysis of the same photo (recording it for this user if needed)
+        hash_ = image_hash(image_bytes)
+        stored = await find_meal_analysis(session_factory, user_id, hash_)
+        if stored is not None:
+            if stored["user_id"] != (user_id or ANONYMOUS_USER_ID):
+                background_tasks.add_task(save_meal_analysis, session_factory, user_id, hash_, stored["analysis"])
+            return stored["analysis"]
+        
         # Create mock UploadFile-like objects for the predictors
         # The predictors read from image_file.file.read()
         class MockUploadFile:
@@ -169,6 +427,8 @@ async def analyze_meal(image: UploadFile = File(...)):
         # Use ML prediction service to get ingredients from image
         ingredients_output = predict_ingredients_from_image(ingredients_upload)
         
+        postprocess_start = time.perf_counter()
+        
         # Extract values from nutrients ML prediction (per 100g)
         protein = nutrients_output.get('protein', 0)
         fat = nutrients_output.get('fat', 0)
@@ -254,7 +514,10 @@ async def analyze_meal(image: UploadFile = File(...)):
             "nutrients": nutrients,
             "calories_per_100g": round(calories_per_100g, 2)
         }
+        observe_stage("analyze_meal", "postprocess", time.perf_counter() - postprocess_start)
         
+        # Stored once the response has been sent
+        background_tasks.add_task(save_meal_analysis, session_factory, user_id, hash_, response)
         return response
         
     except FileNotFoundError as e:
@@ -282,6 +545,165 @@ async def analyze_meal(image: UploadFile = File(...)):
         )
 
 
+# Dish thumbnails only change with the catalog, so clients may cache them for a year
+DISH_IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Meal templates for meal names and times
+MEAL_TEMPLATES = {
+    2: [
+        {"meal_name": "Breakfast", "time": "09:00 AM"},
+        {"meal_name": "Dinner", "time": "07:00 PM"}
+    ],
+    3: [
+        {"meal_name": "Breakfast", "time": "08:00 AM"},
+        {"meal_name": "Lunch", "time": "12:30 PM"},
+        {"meal_name": "Dinner", "time": "07:00 PM"}
+    ],
+    4: [
+        {"meal_name": "Breakfast", "time": "08:00 AM"},
+        {"meal_name": "Mid-Morning Snack", "time": "11:00 AM"},
+        {"meal_name": "Lunch", "time": "01:00 PM"},
+        {"meal_name": "Dinner", "time": "07:00 PM"}
+    ]
+}
+
+
+def format_meal_image(meal_detail: dict, image_mode: str = "url") -> str:
+    """Return the image reference of a planned meal (cached image URL or inline data URL)."""
+    # Planned meals only flag whether an image exists; the bytes stay in the image store
+    rgb_bytes = meal_detail.get('rgb_image')
+    has_image = bool(rgb_bytes) if rgb_bytes is not None else bool(meal_detail.get('has_image', False))
+    if not has_image:
+        return ""
+
+    if image_mode == "inline":
+        if rgb_bytes is None:
+            rgb_bytes = read_dish_image(get_dish_catalog(), meal_detail.get('dish'))
+            if not rgb_bytes:
+                return ""
+        # Convert RGB image bytes to base64
+        image_base64 = base64.b64encode(rgb_bytes).decode('utf-8')
+        return f"data:image/jpeg;base64,{image_base64}"
+
+    image_url = f"/api/dish-images/{quote(str(meal_detail.get('dish', '')), safe='')}"
+    # Version the URL with the catalog so a reload never serves a stale cached image
+    catalog_version = meal_detail.get('catalog_version')
+    return f"{image_url}?v={catalog_version}" if catalog_version else image_url
+
+
+def format_meal_nutrients(meal_detail: dict) -> list:
+    """Format the macronutrients of a planned meal."""
+    return [
+        {
+            "name": "Fat",
+            "amount": round(meal_detail.get('total_fat', 0), 2),
+            "unit": "g"
+        },
+        {
+            "name": "Carbohydrates",
+            "amount": round(meal_detail.get('total_carb', 0), 2),
+            "unit": "g"
+        },
+        {
+            "name": "Protein",
+            "amount": round(meal_detail.get('total_protein', 0), 2),
+            "unit": "g"
+        }
+    ]
+
+
+def format_meal_description(meal_detail: dict) -> str:
+    """Create description from dish name and ingredients."""
+    dish_name = meal_detail.get('dish', 'Meal')
+    ingredients_str = ', '.join(meal_detail.get('ingredients_list', [])[:5])  # First 5 ingredients
+    return f"Ingredients {ingredients_str}" if ingredients_str else dish_name
+
+
+def format_meal_alternative(meal_detail: dict, image_mode: str = "url") -> dict:
+    """Format a lightweight summary of an alternative dish for a meal slot."""
+    return {
+        "dish_id": str(meal_detail.get('dish', '')),
+        "calories": round(meal_detail.get('total_calories', 0), 1),
+        "description": format_meal_description(meal_detail),
+        "image": format_meal_image(meal_detail, image_mode),
+        "nutrients": format_meal_nutrients(meal_detail),
+        "mass": round(meal_detail.get('total_mass', 0), 1)
+    }
+
+
+def format_meal_suggestion(meal_detail: dict, meal_template: dict, image_mode: str = "url") -> dict:
+    """Format one planned meal from the meal plan service for the frontend."""
+    return {
+        "meal_name": meal_template["meal_name"],
+        "calories": round(meal_detail.get('total_calories', 0), 1),
+        "time": meal_template["time"],
+        "description": format_meal_description(meal_detail),
+        "image": format_meal_image(meal_detail, image_mode),
+        "ingredients": meal_detail.get('ingredients_list', []),
+        "nutrients": format_meal_nutrients(meal_detail),
+        "mass": round(meal_detail.get('total_mass', 0), 1),
+        "alternatives": [
+            format_meal_alternative(alternative, image_mode)
+            for alternative in meal_detail.get('alternatives', [])
+        ]
+    }
+
+
+def format_meal_suggestions(meal_plan_data: list, meals_per_day: int, image_mode: str = "url") -> list:
+    """Format a day of planned meals, attaching meal names and times."""
+    # Get meal names and times
+    meal_info = MEAL_TEMPLATES.get(meals_per_day, MEAL_TEMPLATES[2])
+
+    suggestions = []
+    for i, meal_detail in enumerate(meal_plan_data):
+        # Get meal name and time
+        suggestions.append(format_meal_suggestion(meal_detail, get_meal_template(meal_info, i), image_mode))
+    return suggestions
+
+
+def get_meal_template(meal_info: list, index: int) -> dict:
+    """Return the name and time of a meal slot, falling back to a generic one."""
+    return meal_info[index] if index < len(meal_info) else {"meal_name": f"Meal {index+1}", "time": "12:00 PM"}
+
+
+def format_stream_event(event: str, data: dict, stream_format: str = "sse") -> str:
+    """Encode one meal plan stream event as a Server-Sent Event or an NDJSON line."""
+    if stream_format == "ndjson":
+        return json.dumps({"type": event, "data": data}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def ingredient_filter_key(ingredient_names) -> tuple:
+    """Normalize an ingredient filter list for use in cache keys."""
+    return tuple(sorted({name.strip().lower() for name in ingredient_names or []}))
+
+
+def plan_meals_cached(total_calories: float, options, target_macro_ratios=None) -> list:
+    """Plan one day through the meal plan cache, keyed on the calorie target and planner options."""
+    cache_key = meal_plan_cache.make_key(
+        total_calories, options.meals_per_day, options.calorie_distribution_ratios, target_macro_ratios,
+        options.num_alternatives,
+        ingredient_filter_key(options.exclude_ingredients), ingredient_filter_key(options.include_ingredients)
+    )
+    return meal_plan_cache.get_or_compute(
+        cache_key,
+        lambda: generate_meal_plan(
+            total_calories, options.meals_per_day, options.calorie_distribution_ratios, target_macro_ratios,
+            num_alternatives=options.num_alternatives,
+            exclude_ingredients=options.exclude_ingredients,
+            include_ingredients=options.include_ingredients
+        )
+    )
+
+
+def plan_and_format_meals(total_calories: float, options, target_macro_ratios=None) -> list:
+    """Plan one day through the meal plan cache and format it (inline images are read from the image store)."""
+    with time_stage("suggest_meals", "plan"):
+        meal_plan_data = plan_meals_cached(total_calories, options, target_macro_ratios)
+    with time_stage("suggest_meals", "format"):
+        return format_meal_suggestions(meal_plan_data, options.meals_per_day, options.image_mode)
+
+
 @app.post("/api/suggest-meals", response_model=List[MealSuggestion])
 async def suggest_meals(request: MealSuggestionRequest):
     """
@@ -289,92 +711,22 @@ async def suggest_meals(request: MealSuggestionRequest):
     Uses ML model to generate personalized meal plans.
     """
     try:
-        total_calories = request.total_calories
-        meals_per_day = request.meals_per_day
-        
-        # Meal templates for meal names and times
-        meal_templates = {
-            2: [
-                {"meal_name": "Breakfast", "time": "09:00 AM"},
-                {"meal_name": "Dinner", "time": "07:00 PM"}
-            ],
-            3: [
-                {"meal_name": "Breakfast", "time": "08:00 AM"},
-                {"meal_name": "Lunch", "time": "12:30 PM"},
-                {"meal_name": "Dinner", "time": "07:00 PM"}
-            ],
-            4: [
-                {"meal_name": "Breakfast", "time": "08:00 AM"},
-                {"meal_name": "Mid-Morning Snack", "time": "11:00 AM"},
-                {"meal_name": "Lunch", "time": "01:00 PM"},
-                {"meal_name": "Dinner", "time": "07:00 PM"}
-            ]
-        }
+        # Round the calorie target to the cache bucket (no-op unless bucketing is configured)
+        total_calories = meal_plan_cache.bucket_calories(request.total_calories)
         
         # Use provided ratios or defaults
-        calorie_distribution_ratios = request.calorie_distribution_ratios
         target_macro_ratios = request.target_macro_ratios
         
-        # Get meal plan from ML model
-        meal_plan_data = generate_meal_plan(total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios)
-        
-        # Get meal names and times
-        meal_info = meal_templates.get(meals_per_day, meal_templates[2])
-        
-        # Format meal plan for frontend
-        suggestions = []
-        for i, meal_detail in enumerate(meal_plan_data):
-            # Convert RGB image bytes to base64
-            rgb_bytes = meal_detail.get('rgb_image', b'')
-            if rgb_bytes:
-                image_base64 = base64.b64encode(rgb_bytes).decode('utf-8')
-                image_data_url = f"data:image/jpeg;base64,{image_base64}"
-            else:
-                image_data_url = ""
-            
-            # Get meal name and time
-            meal_template = meal_info[i] if i < len(meal_info) else {"meal_name": f"Meal {i+1}", "time": "12:00 PM"}
-            
-            # Format ingredients list
-            ingredients_list = meal_detail.get('ingredients_list', [])
-            
-            # Format nutrients
-            nutrients = [
-                {
-                    "name": "Fat",
-                    "amount": round(meal_detail.get('total_fat', 0), 2),
-                    "unit": "g"
-                },
-                {
-                    "name": "Carbohydrates",
-                    "amount": round(meal_detail.get('total_carb', 0), 2),
-                    "unit": "g"
-                },
-                {
-                    "name": "Protein",
-                    "amount": round(meal_detail.get('total_protein', 0), 2),
-                    "unit": "g"
-                }
-            ]
-            
-            # Create description from dish name and ingredients
-            dish_name = meal_detail.get('dish', 'Meal')
-            ingredients_str = ', '.join(ingredients_list[:5])  # First 5 ingredients
-            description = f"Ingredients {ingredients_str}" if ingredients_str else dish_name
-            
-            suggestions.append({
-                "meal_name": meal_template["meal_name"],
-                "calories": round(meal_detail.get('total_calories', 0), 1),
-                "time": meal_template["time"],
-                "description": description,
-                "image": image_data_url,
-                "ingredients": ingredients_list,
-                "nutrients": nutrients,
-                "mass": round(meal_detail.get('total_mass', 0), 1)
-            })
-        
-        return suggestions
+        # Get meal plan from ML model, reusing the plan of an identical earlier request, and format it
+        # for the frontend (in a worker thread: a cold catalog load, a cache miss or reading inline
+        # images would block the event loop)
+        return await run_in_threadpool(plan_and_format_meals, total_calories, request, target_macro_ratios)
         
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot generate meal plan: {str(e)}"
+        )
     except Exception as e:
         import traceback
         error_detail = f"Error generating meal plan: {str(e)}"
@@ -386,6 +738,234 @@ async def suggest_meals(request: MealSuggestionRequest):
         )
 
 
+@app.post("/api/plan-from-profile", response_model=ProfileMealPlanResponse)
+async def plan_from_profile(request: ProfileMealPlanRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Predict nutrition needs for a user profile and plan a day of meals in one call.
+    The predicted calories and macro grams become the planner's calorie target and
+    target_macro_ratios; with save=true the prediction is stored like /predict-and-save.
+    """
+    result = await run_in_threadpool(predict_nutrition, request.profile)
+    target_macro_ratios = macro_ratios_from_grams(
+        result["protein_g_per_day"], result["carbs_g_per_day"], result["fat_g_per_day"]
+    )
+
+    try:
+        total_calories = meal_plan_cache.bucket_calories(result["daily_kcal_need"])
+        if total_calories <= 0:
+            raise ValueError("Predicted daily calorie need must be greater than 0")
+        meals = await run_in_threadpool(plan_and_format_meals, total_calories, request, target_macro_ratios)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot generate meal plan: {str(e)}"
+        )
+
+    saved = await save_prediction(db, request.profile, result) if request.save else {}
+
+    return {
+        **result,
+        "target_macro_ratios": target_macro_ratios or {},
+        "meals": meals,
+        **saved,
+    }
+
+
+@app.post("/api/suggest-meals/stream")
+async def suggest_meals_stream(
+    request: MealSuggestionRequest,
+    stream_format: Literal["sse", "ndjson"] = Query(default="sse", alias="format")
+):
+    """
+    Suggest meals like /api/suggest-meals, streaming each meal as soon as it is planned.
+
+    Sends one `meal` event per slot followed by a `summary` event with the daily totals,
+    as Server-Sent Events (default) or NDJSON (`?format=ndjson`). Streamed plans bypass
+    the meal plan cache.
+    """
+    meals_per_day = request.meals_per_day
+    meal_info = MEAL_TEMPLATES.get(meals_per_day, MEAL_TEMPLATES[2])
+    events = iter_meal_plan(
+        request.total_calories, meals_per_day,
+        request.calorie_distribution_ratios, request.target_macro_ratios,
+        num_alternatives=request.num_alternatives,
+        exclude_ingredients=request.exclude_ingredients,
+        include_ingredients=request.include_ingredients
+    )
+
+    try:
+        # Plan the first meal before responding so invalid requests still get a proper status code
+        first_event = await run_in_threadpool(next, events)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot generate meal plan: {str(e)}"
+        )
+    except Exception as e:
+        error_detail = f"Error generating meal plan: {str(e)}"
+        print(f"Exception in suggest_meals_stream: {error_detail}")
+        raise HTTPException(
+            status_code=500,
+            detail=error_detail
+        )
+
+    def stream_events():
+        # Runs in the threadpool: Starlette iterates sync generators off the event loop
+        event, data = first_event
+        meal_index = 0
+        try:
+            while True:
+                if event == "meal":
+                    data = format_meal_suggestion(data, get_meal_template(meal_info, meal_index), request.image_mode)
+                    meal_index += 1
+                yield format_stream_event(event, data, stream_format)
+                event, data = next(events)
+        except StopIteration:
+            return
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            print(f"Exception in suggest_meals_stream: {str(e)}")
+            yield format_stream_event("error", {"detail": f"Error generating meal plan: {str(e)}"}, stream_format)
+
+    media_type = "application/x-ndjson" if stream_format == "ndjson" else "text/event-stream"
+    return StreamingResponse(
+        stream_events(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def plan_and_format_week(request) -> list:
+    """Plan the days of a weekly request and format them (inline images are read from the image store)."""
+    weekly_plan = generate_weekly_meal_plan(
+        request.total_calories,
+        request.meals_per_day,
+        num_days=request.num_days,
+        calorie_distribution_ratios=request.calorie_distribution_ratios,
+        target_macro_ratios=request.target_macro_ratios,
+        dish_repeat_window=request.dish_repeat_window,
+        key_ingredients=request.key_ingredients,
+        ingredient_repeat_window=request.ingredient_repeat_window,
+        num_alternatives=request.num_alternatives,
+        exclude_ingredients=request.exclude_ingredients,
+        include_ingredients=request.include_ingredients,
+    )
+    return [
+        {"day": day + 1, "meals": format_meal_suggestions(day_plan, request.meals_per_day, request.image_mode)}
+        for day, day_plan in enumerate(weekly_plan)
+    ]
+
+
+@app.post("/api/suggest-meal-plan/week", response_model=List[DailyMealPlan])
+async def suggest_meal_plan_week(request: WeeklyMealPlanRequest):
+    """
+    Suggest meals for several days in one call.
+    Days are planned together over the shared dish catalog so that dishes
+    (and optionally key ingredients) do not repeat within the requested windows.
+    """
+    try:
+        # Planned and formatted in a worker thread, off the event loop shared with the async DB sessions
+        return await run_in_threadpool(plan_and_format_week, request)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot generate weekly meal plan: {str(e)}"
+        )
+    except Exception as e:
+        import traceback
+        error_detail = f"Error generating weekly meal plan: {str(e)}"
+        print(f"Exception in suggest_meal_plan_week: {error_detail}")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500,
+            detail=error_detail
+        )
+
+
+@app.get("/api/dish-images/{dish_id}")
+def get_dish_image(dish_id: str, request: Request):
+    """
+    Serve the pre-encoded thumbnail of a dish.
+    Thumbnails never change for a given catalog, so they carry a strong ETag
+    and long-lived caching headers.
+    A plain def, so FastAPI runs the catalog load and thumbnail lookup in its threadpool.
+    """
+    try:
+        thumbnail = get_dish_thumbnail(get_dish_catalog(), dish_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=f"Dish catalog not available: {str(e)}")
+
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail=f"No image found for dish {dish_id}")
+
+    headers = {
+        "ETag": thumbnail["etag"],
+        "Cache-Control": DISH_IMAGE_CACHE_CONTROL,
+    }
+
+    # Let clients revalidate without downloading the image again
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or thumbnail["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=thumbnail["data"], media_type="image/jpeg", headers=headers)
+
+
+@app.get("/api/meal-plan-cache/stats")
+async def meal_plan_cache_stats():
+    """Hit/miss counters and size of the meal plan cache"""
+    return meal_plan_cache.stats()
+
+
+@app.get("/api/history-cache/stats")
+async def history_cache_stats():
+    """Hit/miss counters, size and memory of the history cache"""
+    return history_cache.stats()
+
+
+@app.get("/api/prediction-writer/stats")
+async def prediction_writer_stats():
+    """Queue depth and flush counters of the write-behind prediction writer"""
+    return prediction_writer.stats()
+
+
+@app.get("/api/nutrition-model")
+async def nutrition_model_status():
+    """Source, load time and resident size of the loaded nutrition model"""
+    return get_nutrition_model_status()
+
+
+@app.get("/api/catalog")
+async def catalog_status():
+    """Version and size of the loaded dish catalog"""
+    return get_catalog_status()
+
+
+@app.post("/api/admin/reload-catalog")
+async def reload_catalog(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Rebuild the dish catalog, its indexes and thumbnails, then swap it in.
+    The rebuild runs in a worker thread; requests keep using the current
+    catalog until the new one is complete. Requires X-Admin-Token (disabled
+    when ADMIN_TOKEN is not set).
+    """
+    require_admin(x_admin_token)
+    try:
+        catalog = await run_in_threadpool(reload_dish_catalog)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=f"Dish catalog not available: {str(e)}")
+
+    return {"version": catalog["version"], "dishes": len(catalog["dish_ids"])}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Stage latency histograms, request latencies and in-flight gauges in the Prometheus text format"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
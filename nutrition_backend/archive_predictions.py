@@ -0,0 +1,29 @@
+import argparse
+from datetime import datetime, timedelta
+
+from db import SessionLocal
+from services.prediction_archive import (
+    PREDICTION_ARCHIVE_BATCH_SIZE, PREDICTION_ARCHIVE_PATH, PREDICTION_RETENTION_DAYS, archive_predictions,
+    reindex_archive
+)
+
+# Retention job: move predictions older than the retention age into monthly Parquet files
+# (run it daily, e.g. from cron)
+parser = argparse.ArgumentParser(description="Archive old predictions to monthly Parquet files")
+parser.add_argument("--days", type=int, default=PREDICTION_RETENTION_DAYS, help="Keep this many days in the table")
+parser.add_argument("--archive-path", default=PREDICTION_ARCHIVE_PATH, help="Directory of the month files")
+parser.add_argument("--batch-size", type=int, default=PREDICTION_ARCHIVE_BATCH_SIZE, help="Rows per delete transaction")
+parser.add_argument("--reindex", action="store_true",
+                    help="Only rebuild archived_user_months from the existing month files")
+args = parser.parse_args()
+
+if args.reindex:
+    indexed = reindex_archive(SessionLocal, args.archive_path)
+    print(f"✅ Indexed the users of {indexed} archived months in {args.archive_path}/")
+    raise SystemExit
+
+older_than = datetime.utcnow() - timedelta(days=args.days)
+archived = archive_predictions(SessionLocal, older_than, args.archive_path, args.batch_size)
+for month, count in archived.items():
+    print(f"✅ {month}: {count} predictions archived")
+print(f"✅ Archived {sum(archived.values())} predictions created before {older_than:%Y-%m-%d} to {args.archive_path}/")
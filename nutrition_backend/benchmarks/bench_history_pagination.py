@@ -0,0 +1,102 @@
+"""
+Benchmark: deep /history pages, OFFSET vs. keyset pagination.
+
+Fills a SQLite file with one heavy user (plus other users' rows) and times the
+first page and a page `--depth` rows back, with LIMIT/OFFSET and with the
+(created_at, id) keyset cursor /history/{user_id} uses.
+
+Run from the nutrition_backend directory:
+    python benchmarks/bench_history_pagination.py --rows 200000 --depth 150000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, desc, insert, or_, select
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_models import Prediction
+from db import Base
+
+
+def fill(engine, rows: int, other_users: int):
+    """Insert `rows` predictions for user_heavy and as many spread over other users."""
+    base = datetime(2025, 1, 1)
+    with engine.begin() as connection:
+        for start in range(0, rows, 10000):
+            batch = []
+            for i in range(start, min(start + 10000, rows)):
+                created_at = base + timedelta(seconds=i)
+                batch.append({"user_id": "user_heavy", "created_at": created_at, "daily_kcal_need": 2000})
+                batch.append({"user_id": f"user_{i % other_users}", "created_at": created_at, "daily_kcal_need": 2000})
+            connection.execute(insert(Prediction), batch)
+
+
+def history_query(page_size: int):
+    return (
+        select(Prediction)
+        .where(Prediction.user_id == "user_heavy")
+        .order_by(desc(Prediction.created_at), Prediction.id)
+        .limit(page_size)
+    )
+
+
+def time_call(func, repeat: int) -> float:
+    """Return the median wall time of func() in milliseconds."""
+    func()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="Predictions of the heavy user")
+    parser.add_argument("--depth", type=int, default=150000, help="Rows skipped before the deep page")
+    parser.add_argument("--page-size", type=int, default=20, help="Rows per page")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per measurement (median is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'history.db')}")
+        Base.metadata.create_all(bind=engine)
+        fill(engine, args.rows, other_users=1000)
+
+        with Session(engine) as db:
+            # Keyset position of the deep page: the last row before it
+            anchor = db.scalars(history_query(1).offset(args.depth - 1)).one()
+
+            def offset_page(offset):
+                return lambda: db.scalars(history_query(args.page_size).offset(offset)).all()
+
+            def keyset_page():
+                return db.scalars(history_query(args.page_size).where(
+                    Prediction.created_at <= anchor.created_at,
+                    or_(Prediction.created_at < anchor.created_at, Prediction.id > anchor.id)
+                )).all()
+
+            assert [row.id for row in keyset_page()] == [row.id for row in offset_page(args.depth)()]
+
+            first_ms = time_call(offset_page(0), args.repeat)
+            offset_ms = time_call(offset_page(args.depth), args.repeat)
+            keyset_ms = time_call(keyset_page, args.repeat)
+
+        print(f"{args.rows} rows for one user, page size {args.page_size}, deep page after {args.depth} rows")
+        print(f"  First page:              {first_ms:8.2f} ms")
+        print(f"  Deep page (OFFSET):      {offset_ms:8.2f} ms")
+        print(f"  Deep page (keyset):      {keyset_ms:8.2f} ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: time to first meal of a streamed meal plan vs. the full plan.
+
+Builds a synthetic dish catalog, then times how long iter_meal_plan takes to
+yield its first meal compared with generate_meal_plan returning the whole day.
+
+Run from the nutrition_backend directory:
+    python benchmarks/bench_meal_plan_stream.py --dishes 50000 --meals 4
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.dish_catalog import prepare_dish_catalog
+from services.meal_plan_predictor import generate_meal_plan, iter_meal_plan
+
+
+def build_synthetic_catalog(num_dishes: int, seed: int = 0) -> dict:
+    """Build a catalog of random dishes, each with two ingredients and no images."""
+    rng = np.random.default_rng(seed)
+    dish_ids = [f"dish_{i}" for i in range(num_dishes)]
+    fat = rng.uniform(1, 40, num_dishes)
+    carb = rng.uniform(5, 100, num_dishes)
+    protein = rng.uniform(2, 60, num_dishes)
+    dishes = pd.DataFrame({
+        "dish_id": dish_ids,
+        "total_calories": fat * 9 + carb * 4 + protein * 4,
+        "total_mass": rng.uniform(100, 500, num_dishes),
+        "total_fat": fat,
+        "total_carb": carb,
+        "total_protein": protein,
+    })
+    image_df = pd.DataFrame({"dish": dish_ids, "rgb_image": [b""] * num_dishes})
+    ingredient_names = [f"ingredient_{i}" for i in range(200)]
+    dish_ingredients = pd.DataFrame({
+        "dish_id": dish_ids * 2,
+        "ingr_name": list(rng.choice(ingredient_names, num_dishes * 2)),
+    })
+    ingredients = pd.DataFrame({"ingr_name": ingredient_names})
+    return prepare_dish_catalog(image_df, dishes, dish_ingredients, ingredients, version="benchmark")
+
+
+def time_call(func, repeat: int) -> float:
+    """Return the median wall time of func() in milliseconds, with planner output silenced."""
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dishes", type=int, default=50000, help="Number of synthetic dishes")
+    parser.add_argument("--meals", type=int, default=4, help="Meals per day")
+    parser.add_argument("--alternatives", type=int, default=3, help="Alternatives per meal")
+    parser.add_argument("--calories", type=float, default=2200.0, help="Daily calorie target")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported)")
+    args = parser.parse_args()
+
+    # Keep the per-meal planner logging out of the report
+    logging.disable(logging.INFO)
+    catalog = build_synthetic_catalog(args.dishes)
+    plan_args = (args.calories, args.meals)
+    plan_kwargs = {"num_alternatives": args.alternatives}
+
+    with patch('services.meal_plan_predictor.get_dish_catalog', return_value=catalog):
+        first_meal_ms = time_call(lambda: next(iter_meal_plan(*plan_args, **plan_kwargs)), args.repeat)
+        stream_ms = time_call(lambda: list(iter_meal_plan(*plan_args, **plan_kwargs)), args.repeat)
+        full_plan_ms = time_call(lambda: generate_meal_plan(*plan_args, **plan_kwargs), args.repeat)
+
+    print(f"Catalog: {args.dishes} dishes, {args.meals} meals, {args.alternatives} alternatives")
+    print(f"  Time to first meal (stream): {first_meal_ms:8.2f} ms")
+    print(f"  Full stream:                 {stream_ms:8.2f} ms")
+    print(f"  Full plan (generate):        {full_plan_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark: nutrition inference, full pipeline vs. fast path.
+
+Compares `model.predict(pd.DataFrame([profile]))` (what /predict used to do)
+with FastNutritionPredictor, which encodes the profile straight into a NumPy
+row and evaluates the compiled forests, for one row and for a batch.
+
+Uses artifacts/nutrition_model.pkl when it exists, otherwise fits a model with
+the train.py configuration (400 trees per target, n_jobs=-1) on synthetic data.
+
+Run from the nutrition_backend directory:
+    python benchmarks/bench_nutrition_inference.py --repeat 200
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.nutrition_model import FastNutritionPredictor
+
+SAMPLE_PROFILE = {
+    "age": 24,
+    "gender": "Female",
+    "height_cm": 158,
+    "weight_kg": 55,
+    "goal": "Maintain",
+    "has_diabetes": 0,
+    "has_hypertension": 1,
+    "steps_per_day": 8500,
+    "active_minutes": 55,
+    "calories_burned_active": 380,
+    "resting_heart_rate": 70,
+    "avg_heart_rate": 95,
+    "stress_score": 50,
+}
+
+
+def build_synthetic_model(n_estimators: int, num_rows: int = 1000, seed: int = 42):
+    """Fit a pipeline laid out like train.py on random profiles."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.multioutput import MultiOutputRegressor
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        "age": rng.integers(18, 80, num_rows),
+        "gender": rng.choice(["Male", "Female"], num_rows),
+        "height_cm": rng.uniform(145, 200, num_rows),
+        "weight_kg": rng.uniform(40, 120, num_rows),
+        "goal": rng.choice(["Lose", "Maintain", "Gain"], num_rows),
+        "has_diabetes": rng.integers(0, 2, num_rows),
+        "has_hypertension": rng.integers(0, 2, num_rows),
+        "steps_per_day": rng.integers(1000, 20000, num_rows),
+        "active_minutes": rng.integers(0, 120, num_rows),
+        "calories_burned_active": rng.uniform(50, 900, num_rows),
+        "resting_heart_rate": rng.uniform(50, 90, num_rows),
+        "avg_heart_rate": rng.uniform(60, 130, num_rows),
+        "stress_score": rng.uniform(0, 100, num_rows),
+    })
+    kcal = 10 * X["weight_kg"] + 6.25 * X["height_cm"] - 5 * X["age"] + X["calories_burned_active"]
+    y = pd.DataFrame({
+        "daily_kcal_need": kcal + rng.normal(0, 50, num_rows),
+        "protein_g_per_day": kcal * 0.25 / 4,
+        "carbs_g_per_day": kcal * 0.5 / 4,
+        "fat_g_per_day": kcal * 0.25 / 9,
+    })
+
+    numeric_features = [column for column in X.columns if column not in ("gender", "goal")]
+    preprocess = ColumnTransformer(transformers=[
+        ("num", StandardScaler(), numeric_features),
+        ("cat", OneHotEncoder(handle_unknown="ignore"), ["gender", "goal"]),
+    ])
+    model = Pipeline(steps=[
+        ("preprocess", preprocess),
+        ("regressor", MultiOutputRegressor(RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=-1))),
+    ])
+    return model.fit(X, y)
+
+
+def time_call(func, repeat: int) -> tuple:
+    """Return the median and p95 wall time of func() in milliseconds."""
+    func()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="artifacts/nutrition_model.pkl", help="Trained model path")
+    parser.add_argument("--trees", type=int, default=400, help="Trees per target for the synthetic model")
+    parser.add_argument("--n-jobs", type=int, default=1, help="Serving-time n_jobs of the fast path")
+    parser.add_argument("--repeat", type=int, default=100, help="Timed predictions per path")
+    parser.add_argument("--batch", type=int, default=256, help="Rows of the batch comparison")
+    args = parser.parse_args()
+
+    if os.path.exists(args.model):
+        model = joblib.load(args.model)
+        print(f"Model: {args.model}")
+    else:
+        print(f"Model: synthetic ({args.trees} trees per target, {args.model} not found)")
+        model = build_synthetic_model(args.trees)
+
+    # The fast predictor changes n_jobs on its forests, so give it its own copy
+    predictor = FastNutritionPredictor(copy.deepcopy(model), n_jobs=args.n_jobs)
+    np.testing.assert_allclose(predictor.predict(SAMPLE_PROFILE), model.predict(pd.DataFrame([SAMPLE_PROFILE]))[0])
+
+    pipeline_ms = time_call(lambda: model.predict(pd.DataFrame([SAMPLE_PROFILE])), args.repeat)
+    fast_ms = time_call(lambda: predictor.predict(SAMPLE_PROFILE), args.repeat)
+
+    print(f"  Pipeline (DataFrame, trained n_jobs): median {pipeline_ms[0]:8.2f} ms | p95 {pipeline_ms[1]:8.2f} ms")
+    print(f"  Fast path (n_jobs={args.n_jobs}):              median {fast_ms[0]:8.2f} ms | p95 {fast_ms[1]:8.2f} ms")
+    print(f"  Speedup: {pipeline_ms[0] / fast_ms[0]:.1f}x")
+
+    # Batch of profiles in one call (compiled forests evaluate all targets in one pass)
+    profiles = [{**SAMPLE_PROFILE, "age": 18 + i % 60, "weight_kg": 45 + i % 70} for i in range(args.batch)]
+    batch_repeat = max(1, args.repeat // 10)
+    pipeline_ms = time_call(lambda: model.predict(pd.DataFrame(profiles)), batch_repeat)
+    fast_ms = time_call(lambda: predictor.predict_batch(profiles), batch_repeat)
+
+    print(f"Batch of {args.batch} rows:")
+    print(f"  Pipeline (DataFrame, trained n_jobs): median {pipeline_ms[0]:8.2f} ms | p95 {pipeline_ms[1]:8.2f} ms")
+    print(f"  Fast path (n_jobs={args.n_jobs}):              median {fast_ms[0]:8.2f} ms | p95 {fast_ms[1]:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: streaming export of the predictions table.
+
+Fills a SQLite file with `--rows` predictions and exports them in every format
+through export_predictions, reporting rows per second and the peak Python
+memory (tracemalloc) of the export, which stays at about one batch.
+
+Run from the nutrition_backend directory:
+    python benchmarks/bench_prediction_export.py --rows 500000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_models import Prediction
+from db import Base
+from services.prediction_export import EXPORT_MEDIA_TYPES, export_predictions
+
+SAMPLE_ROW = {
+    "age": 24, "gender": "Female", "height_cm": 158, "weight_kg": 55, "goal": "Maintain",
+    "has_diabetes": 0, "has_hypertension": 1, "steps_per_day": 8500, "active_minutes": 55,
+    "calories_burned_active": 380, "resting_heart_rate": 70, "avg_heart_rate": 95, "stress_score": 50,
+    "daily_kcal_need": 2000, "protein_g_per_day": 150.0, "carbs_g_per_day": 250.0, "fat_g_per_day": 65.0,
+}
+
+
+def fill(engine, rows: int):
+    base = datetime(2025, 1, 1)
+    with engine.begin() as connection:
+        for start in range(0, rows, 20000):
+            connection.execute(insert(Prediction), [
+                {**SAMPLE_ROW, "user_id": f"user_{i % 5000:06d}", "created_at": base + timedelta(seconds=i)}
+                for i in range(start, min(start + 20000, rows))
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000, help="Predictions in the table")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per cursor fetch")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'export.db')}")
+        Base.metadata.create_all(bind=engine)
+        fill(engine, args.rows)
+
+        print(f"{args.rows} predictions, batch size {args.batch_size}")
+        for export_format in EXPORT_MEDIA_TYPES:
+            with Session(engine) as db:
+                tracemalloc.start()
+                start = time.perf_counter()
+                size = sum(len(chunk) for chunk in export_predictions(db, export_format, batch_size=args.batch_size))
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            print(f"  {export_format:<8} {args.rows / elapsed:10.0f} rows/s | {size / 2**20:8.1f} MB | peak memory {peak / 2**20:6.1f} MB")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
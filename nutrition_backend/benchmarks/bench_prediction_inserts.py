@@ -0,0 +1,123 @@
+"""
+Benchmark: /predict-and-save user id allocation under concurrent writers.
+
+Compares the old scheme (SELECT max(id) + 1, then INSERT with that user id)
+(threads on the blocking engine) with the current one (one INSERT ...
+RETURNING on the async engine, the database trigger derives user_id from the
+new row id, as many concurrent tasks as threads), against a SQLite file or the
+database given with --url (sync driver URL; the async driver is derived).
+A third run queues the same saves on the write-behind PredictionWriter; its
+rate counts until every row is flushed.
+
+Run from the nutrition_backend directory:
+    python benchmarks/bench_prediction_inserts.py --threads 8 --rows 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import save_prediction
+from database_models import Prediction, format_user_id
+from db import Base, to_async_url
+from services.prediction_writer import PredictionWriter
+from models import UserInput
+
+SAMPLE_PROFILE = UserInput(
+    age=24, gender="Female", height_cm=158, weight_kg=55, goal="Maintain",
+    has_diabetes=0, has_hypertension=1, steps_per_day=8500, active_minutes=55,
+    calories_burned_active=380, resting_heart_rate=70, avg_heart_rate=95, stress_score=50,
+)
+SAMPLE_RESULT = {"daily_kcal_need": 2000, "protein_g_per_day": 150.0, "carbs_g_per_day": 250.0, "fat_g_per_day": 65.0}
+
+
+def save_prediction_max_id(session_factory) -> dict:
+    """The previous save path: two round trips and a max(id) read that races with other writers."""
+    db = session_factory()
+    try:
+        last_id = db.query(func.max(Prediction.id)).scalar()
+        row = Prediction(user_id=format_user_id((last_id or 0) + 1), **SAMPLE_PROFILE.model_dump(), **SAMPLE_RESULT)
+        db.add(row)
+        db.commit()
+        db.refresh(row)
+        return {"saved_id": row.id, "user_id": row.user_id}
+    finally:
+        db.close()
+
+
+def summarize(saved: list, elapsed: float) -> tuple:
+    """Return (rows per second, duplicate user ids)."""
+    user_ids = [row["user_id"] for row in saved]
+    return len(saved) / elapsed, len(user_ids) - len(set(user_ids))
+
+
+def run_threads(save, rows: int, threads: int) -> tuple:
+    """Save `rows` predictions from `threads` workers."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        saved = list(pool.map(lambda _: save(), range(rows)))
+    return summarize(saved, time.perf_counter() - start)
+
+
+async def run_tasks(async_url: str, rows: int, concurrency: int, write_behind: bool = False) -> tuple:
+    """Save `rows` predictions through the API's async save path, `concurrency` at a time."""
+    connect_args = {"timeout": 60} if async_url.startswith("sqlite") else {}
+    engine = create_async_engine(async_url, connect_args=connect_args, pool_size=concurrency)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    limit = asyncio.Semaphore(concurrency)
+    writer = PredictionWriter()
+
+    async def save_one():
+        async with limit, session_factory() as db:
+            return await save_prediction(db, SAMPLE_PROFILE, SAMPLE_RESULT)
+
+    start = time.perf_counter()
+    if write_behind:
+        writer.start(session_factory)
+    with patch('app.prediction_writer', writer):
+        saved = await asyncio.gather(*(save_one() for _ in range(rows)))
+    await writer.stop()
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return summarize(saved, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Database URL (default: a temporary SQLite file)")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent writers")
+    parser.add_argument("--rows", type=int, default=2000, help="Predictions saved per scheme")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url or f"sqlite:///{os.path.join(tmp, 'predictions.db')}"
+        connect_args = {"timeout": 60} if url.startswith("sqlite") else {}
+        engine = create_engine(url, connect_args=connect_args, pool_size=args.threads)
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+
+        print(f"Database: {engine.dialect.name}, {args.threads} writers, {args.rows} rows per scheme")
+        legacy = run_threads(lambda: save_prediction_max_id(session_factory), args.rows, args.threads)
+        current = asyncio.run(run_tasks(to_async_url(url), args.rows, args.threads))
+        write_behind = asyncio.run(run_tasks(to_async_url(url), args.rows, args.threads, write_behind=True))
+
+        print(f"  SELECT max(id) + INSERT:      {legacy[0]:8.0f} rows/s | duplicate user ids: {legacy[1]}")
+        print(f"  INSERT ... RETURNING (async): {current[0]:8.0f} rows/s | duplicate user ids: {current[1]}")
+        print(f"  Write-behind queue:           {write_behind[0]:8.0f} rows/s | duplicate user ids: {write_behind[1]}")
+        print(f"  Speedup: {current[0] / legacy[0]:.2f}x (INSERT ... RETURNING), {write_behind[0] / legacy[0]:.2f}x (write-behind)")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import joblib
+
+from services.nutrition_model import FastNutritionPredictor, NUTRITION_MODEL_COMPILED_PATH, NUTRITION_MODEL_PATH
+
+# Export an existing trained pipeline to the flat-array format the API memory-maps
+model = joblib.load(NUTRITION_MODEL_PATH)
+FastNutritionPredictor(model, n_jobs=1).save(NUTRITION_MODEL_COMPILED_PATH)
+print(f"✅ Compiled {NUTRITION_MODEL_PATH} to {NUTRITION_MODEL_COMPILED_PATH}/")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import JSON, Column, Integer, String, Float, DateTime, Index, UniqueConstraint, event, text
 from datetime import datetime
 from db import Base
 
@@ -31,3 +31,167 @@ class Prediction(Base):
     fat_g_per_day = Column(Float)
 
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # /history/{user_id}: one index range per page, already in (created_at DESC, id) order
+        Index("ix_predictions_user_id_created_at_id", user_id, created_at.desc(), id),
+        # SQLite: track issued ids in sqlite_sequence so reserve_prediction_ids can hand out blocks
+        {"sqlite_autoincrement": True},
+    )
+
+
+
+def format_user_id(prediction_id: int) -> str:
+    """User id the database assigns to an automatically numbered prediction row."""
+    return f"user_{prediction_id:06d}"
+
+
+# Rows inserted without a user_id get format_user_id(id) from the database itself, so the
+# id is allocated by the table's own sequence inside the INSERT (no SELECT max(id) race).
+# Postgres sets it in a BEFORE trigger (visible to RETURNING); SQLite cannot change NEW
+# rows, so it updates the row AFTER the insert and RETURNING still reports NULL.
+USER_ID_TRIGGER_DDL = {
+    "postgresql": [
+        """
+        CREATE OR REPLACE FUNCTION predictions_assign_user_id() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.user_id IS NULL THEN
+                NEW.user_id := 'user_' || lpad(NEW.id::text, greatest(6, length(NEW.id::text)), '0');
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS predictions_assign_user_id ON predictions",
+        """
+        CREATE TRIGGER predictions_assign_user_id BEFORE INSERT ON predictions
+        FOR EACH ROW EXECUTE FUNCTION predictions_assign_user_id()
+        """,
+    ],
+    "sqlite": [
+        """
+        CREATE TRIGGER IF NOT EXISTS predictions_assign_user_id AFTER INSERT ON predictions
+        WHEN NEW.user_id IS NULL
+        BEGIN
+            UPDATE predictions SET user_id = printf('user_%06d', NEW.id) WHERE id = NEW.id;
+        END
+        """,
+    ],
+}
+
+
+def install_user_id_trigger(connection) -> None:
+    """Create (or replace) the trigger that assigns user ids; safe to run on existing tables."""
+    for statement in USER_ID_TRIGGER_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+@event.listens_for(Prediction.__table__, "after_create")
+def _install_user_id_trigger(target, connection, **kw):
+    install_user_id_trigger(connection)
+
+
+# Blocks of ids for rows inserted later with an explicit id (see reserve_prediction_ids)
+RESERVE_IDS_POSTGRES = "SELECT nextval(pg_get_serial_sequence('predictions', 'id')) FROM generate_series(1, :count)"
+RESERVE_IDS_SQLITE = [
+    # First reservation before the table issued any id through sqlite_sequence: start after max(id)
+    """
+    INSERT INTO sqlite_sequence (name, seq)
+    SELECT 'predictions', coalesce((SELECT max(id) FROM predictions), 0)
+    WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'predictions')
+    """,
+    "UPDATE sqlite_sequence SET seq = seq + :count WHERE name = 'predictions' RETURNING seq",
+]
+
+
+def predictions_has_autoincrement(connection) -> bool:
+    """
+    Whether the predictions table takes its ids from sqlite_sequence (always true outside SQLite).
+
+    SQLite tables created before {"sqlite_autoincrement": True} assign max(id) + 1 and ignore
+    sqlite_sequence, so they would reuse ids reserved by reserve_prediction_ids.
+    """
+    if connection.dialect.name != "sqlite":
+        return True
+    sql = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'predictions'")
+    ).scalar_one_or_none()
+    return sql is None or "AUTOINCREMENT" in sql.upper()
+
+
+def check_prediction_id_sequence(connection) -> None:
+    """Refuse to reserve prediction ids on a SQLite predictions table without AUTOINCREMENT."""
+    if not predictions_has_autoincrement(connection):
+        raise RuntimeError(
+            "The predictions table was created without AUTOINCREMENT, so reserved ids could be "
+            "reused; run `python init_db.py` to migrate it"
+        )
+
+
+def migrate_predictions_autoincrement(connection) -> None:
+    """
+    Rebuild a SQLite predictions table created without AUTOINCREMENT, keeping every row and id.
+    Run inside a transaction; sqlite_sequence starts at the current max(id).
+    """
+    old_objects = connection.execute(text(
+        "SELECT type, name FROM sqlite_master "
+        "WHERE tbl_name = 'predictions' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    )).all()
+    # Index and trigger names are per database, so free them before creating the new table
+    for type_, name in old_objects:
+        connection.execute(text(f'DROP {type_.upper()} "{name}"'))
+    connection.execute(text("ALTER TABLE predictions RENAME TO predictions_without_autoincrement"))
+
+    Prediction.__table__.create(bind=connection)
+    columns = ", ".join(f'"{column.name}"' for column in Prediction.__table__.columns)
+    # Copy the rows as they are: the user id trigger must not fill in missing user ids
+    connection.execute(text("DROP TRIGGER predictions_assign_user_id"))
+    connection.execute(text(
+        f"INSERT INTO predictions ({columns}) SELECT {columns} FROM predictions_without_autoincrement"
+    ))
+    install_user_id_trigger(connection)
+    connection.execute(text("DROP TABLE predictions_without_autoincrement"))
+
+
+async def reserve_prediction_ids(session, count: int) -> list:
+    """
+    Reserve `count` ids from the predictions id sequence (the caller commits).
+    Rows inserted later with these ids never collide with ids the database assigns itself.
+    On SQLite this needs an AUTOINCREMENT table (see check_prediction_id_sequence).
+    """
+    if session.bind.dialect.name == "sqlite":
+        await session.execute(text(RESERVE_IDS_SQLITE[0]))
+        last_id = (await session.execute(text(RESERVE_IDS_SQLITE[1]), {"count": count})).scalar_one()
+        return list(range(last_id - count + 1, last_id + 1))
+    return list((await session.execute(text(RESERVE_IDS_POSTGRES), {"count": count})).scalars())
+
+
+class MealAnalysis(Base):
+    __tablename__ = "meal_analyses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "" for photos analyzed without a user_id
+    user_id = Column(String, nullable=False)
+    # sha256 of the uploaded image bytes
+    image_hash = Column(String(64), nullable=False, index=True)
+    model_version = Column(String, nullable=False)
+
+    ingredients = Column(JSON)
+    nutrients = Column(JSON)
+    calories_per_100g = Column(Float)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # One analysis per user and photo
+        UniqueConstraint("user_id", "image_hash", name="uq_meal_analyses_user_id_image_hash"),
+    )
+
+
+class ArchivedUserMonth(Base):
+    """Month of the prediction archive that holds rows of a user (kept by the retention job)."""
+    __tablename__ = "archived_user_months"
+
+    user_id = Column(String, primary_key=True)
+    # First day of the month, as in the archive file name
+    month = Column(DateTime, primary_key=True)
@@ -1,15 +1,97 @@
+import os
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-# CHANGE these:
-DB_USER = "postgres"
-DB_PASSWORD = "8771"
-DB_HOST = "localhost"
-DB_PORT = "5432"
-DB_NAME = "nutrition_db"
+# CHANGE these (or set the environment variables):
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "8771")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "nutrition_db")
+
+# DATABASE_URL overrides the settings above, e.g. sqlite:///./nutrition.db for local runs
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+
+# Connection pool of each engine (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Async drivers used by the API for each sync driver
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Same database as `url`, through the asyncio driver of its backend."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def pool_options(url: str) -> dict:
+    """Pool settings for an engine on `url` (in-memory SQLite keeps SQLAlchemy's single-connection pool)."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
 
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# ASYNC_DATABASE_URL defaults to DATABASE_URL with the asyncpg / aiosqlite driver
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
 
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_engine(DATABASE_URL, echo=False, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+# Created on first use, so scripts that only need the sync engine don't import the async driver
+_async_engine = None
+_async_session_factory = None
+
+
+def get_async_engine():
+    """The API's AsyncEngine (one per process)."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **pool_options(ASYNC_DATABASE_URL))
+    return _async_engine
+
+
+def get_async_session_factory() -> async_sessionmaker:
+    """Factory for AsyncSessions bound to the API's engine."""
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
+
+async def get_db():
+    """FastAPI dependency: one AsyncSession per request, closed after the response."""
+    async with get_async_session_factory()() as session:
+        yield session
+
+
+async def dispose_async_engine() -> None:
+    """Close the pooled async connections (called on shutdown)."""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_session_factory = None
@@ -0,0 +1,24 @@
+import argparse
+import sys
+from datetime import datetime
+
+from db import SessionLocal
+from services.prediction_export import EXPORT_MEDIA_TYPES, PREDICTION_EXPORT_BATCH_SIZE, export_predictions
+
+# Stream the predictions table to a file (or stdout) without loading it into memory
+parser = argparse.ArgumentParser(description="Export saved predictions as NDJSON, CSV or Parquet")
+parser.add_argument("--format", choices=list(EXPORT_MEDIA_TYPES), default="ndjson", help="Output format")
+parser.add_argument("--output", help="Output file (default: stdout)")
+parser.add_argument("--user-id", help="Only this user's predictions")
+parser.add_argument("--start", type=datetime.fromisoformat, help="Created at or after (ISO date/time)")
+parser.add_argument("--end", type=datetime.fromisoformat, help="Created before (ISO date/time)")
+parser.add_argument("--batch-size", type=int, default=PREDICTION_EXPORT_BATCH_SIZE, help="Rows per cursor fetch")
+args = parser.parse_args()
+
+output = open(args.output, "wb") if args.output else sys.stdout.buffer
+with SessionLocal() as db:
+    for chunk in export_predictions(db, args.format, args.user_id, args.start, args.end, args.batch_size):
+        output.write(chunk)
+if args.output:
+    output.close()
+    print(f"✅ Exported predictions to {args.output}", file=sys.stderr)
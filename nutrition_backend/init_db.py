@@ -2,4 +2,14 @@ from db import engine, Base
 import database_models  # Import to register the models
 
 Base.metadata.create_all(bind=engine)
+
+# Also (re)install the user id trigger and add new indexes on tables created before them
+with engine.begin() as connection:
+    # SQLite tables created before AUTOINCREMENT would reuse ids reserved by the write-behind queue
+    if not database_models.predictions_has_autoincrement(connection):
+        database_models.migrate_predictions_autoincrement(connection)
+        print("✅ Rebuilt the predictions table with AUTOINCREMENT ids")
+    database_models.install_user_id_trigger(connection)
+    for index in database_models.Prediction.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
 print("✅ Tables created successfully!")
@@ -1,22 +1,37 @@
 """
 Pydantic models package for the Nutrition & Meal Prediction API.
 """
-from .nutrition_models import UserInput
+from .nutrition_models import UserInput, TrendValue, HistoryTrendPeriod, HistoryTrendsResponse
 from .meal_models import (
+    MealPlanOptions,
     MealSuggestionRequest,
+    WeeklyMealPlanRequest,
+    ProfileMealPlanRequest,
     Nutrient,
     Ingredient,
     MealAnalysisResponse,
     MealNutrient,
+    MealAlternative,
     MealSuggestion,
+    DailyMealPlan,
+    ProfileMealPlanResponse,
 )
 
 __all__ = [
     "UserInput",
+    "TrendValue",
+    "HistoryTrendPeriod",
+    "HistoryTrendsResponse",
+    "MealPlanOptions",
     "MealSuggestionRequest",
+    "WeeklyMealPlanRequest",
+    "ProfileMealPlanRequest",
     "Nutrient",
     "Ingredient",
     "MealAnalysisResponse",
     "MealNutrient",
+    "MealAlternative",
     "MealSuggestion",
+    "DailyMealPlan",
+    "ProfileMealPlanResponse",
 ]
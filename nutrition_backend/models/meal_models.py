@@ -2,19 +2,36 @@
 Pydantic models for meal analysis and suggestion endpoints.
 """
 from pydantic import BaseModel, Field, field_validator, ValidationInfo
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
 
+from .nutrition_models import UserInput
 
-class MealSuggestionRequest(BaseModel):
-    total_calories: float = Field(gt=0, description="Total daily calories must be greater than 0")
+
+class MealPlanOptions(BaseModel):
+    """Planner options shared by every meal plan request."""
     meals_per_day: int = Field(gt=0, le=10, description="Number of meals per day must be between 1 and 10")
     calorie_distribution_ratios: Optional[List[float]] = Field(
         default=None,
         description="Optional list of calorie distribution ratios for each meal"
     )
-    target_macro_ratios: Optional[Dict[str, float]] = Field(
+    image_mode: Literal["url", "inline"] = Field(
+        default="url",
+        description="'url' returns a cacheable dish image URL, 'inline' embeds the image as a base64 data URL"
+    )
+    num_alternatives: int = Field(
+        default=0,
+        ge=0,
+        le=10,
+        description="Number of next-best dishes to return for each meal so the client can swap meals"
+    )
+    exclude_ingredients: Optional[List[str]] = Field(
         default=None,
-        description="Optional target macronutrient ratios"
+        description="Optional ingredient names (e.g. allergens) that suggested dishes must not contain; "
+                    "names missing from the dish catalog are rejected with a 400"
+    )
+    include_ingredients: Optional[List[str]] = Field(
+        default=None,
+        description="Optional ingredient names; suggested dishes must contain at least one of them"
     )
     
     @field_validator('calorie_distribution_ratios')
@@ -28,7 +45,15 @@ class MealSuggestionRequest(BaseModel):
             if meals_per_day and len(v) != meals_per_day:
                 raise ValueError(f"Number of calorie distribution ratios ({len(v)}) must match meals_per_day ({meals_per_day})")
         return v
-    
+
+
+class MealSuggestionRequest(MealPlanOptions):
+    total_calories: float = Field(gt=0, description="Total daily calories must be greater than 0")
+    target_macro_ratios: Optional[Dict[str, float]] = Field(
+        default=None,
+        description="Optional target macronutrient ratios"
+    )
+
     @field_validator('target_macro_ratios')
     @classmethod
     def validate_macro_ratios(cls, v):
@@ -42,6 +67,30 @@ class MealSuggestionRequest(BaseModel):
         return v
 
 
+
+class WeeklyMealPlanRequest(MealSuggestionRequest):
+    num_days: int = Field(default=7, gt=0, le=31, description="Number of days to plan must be between 1 and 31")
+    dish_repeat_window: int = Field(
+        default=2,
+        ge=0,
+        description="Number of following days on which a dish cannot be repeated"
+    )
+    key_ingredients: Optional[List[str]] = Field(
+        default=None,
+        description="Optional ingredient names that should not repeat within ingredient_repeat_window"
+    )
+    ingredient_repeat_window: int = Field(
+        default=0,
+        ge=0,
+        description="Number of following days on which a key ingredient cannot be repeated"
+    )
+
+
+class ProfileMealPlanRequest(MealPlanOptions):
+    profile: UserInput
+    save: bool = Field(default=False, description="Persist the nutrition prediction like /predict-and-save")
+
+
 class Nutrient(BaseModel):
     name: str
     amount: float
@@ -68,12 +117,38 @@ class MealNutrient(BaseModel):
     unit: str
 
 
+class MealAlternative(BaseModel):
+    dish_id: str
+    calories: float
+    description: str
+    image: str  # Same format as MealSuggestion.image
+    nutrients: List[MealNutrient]
+    mass: float  # Total mass in grams
+
+
 class MealSuggestion(BaseModel):
     meal_name: str
     calories: float
     time: str
     description: str
-    image: str  # Base64 encoded image
+    image: str  # Dish image URL, or base64 data URL when image_mode is 'inline'
     ingredients: List[str]
     nutrients: List[MealNutrient]
     mass: float  # Total mass in grams
+    alternatives: List[MealAlternative] = []  # Next-best dishes, only when num_alternatives > 0
+
+
+class DailyMealPlan(BaseModel):
+    day: int
+    meals: List[MealSuggestion]
+
+
+class ProfileMealPlanResponse(BaseModel):
+    daily_kcal_need: int
+    protein_g_per_day: float
+    carbs_g_per_day: float
+    fat_g_per_day: float
+    target_macro_ratios: Dict[str, float]  # Derived from the predicted macro grams
+    meals: List[MealSuggestion]
+    saved_id: Optional[int] = None  # Only when save is true
+    user_id: Optional[str] = None  # Only when save is true
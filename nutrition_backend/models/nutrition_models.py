@@ -1,6 +1,9 @@
 """
 Pydantic models for nutrition prediction endpoints.
 """
+from datetime import date
+from typing import List, Literal, Optional
+
 from pydantic import BaseModel
 
 
@@ -18,3 +21,25 @@ class UserInput(BaseModel):
     resting_heart_rate: float
     avg_heart_rate: float
     stress_score: float
+
+
+class TrendValue(BaseModel):
+    average: float  # Mean over the period's predictions
+    rolling_average: float  # Mean of the period averages over the rolling window of calendar periods
+    delta: Optional[float] = None  # Change from the previous calendar period (None if it has no predictions)
+
+
+class HistoryTrendPeriod(BaseModel):
+    period_start: date
+    predictions: int
+    daily_kcal_need: TrendValue
+    protein_g_per_day: TrendValue
+    carbs_g_per_day: TrendValue
+    fat_g_per_day: TrendValue
+
+
+class HistoryTrendsResponse(BaseModel):
+    user_id: str
+    bucket: Literal["day", "week", "month"]
+    window: int  # Periods per rolling average
+    periods: List[HistoryTrendPeriod]  # Oldest first; periods without predictions are skipped
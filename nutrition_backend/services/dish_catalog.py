@@ -0,0 +1,452 @@
+"""
+Dish Catalog Service
+
+This module loads the dish dataset used by the meal planner once and keeps
+it in memory, so that every meal plan request (single-day or multi-day)
+shares the same prepared catalog instead of re-reading the Excel files.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from services.dish_image_store import DishImageStore
+from services.metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+MACROS = ('fat', 'carb', 'protein')
+
+# Bounding box and JPEG quality of the dish thumbnails served to the frontend
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 85
+
+# Blob file holding the dish images (defaults to dataset/dish_images.blob)
+DISH_IMAGE_STORE_PATH = os.getenv("DISH_IMAGE_STORE_PATH")
+
+# Seconds between dataset change checks of the catalog watcher (0 disables it)
+CATALOG_WATCH_INTERVAL = float(os.getenv("DISH_CATALOG_WATCH_INTERVAL", "0"))
+
+# Cached catalog (lazy loading - built on first use)
+DISH_CATALOG = None
+
+# Serializes catalog builds; readers never take it
+_CATALOG_LOCK = threading.Lock()
+
+# Callbacks run after the catalog is reloaded (e.g. to clear caches built from it)
+CATALOG_RELOAD_LISTENERS = []
+
+
+def get_dataset_path() -> Path:
+    """Return the dataset directory used by the meal planner."""
+    # Use relative path from project root
+    base_path = Path(__file__).parent.parent
+    return base_path / 'dataset'
+
+
+def prepare_dish_catalog(image_df, dishes, dish_ingredients, ingredients, version: str = "memory",
+                         image_store=None) -> dict:
+    """
+    Build the dish catalog from the raw dataset tables.
+
+    Args:
+        image_df (pd.DataFrame): Dishes with a 'dish' column and, unless image_store
+                                 is given, their encoded 'rgb_image' bytes.
+        dishes (pd.DataFrame): Dish nutrition facts keyed by 'dish_id'.
+        dish_ingredients (pd.DataFrame): Dish to ingredient rows ('dish_id', 'ingr_name').
+        ingredients (pd.DataFrame): Ingredient reference table.
+        version (str): Identifier of the dataset the catalog was built from.
+        image_store (DishImageStore): Store holding the dish images. If None, the
+                                      'rgb_image' column is moved into an in-memory store.
+
+    Returns:
+        dict: Dictionary containing:
+            - available_dishes: Dishes with positive calories and macro percentages
+                                (numeric and text columns only, plus 'has_image')
+            - dish_ingredients: The dish to ingredient table
+            - ingredients: The ingredient reference table
+            - calories: NumPy array of dish calories aligned with available_dishes
+            - macro_pc: Dict of NumPy arrays with the percentage of calories per macro
+            - dish_ids: NumPy array of dish ids aligned with available_dishes
+            - dish_ingredient_index: Dict mapping dish id to a tuple of ingredient names
+            - thumbnails: Dict mapping dish id to its pre-encoded thumbnail and ETag
+            - ingredient_bitsets: Dict mapping lowercase ingredient name to a packed
+                                  bitset of the available_dishes rows that contain it
+            - version: The catalog version (used in cache keys and image URLs)
+            - image_store: The DishImageStore with the full-size dish images
+    """
+    if image_store is None:
+        images = zip(image_df['dish'], image_df['rgb_image']) if 'rgb_image' in image_df else []
+        image_store = DishImageStore.in_memory(images)
+
+    # Image bytes live in the image store, never in the catalog DataFrame
+    image_df = image_df.drop(columns=['rgb_image'], errors='ignore')
+    image_df = pd.merge(image_df, dishes, left_on='dish', right_on='dish_id', how='left').drop('dish_id', axis=1)
+
+    image_df['calories_from_fat'] = image_df['total_fat'] * 9
+    image_df['calories_from_carb'] = image_df['total_carb'] * 4
+    image_df['calories_from_protein'] = image_df['total_protein'] * 4
+
+    # Calculate percentage of calories from each macronutrient, handling division by zero
+    image_df['fat_pc'] = (image_df['calories_from_fat'] / image_df['total_calories']).fillna(0) * 100
+    image_df['carb_pc'] = (image_df['calories_from_carb'] / image_df['total_calories']).fillna(0) * 100
+    image_df['protein_pc'] = (image_df['calories_from_protein'] / image_df['total_calories']).fillna(0) * 100
+
+    # Replace any inf values (if total_calories was zero and macro calories were non-zero) with 0
+    image_df.replace([float('inf'), -float('inf')], 0, inplace=True)
+
+    available_dishes = image_df[image_df['total_calories'] > 0].reset_index(drop=True)
+    available_dishes['has_image'] = [dish_id in image_store for dish_id in available_dishes['dish']]
+
+    return {
+        'available_dishes': available_dishes,
+        'dish_ingredients': dish_ingredients,
+        'ingredients': ingredients,
+        'calories': available_dishes['total_calories'].to_numpy(dtype=float),
+        'macro_pc': {macro: available_dishes[f'{macro}_pc'].to_numpy(dtype=float) for macro in MACROS},
+        'dish_ids': available_dishes['dish'].to_numpy(),
+        'dish_ingredient_index': build_dish_ingredient_index(dish_ingredients),
+        'thumbnails': build_thumbnails(available_dishes, image_store),
+        'ingredient_bitsets': build_ingredient_bitsets(available_dishes, dish_ingredients),
+        'version': version,
+        'image_store': image_store,
+    }
+
+
+def build_dish_ingredient_index(dish_ingredients) -> dict:
+    """
+    Group the dish to ingredient table once so that looking up the
+    ingredients of a dish does not scan the whole table.
+
+    Args:
+        dish_ingredients (pd.DataFrame): Dish to ingredient rows ('dish_id', 'ingr_name').
+
+    Returns:
+        dict: Dish id mapped to a tuple of ingredient names, in table order.
+    """
+    return dish_ingredients.groupby('dish_id', sort=False)['ingr_name'].agg(tuple).to_dict()
+
+
+def get_dish_ingredients(catalog, dish_id) -> list:
+    """Return the ingredient names of a dish (empty if the dish has none)."""
+    return list(catalog['dish_ingredient_index'].get(dish_id, ()))
+
+
+def build_ingredient_bitsets(available_dishes, dish_ingredients) -> dict:
+    """
+    Build an ingredient to dish inverted index stored as packed bitsets.
+
+    Bit i of an ingredient's bitset is set when row i of available_dishes contains
+    that ingredient, so ingredient filters become bitwise operations over the catalog.
+
+    Args:
+        available_dishes (pd.DataFrame): Dishes offered to the planner.
+        dish_ingredients (pd.DataFrame): Dish to ingredient rows ('dish_id', 'ingr_name').
+
+    Returns:
+        dict: Lowercase ingredient name mapped to a np.packbits uint8 array.
+    """
+    num_dishes = len(available_dishes)
+    positions = pd.DataFrame({'dish_id': available_dishes['dish'].to_numpy(), 'position': np.arange(num_dishes)})
+    rows = dish_ingredients[['dish_id', 'ingr_name']].merge(positions, on='dish_id')
+    rows['ingr_name'] = rows['ingr_name'].astype(str).str.lower()
+
+    bitsets = {}
+    for ingredient_name, dish_positions in rows.groupby('ingr_name')['position']:
+        bits = np.zeros(num_dishes, dtype=bool)
+        bits[dish_positions.to_numpy()] = True
+        bitsets[ingredient_name] = np.packbits(bits)
+    return bitsets
+
+
+def ingredient_filter_mask(catalog, exclude_ingredients=None, include_ingredients=None):
+    """
+    Compute which dishes pass the ingredient filters.
+
+    Args:
+        catalog (dict): The dish catalog.
+        exclude_ingredients (list): Dishes containing any of these ingredients are removed.
+        include_ingredients (list): If given, only dishes containing at least one of these are kept.
+
+    Returns:
+        np.ndarray: Boolean mask aligned with available_dishes, or None when no filter is given.
+
+    Raises:
+        ValueError: If an excluded ingredient is not in the catalog (a misspelled allergen
+            would otherwise be dropped silently and let its dishes through).
+    """
+    if not exclude_ingredients and not include_ingredients:
+        return None
+
+    num_dishes = len(catalog['dish_ids'])
+    bitsets = catalog['ingredient_bitsets']
+
+    unknown = sorted({name.strip().lower() for name in exclude_ingredients or []} - bitsets.keys())
+    if unknown:
+        raise ValueError(f"Unknown ingredients in exclude_ingredients: {', '.join(unknown)}")
+    empty = np.zeros((num_dishes + 7) // 8, dtype=np.uint8)
+
+    def union(names):
+        combined = empty.copy()
+        for name in names:
+            combined |= bitsets.get(name.strip().lower(), empty)
+        return combined
+
+    allowed = np.full_like(empty, 0xFF)
+    if exclude_ingredients:
+        allowed &= ~union(exclude_ingredients)
+    if include_ingredients:
+        allowed &= union(include_ingredients)
+    return np.unpackbits(allowed, count=num_dishes).astype(bool)
+
+
+def encode_thumbnail(image_bytes: bytes) -> bytes:
+    """
+    Resize a dish image to fit THUMBNAIL_SIZE and re-encode it as JPEG.
+
+    Images that cannot be decoded are returned unchanged so the dish still has a picture.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img = img.convert('RGB')
+            img.thumbnail(THUMBNAIL_SIZE)
+            output = io.BytesIO()
+            img.save(output, format='JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+            return output.getvalue()
+    except (OSError, ValueError):
+        return image_bytes
+
+
+def build_thumbnails(available_dishes, image_store) -> dict:
+    """
+    Pre-encode the thumbnail of every dish that has an image.
+
+    Args:
+        available_dishes (pd.DataFrame): Dishes offered to the planner.
+        image_store (DishImageStore): Store holding the full-size dish images.
+
+    Returns:
+        dict: Dish id mapped to {'data': JPEG bytes, 'etag': strong ETag of the bytes}.
+    """
+    thumbnails = {}
+    for dish_id in available_dishes['dish']:
+        if dish_id in thumbnails:
+            continue
+        image_bytes = image_store.get(dish_id)
+        if not image_bytes:
+            continue
+        data = encode_thumbnail(image_bytes)
+        thumbnails[dish_id] = {
+            'data': data,
+            'etag': f'"{hashlib.sha256(data).hexdigest()[:32]}"',
+        }
+    return thumbnails
+
+
+def read_dish_image(catalog, dish_id):
+    """Return the full-size image bytes of a dish, or None if the dish has no image."""
+    return catalog['image_store'].get(dish_id)
+
+
+def get_dish_thumbnail(catalog, dish_id):
+    """Return the thumbnail entry of a dish, or None if the dish has no image."""
+    return catalog['thumbnails'].get(dish_id)
+
+
+DATASET_FILES = ('dish_images.pkl', 'dishes.xlsx', 'dish_ingredients.xlsx', 'ingredients.xlsx')
+
+
+def dataset_fingerprint(dataset_path=None) -> str:
+    """
+    Fingerprint the dataset files from their names, sizes and modification times.
+
+    The fingerprint is used as the catalog version, so it changes whenever a file is replaced.
+    """
+    save_path = Path(dataset_path) if dataset_path is not None else get_dataset_path()
+    digest = hashlib.sha1()
+    for name in DATASET_FILES:
+        file_path = save_path / name
+        if file_path.exists():
+            stat = file_path.stat()
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+def load_dish_catalog(dataset_path=None) -> dict:
+    """
+    Read the dataset files from disk and build the dish catalog.
+
+    Args:
+        dataset_path: Directory holding the dataset files. If None, uses default path.
+
+    Returns:
+        dict: The prepared dish catalog (see prepare_dish_catalog), plus its 'version'.
+
+    Raises:
+        FileNotFoundError: If the dataset directory does not exist
+    """
+    save_path = Path(dataset_path) if dataset_path is not None else get_dataset_path()
+
+    # Verify dataset directory exists
+    if not save_path.exists():
+        raise FileNotFoundError(f"Dataset directory not found at: {save_path}")
+
+    # Fingerprint before reading so a file replaced mid-load triggers another reload
+    version = dataset_fingerprint(save_path)
+
+    with time_stage("dish_catalog", "read_pickle"):
+        image_df = pd.read_pickle(save_path / 'dish_images.pkl')
+    with time_stage("dish_catalog", "excel_parsing"):
+        dishes = pd.read_excel(save_path / 'dishes.xlsx')
+        dish_ingredients = pd.read_excel(save_path / 'dish_ingredients.xlsx')
+        ingredients = pd.read_excel(save_path / 'ingredients.xlsx')
+
+    # Move the image bytes into the append-only blob store; only new or changed images are written
+    blob_path = Path(DISH_IMAGE_STORE_PATH) if DISH_IMAGE_STORE_PATH else save_path / 'dish_images.blob'
+    with time_stage("dish_catalog", "image_store_sync"):
+        image_store = DishImageStore.sync(blob_path, zip(image_df['dish'], image_df['rgb_image']))
+    image_df = image_df.drop(columns=['rgb_image'])
+
+    with time_stage("dish_catalog", "prepare"):
+        catalog = prepare_dish_catalog(image_df, dishes, dish_ingredients, ingredients, version=version,
+                                       image_store=image_store)
+    logger.info(f"Dish catalog {version} loaded with {len(catalog['available_dishes'])} dishes")
+    return catalog
+
+
+def get_dish_catalog() -> dict:
+    """
+    Get the dish catalog, loading it if necessary.
+
+    Callers should fetch the catalog once per request and keep using that
+    snapshot; a reload swaps in a new catalog without touching the old one.
+    """
+    global DISH_CATALOG
+    if DISH_CATALOG is None:
+        with _CATALOG_LOCK:
+            if DISH_CATALOG is None:
+                DISH_CATALOG = load_dish_catalog()
+    return DISH_CATALOG
+
+
+def get_catalog_version():
+    """Return the version of the loaded catalog, or None if it is not loaded yet."""
+    catalog = DISH_CATALOG
+    return catalog['version'] if catalog is not None else None
+
+
+def get_catalog_status() -> dict:
+    """Return the version and size of the loaded catalog without triggering a load."""
+    catalog = DISH_CATALOG
+    if catalog is None:
+        return {"loaded": False, "version": None, "dishes": 0}
+    return {"loaded": True, "version": catalog['version'], "dishes": len(catalog['dish_ids'])}
+
+
+def add_catalog_reload_listener(callback):
+    """Register a callback that is called with the new catalog after every reload."""
+    CATALOG_RELOAD_LISTENERS.append(callback)
+
+
+def reload_dish_catalog(dataset_path=None) -> dict:
+    """
+    Rebuild the dish catalog from disk and atomically replace the cached one.
+
+    The new catalog (tables, indexes and thumbnails) is fully built before it
+    is swapped in, so requests never see a partially built catalog and
+    in-flight requests finish on the snapshot they started with.
+
+    Returns:
+        dict: The newly loaded dish catalog.
+    """
+    global DISH_CATALOG
+    with _CATALOG_LOCK:
+        catalog = load_dish_catalog(dataset_path)
+        DISH_CATALOG = catalog
+    for callback in CATALOG_RELOAD_LISTENERS:
+        callback(catalog)
+    return catalog
+
+
+class CatalogWatcher:
+    """Background thread that reloads the dish catalog when the dataset files change."""
+
+    def __init__(self, interval: float = CATALOG_WATCH_INTERVAL, dataset_path=None):
+        self.interval = interval
+        self.dataset_path = dataset_path
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling the dataset files (no-op if interval is 0)."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dish-catalog-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling and wait for the thread to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self) -> bool:
+        """Reload the catalog if the dataset changed since it was loaded; return True if reloaded."""
+        version = get_catalog_version()
+        if version is None or dataset_fingerprint(self.dataset_path) == version:
+            return False
+        reload_dish_catalog(self.dataset_path)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # Keep serving the current catalog if the new files cannot be loaded
+                logger.warning(f"Dish catalog reload failed: {e}")
+
+
+def macro_deviation(catalog, target_macro_profile) -> np.ndarray:
+    """
+    Compute the macronutrient deviation score of every dish in the catalog.
+
+    Args:
+        catalog (dict): The dish catalog.
+        target_macro_profile (dict): Target ratios for 'fat', 'carb', 'protein'.
+
+    Returns:
+        np.ndarray: Sum of absolute percentage-point deviations per dish.
+    """
+    deviation = np.zeros(len(catalog['calories']))
+    for macro, target_ratio in target_macro_profile.items():
+        # Multiply target ratio by 100 to compare with percentage columns (e.g., fat_pc)
+        deviation += np.abs(catalog['macro_pc'][macro] - target_ratio * 100)
+    return deviation
+
+
+def score_dishes(catalog, meal_calorie_targets, target_macro_profile) -> np.ndarray:
+    """
+    Score every dish against every meal slot in one vectorized pass.
+
+    Args:
+        catalog (dict): The dish catalog.
+        meal_calorie_targets (list): Calorie target for each meal slot.
+        target_macro_profile (dict): Target ratios for 'fat', 'carb', 'protein'.
+
+    Returns:
+        np.ndarray: Array of shape (meal slots, dishes); lower is better.
+    """
+    targets = np.asarray(meal_calorie_targets, dtype=float)
+    calorie_deviation = np.abs(catalog['calories'][np.newaxis, :] - targets[:, np.newaxis])
+    # Using equal weights for calorie and macro deviation, same as select_dish_for_meal
+    return calorie_deviation + macro_deviation(catalog, target_macro_profile)[np.newaxis, :]
@@ -0,0 +1,156 @@
+"""
+Dish Image Store Service
+
+This module keeps dish images out of the dish catalog DataFrame. Images are
+written once to a single append-only blob file with a JSON offset index next
+to it, and read lazily through a read-only mmap, so every worker shares the
+same page cache instead of holding the whole image corpus in memory.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class DishImageStore:
+    """Read-only view of dish images stored back to back in one buffer."""
+
+    def __init__(self, buffer, index: dict, path=None):
+        """
+        Args:
+            buffer: mmap (or bytes) holding the concatenated images.
+            index (dict): Dish id (str) mapped to {'offset', 'length', 'sha1'}.
+            path: Blob file the buffer was mapped from (None for in-memory stores).
+        """
+        self._buffer = buffer
+        self.index = index
+        self.path = path
+
+    def __contains__(self, dish_id) -> bool:
+        return str(dish_id) in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, dish_id):
+        """Return the image bytes of a dish, or None if it has no image."""
+        entry = self.index.get(str(dish_id))
+        if entry is None:
+            return None
+        return bytes(self._buffer[entry['offset']:entry['offset'] + entry['length']])
+
+    @classmethod
+    def in_memory(cls, images):
+        """
+        Build a store held in memory (used for catalogs built without a dataset directory).
+
+        Args:
+            images: Iterable of (dish_id, image_bytes) pairs.
+        """
+        chunks = []
+        index = {}
+        offset = 0
+        for dish_id, image_bytes in images:
+            if not image_bytes or str(dish_id) in index:
+                continue
+            image_bytes = bytes(image_bytes)
+            index[str(dish_id)] = {
+                'offset': offset,
+                'length': len(image_bytes),
+                'sha1': hashlib.sha1(image_bytes).hexdigest(),
+            }
+            chunks.append(image_bytes)
+            offset += len(image_bytes)
+        return cls(b''.join(chunks), index)
+
+    @classmethod
+    def open(cls, blob_path):
+        """
+        Map an existing blob file and its index read-only.
+
+        Raises:
+            FileNotFoundError: If the blob file or its index does not exist
+        """
+        blob_path = Path(blob_path)
+        with open(index_path_for(blob_path), 'r') as f:
+            index = json.load(f)['images']
+
+        if blob_path.stat().st_size == 0:
+            # mmap cannot map empty files
+            return cls(b'', index, blob_path)
+
+        with open(blob_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, index, blob_path)
+
+    @classmethod
+    def sync(cls, blob_path, images):
+        """
+        Append new or changed images to the blob file, then open it.
+
+        Existing bytes are never rewritten: a changed image is appended and its
+        index entry repointed, so mappings held by older catalogs stay valid.
+        Workers syncing the same blob take turns on an exclusive lock file, so
+        each one appends after (and indexes on top of) the previous one's sync.
+
+        Args:
+            blob_path: Path of the blob file (its index is stored next to it).
+            images: Iterable of (dish_id, image_bytes) pairs.
+
+        Returns:
+            DishImageStore: The store opened on the updated blob file.
+        """
+        blob_path = Path(blob_path)
+        index_path = index_path_for(blob_path)
+
+        appended = 0
+        # Held from reading the index until the new index is in place (released on close)
+        with open(lock_path_for(blob_path), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            index = {}
+            if blob_path.exists() and index_path.exists():
+                with open(index_path, 'r') as f:
+                    index = json.load(f)['images']
+
+            with open(blob_path, 'ab') as blob:
+                for dish_id, image_bytes in images:
+                    if not image_bytes:
+                        continue
+                    image_bytes = bytes(image_bytes)
+                    sha1 = hashlib.sha1(image_bytes).hexdigest()
+                    entry = index.get(str(dish_id))
+                    if entry is not None and entry['sha1'] == sha1:
+                        continue
+                    offset = blob.tell()
+                    blob.write(image_bytes)
+                    index[str(dish_id)] = {'offset': offset, 'length': len(image_bytes), 'sha1': sha1}
+                    appended += 1
+
+            # Replace the index atomically so readers never see a partial file
+            temp_path = index_path.with_suffix(index_path.suffix + '.tmp')
+            with open(temp_path, 'w') as f:
+                json.dump({'images': index}, f)
+            os.replace(temp_path, index_path)
+
+        if appended:
+            logger.info(f"Appended {appended} dish images to {blob_path}")
+        return cls.open(blob_path)
+
+
+def index_path_for(blob_path) -> Path:
+    """Return the path of the offset index that belongs to a blob file."""
+    blob_path = Path(blob_path)
+    return blob_path.with_name(blob_path.name + '.index.json')
+
+
+def lock_path_for(blob_path) -> Path:
+    """Return the path of the lock file that serializes syncs of a blob file."""
+    blob_path = Path(blob_path)
+    return blob_path.with_name(blob_path.name + '.lock')
@@ -0,0 +1,136 @@
+"""
+History Cache Service
+
+This module caches the first /history page of each user. History is read far
+more often than it is written, so the newest page of a user is served from an
+LRU cache bounded by entries and by bytes, and dropped whenever a prediction
+of that user is written.
+
+The cache lives in each worker process and is only invalidated by writes made
+through that process; a deployment with several workers or instances must not
+rely on it for read-your-writes across them.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Maximum number of users with a cached first page (0 disables the cache)
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "10000"))
+
+# Maximum total size of the cached pages, measured as their JSON size
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 2**20)))
+
+
+def page_size_bytes(page) -> int:
+    """Approximate memory of a cached page: the length of its JSON encoding."""
+    return len(json.dumps(page, default=str))
+
+
+class HistoryCache:
+    """Thread-safe LRU cache of first history pages, keyed by user and page size."""
+
+    def __init__(self, max_entries: int = HISTORY_CACHE_SIZE, max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.bytes = 0
+        # user_id -> {page_size: (page, nbytes)}, least recently used first
+        self._entries = OrderedDict()
+        # user_id -> value of _writes at the user's last invalidation, oldest first. Bounded like
+        # the entries: users dropped from it fall back to _oldest_generation, the newest value
+        # dropped so far, so a page loaded before their last write still compares as stale.
+        self._generations = OrderedDict()
+        self._oldest_generation = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: str) -> int:
+        """Write counter of a user; read it before loading the user's page and pass it to put()."""
+        with self._lock:
+            return self._generations.get(user_id, self._oldest_generation)
+
+    def get(self, user_id: str, page_size: int):
+        """Return the cached first page of user_id (treat it as read-only), or None."""
+        with self._lock:
+            pages = self._entries.get(user_id)
+            if pages is not None and page_size in pages:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return pages[page_size][0]
+            self.misses += 1
+            return None
+
+    def put(self, user_id: str, page_size: int, page, generation: int):
+        """
+        Store a first page loaded from the database.
+
+        Args:
+            user_id (str): Owner of the page.
+            page_size (int): Rows per page the page was loaded with.
+            page: The page (rows and next cursor).
+            generation (int): self.generation(user_id) read before the page was loaded; the
+                page is skipped if a prediction of the user was written meanwhile, since it may be stale.
+        """
+        nbytes = page_size_bytes(page)
+        with self._lock:
+            if (self.max_entries <= 0 or nbytes > self.max_bytes
+                    or generation != self._generations.get(user_id, self._oldest_generation)):
+                return
+            pages = self._entries.setdefault(user_id, {})
+            if page_size in pages:
+                self.bytes -= pages[page_size][1]
+            pages[page_size] = (page, nbytes)
+            self.bytes += nbytes
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= sum(size for _, size in evicted.values())
+                self.evictions += 1
+
+    def invalidate(self, user_ids):
+        """Drop the cached pages of users whose history changed."""
+        with self._lock:
+            for user_id in set(user_ids):
+                self._writes += 1
+                self._generations[user_id] = self._writes
+                self._generations.move_to_end(user_id)
+                pages = self._entries.pop(user_id, None)
+                if pages is not None:
+                    self.bytes -= sum(size for _, size in pages.values())
+                    self.invalidations += 1
+            while len(self._generations) > max(self.max_entries, 1):
+                _, self._oldest_generation = self._generations.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached page (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            # Pages being loaded now were read before the clear: make every user's generation new
+            self._writes += 1
+            self._generations.clear()
+            self._oldest_generation = self._writes
+
+    def stats(self) -> dict:
+        """Return cache size, memory and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+
+history_cache = HistoryCache()
@@ -13,6 +13,8 @@ import io
 import tempfile
 from pathlib import Path
 
+from services.metrics import time_stage
+
 
 def load_class_map(json_path: str = None) -> dict:
     """
@@ -162,7 +164,7 @@ def predict_ingredients_from_image(image_file, model_path: str = None, class_map
         
         # Suppress optimizer warnings since we're only using the model for inference
         import warnings
-        with warnings.catch_warnings():
+        with warnings.catch_warnings(), time_stage("ingredient_predictor", "model_load"):
             warnings.filterwarnings("ignore", category=UserWarning, message=".*optimizer.*")
             image_model = tf.keras.models.load_model(str(model_path), compile=False)
         
@@ -177,17 +179,19 @@ def predict_ingredients_from_image(image_file, model_path: str = None, class_map
             image_file.file.seek(0)
             
             # Create a temporary file to save the image
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(image_bytes)
-                temp_file_path = temp_file.name
+            with time_stage("ingredient_predictor", "temp_file_io"):
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+                    temp_file.write(image_bytes)
+                    temp_file_path = temp_file.name
             
             # Load image using TensorFlow's utility function
             # This automatically handles image decoding and resizing to target_size
-            user_img = tf.keras.utils.load_img(temp_file_path, target_size=(320, 320))
-            
-            img_320 = user_img.resize((320, 320))
-            x_image_model = np.array(img_320)
-            x_image_model = np.expand_dims(x_image_model, axis=0)
+            with time_stage("ingredient_predictor", "decode"):
+                user_img = tf.keras.utils.load_img(temp_file_path, target_size=(320, 320))
+                
+                img_320 = user_img.resize((320, 320))
+                x_image_model = np.array(img_320)
+                x_image_model = np.expand_dims(x_image_model, axis=0)
 
             # The x_regression_models variable is already correctly sized for 320x320
             x_regression_models = x_image_model.copy() # Simply assign the same processed image for consistency
@@ -199,7 +203,8 @@ def predict_ingredients_from_image(image_file, model_path: str = None, class_map
                 os.unlink(temp_file_path)
         
         # Make prediction
-        preds, probs = make_ingredient_prediction(x_image_model, image_model, class_map)
+        with time_stage("ingredient_predictor", "inference"):
+            preds, probs = make_ingredient_prediction(x_image_model, image_model, class_map)
         
         return {
             'predictions': preds,
@@ -0,0 +1,98 @@
+"""
+Stored meal analyses.
+
+/api/analyze-meal keeps every analysis in the `meal_analyses` table, one row
+per user and image (sha256 of the uploaded bytes). The table doubles as a
+persistent result cache: a photo whose hash was already analyzed by the
+current models is answered from the stored row without running inference.
+Rows are written by a background task after the response has been sent.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database_models import MealAnalysis
+from services.metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+# Bump when the image models are retrained; rows of other versions are not reused
+MEAL_ANALYSIS_MODEL_VERSION = os.getenv("MEAL_ANALYSIS_MODEL_VERSION", "1")
+
+# user_id stored for photos analyzed without one
+ANONYMOUS_USER_ID = ""
+
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def image_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def format_meal_analysis(row) -> dict:
+    """MealAnalysisResponse dict of a stored row."""
+    return {
+        "ingredients": row.ingredients,
+        "nutrients": row.nutrients,
+        "calories_per_100g": row.calories_per_100g,
+    }
+
+
+async def find_meal_analysis(session_factory, user_id: Optional[str], hash_: str,
+                             model_version: str = MEAL_ANALYSIS_MODEL_VERSION) -> Optional[dict]:
+    """
+    Stored analysis of an image, preferring the user's own row over another user's.
+    Lookup errors are logged and reported as a miss.
+
+    Returns:
+        dict: {"user_id": owner of the row, "analysis": MealAnalysisResponse dict}, or None.
+    """
+    user_id = user_id or ANONYMOUS_USER_ID
+    try:
+        async with session_factory() as db:
+            with time_stage("db", "meal_analysis_lookup"):
+                row = (await db.execute(
+                    select(MealAnalysis)
+                    .where(MealAnalysis.image_hash == hash_, MealAnalysis.model_version == model_version)
+                    .order_by((MealAnalysis.user_id == user_id).desc())
+                    .limit(1)
+                )).scalar_one_or_none()
+    except Exception:
+        # The store is only a cache on this path; analyze the image instead of failing
+        logger.exception(f"Could not look up meal analysis {hash_}")
+        return None
+    if row is None:
+        return None
+    return {"user_id": row.user_id, "analysis": format_meal_analysis(row)}
+
+
+async def save_meal_analysis(session_factory, user_id: Optional[str], hash_: str, analysis: dict,
+                             model_version: str = MEAL_ANALYSIS_MODEL_VERSION) -> None:
+    """
+    Insert the analysis of an image for a user, replacing the user's row of an older model version.
+    Runs as a background task, so failures are logged instead of raised.
+    """
+    values = {
+        "user_id": user_id or ANONYMOUS_USER_ID,
+        "image_hash": hash_,
+        "model_version": model_version,
+        "ingredients": analysis["ingredients"],
+        "nutrients": analysis["nutrients"],
+        "calories_per_100g": analysis["calories_per_100g"],
+    }
+    try:
+        async with session_factory() as db:
+            with time_stage("db", "meal_analysis_save"):
+                upsert = UPSERTS[db.bind.dialect.name](MealAnalysis).values(**values)
+                await db.execute(upsert.on_conflict_do_update(
+                    index_elements=[MealAnalysis.user_id, MealAnalysis.image_hash],
+                    set_={name: upsert.excluded[name] for name in values if name not in ("user_id", "image_hash")},
+                ))
+                await db.commit()
+    except Exception:
+        logger.exception(f"Could not store meal analysis {hash_} of user {values['user_id']!r}")
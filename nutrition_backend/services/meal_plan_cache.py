@@ -0,0 +1,102 @@
+"""
+Meal Plan Cache Service
+
+This module memoizes meal plans. generate_meal_plan is deterministic for a
+given calorie target, meal count and ratios, and most users send a handful
+of rounded calorie targets, so repeated requests are served from an LRU cache.
+"""
+
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+from services.dish_catalog import add_catalog_reload_listener
+
+# Maximum number of cached meal plans
+MEAL_PLAN_CACHE_SIZE = int(os.getenv("MEAL_PLAN_CACHE_SIZE", "256"))
+
+# Round calorie targets to this many kcal before planning (0 keeps exact targets)
+MEAL_PLAN_CALORIE_BUCKET = float(os.getenv("MEAL_PLAN_CALORIE_BUCKET", "0"))
+
+
+class MealPlanCache:
+    """Thread-safe LRU cache of meal plans with hit and miss counters."""
+
+    def __init__(self, max_entries: int = MEAL_PLAN_CACHE_SIZE, calorie_bucket: float = MEAL_PLAN_CALORIE_BUCKET):
+        self.max_entries = max_entries
+        self.calorie_bucket = calorie_bucket
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def bucket_calories(self, total_calories: float) -> float:
+        """Round a calorie target to the configured bucket."""
+        if self.calorie_bucket <= 0:
+            return total_calories
+        return max(self.calorie_bucket, round(total_calories / self.calorie_bucket) * self.calorie_bucket)
+
+    @staticmethod
+    def make_key(total_calories, meals_per_day, calorie_distribution_ratios=None, target_macro_ratios=None, *extra):
+        """Build a hashable cache key from the planner arguments."""
+        ratios = tuple(calorie_distribution_ratios) if calorie_distribution_ratios is not None else None
+        macros = tuple(sorted(target_macro_ratios.items())) if target_macro_ratios is not None else None
+        return (float(total_calories), meals_per_day, ratios, macros) + tuple(extra)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached meal plan for key, computing and storing it on a miss.
+
+        Args:
+            key: Cache key built with make_key.
+            compute: Callable returning the meal plan.
+
+        Returns:
+            A copy of the cached meal plan, so callers may modify it freely.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self._entries[key])
+            self.misses += 1
+            generation = self._generation
+
+        # Plan outside the lock so slow plans do not block cache hits
+        value = compute()
+
+        with self._lock:
+            # Skip storing plans computed against a catalog that was replaced meanwhile
+            if self.max_entries > 0 and generation == self._generation:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return copy.deepcopy(value)
+
+    def clear(self, *args):
+        """Drop every cached plan (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self) -> dict:
+        """Return cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "calorie_bucket": self.calorie_bucket,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+meal_plan_cache = MealPlanCache()
+
+# Cached plans refer to dishes of the old catalog, so drop them on reload
+add_catalog_reload_listener(meal_plan_cache.clear)
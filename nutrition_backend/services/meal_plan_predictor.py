@@ -5,52 +5,117 @@ This module handles the generation of personalized meal plans based on
 daily calorie goals and meal frequency preferences.
 """
 
-import pandas as pd
-from pathlib import Path
+import numpy as np
 import logging
 
+from services.dish_catalog import get_dish_catalog, get_dish_ingredients, ingredient_filter_mask, score_dishes
+from services.metrics import time_stage
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
 def data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios):
 
-    # Use relative path from project root
-    base_path = Path(__file__).parent.parent
-    save_path = base_path / 'dataset'
-    
-    # Verify dataset directory exists
-    if not save_path.exists():
-        raise FileNotFoundError(f"Dataset directory not found at: {save_path}")
-    
-    image_df = pd.read_pickle(save_path / 'dish_images.pkl')
-    dishes = pd.read_excel(save_path / 'dishes.xlsx')
-    dish_ingredients = pd.read_excel(save_path / 'dish_ingredients.xlsx')
-    ingredients = pd.read_excel(save_path / 'ingredients.xlsx')
-
-    image_df = pd.merge(image_df, dishes, left_on='dish', right_on='dish_id', how='left').drop('dish_id', axis=1)
+    catalog = get_dish_catalog()
 
     # Calculate meal calorie targets based on distribution ratios
     meal_calorie_targets = []
     for ratio in calorie_distribution_ratios:
         meal_calories = ratio * daily_calorie_target
         meal_calorie_targets.append(meal_calories)
-    image_df['calories_from_fat'] = image_df['total_fat'] * 9
-    image_df['calories_from_carb'] = image_df['total_carb'] * 4
-    image_df['calories_from_protein'] = image_df['total_protein'] * 4
 
-    # Calculate percentage of calories from each macronutrient, handling division by zero
-    image_df['fat_pc'] = (image_df['calories_from_fat'] / image_df['total_calories']).fillna(0) * 100
-    image_df['carb_pc'] = (image_df['calories_from_carb'] / image_df['total_calories']).fillna(0) * 100
-    image_df['protein_pc'] = (image_df['calories_from_protein'] / image_df['total_calories']).fillna(0) * 100
+    # select_dish_for_meal only reads the dishes, so the shared catalog is used as is
+    available_dishes = catalog['available_dishes']
+    return {'available_dishes': available_dishes, 'dish_ingredients': catalog['dish_ingredients'], 'ingredients': catalog['ingredients'], 'meal_calorie_targets': meal_calorie_targets, 'catalog': catalog}
+
+
+def default_calorie_distribution(num_meals):
+    """Return the default calorie distribution ratios for the given number of meals."""
+    if num_meals == 2:
+        # Breakfast and Dinner - more calories for dinner
+        return [0.40, 0.60]
+    elif num_meals == 3:
+        # Breakfast, Lunch, Dinner
+        return [0.25, 0.40, 0.35]
+    elif num_meals == 4:
+        # Breakfast, Mid-Morning, Lunch, Dinner
+        return [0.20, 0.15, 0.35, 0.30]
+    # Default: equal distribution
+    return [1.0 / num_meals] * num_meals
+
 
-    # Replace any inf values (if total_calories was zero and macro calories were non-zero) with 0
-    image_df.replace([float('inf'), -float('inf')], 0, inplace=True)
+def resolve_calorie_distribution(num_meals, calorie_distribution_ratios=None):
+    """Return the calorie distribution ratios to plan with."""
+    if calorie_distribution_ratios is None:
+        calorie_distribution_ratios = default_calorie_distribution(num_meals)
+
+        # Ensure ratios sum to exactly 1.0 to prevent exceeding target
+        ratio_sum = sum(calorie_distribution_ratios)
+        if ratio_sum != 1.0:
+            calorie_distribution_ratios = [r / ratio_sum for r in calorie_distribution_ratios]
+    elif len(calorie_distribution_ratios) != num_meals:
+        # If mismatch, use default for that number of meals
+        calorie_distribution_ratios = default_calorie_distribution(num_meals)
+    return calorie_distribution_ratios
 
-    available_dishes = image_df[image_df['total_calories'] > 0].copy()
-    return {'available_dishes': available_dishes, 'dish_ingredients': dish_ingredients, 'ingredients': ingredients, 'meal_calorie_targets': meal_calorie_targets}
 
-def select_dish_for_meal(target_calories, available_dishes, target_macro_profile):
+def resolve_macro_ratios(target_macro_ratios=None):
+    """Return the target macro ratios, accepting 'carbs' as an alias of 'carb'."""
+    if target_macro_ratios is None:
+        return {'fat': 0.30, 'carb': 0.45, 'protein': 0.25}
+    return {('carb' if macro == 'carbs' else macro): ratio for macro, ratio in target_macro_ratios.items()}
+
+def macro_ratios_from_grams(protein_g: float, carbs_g: float, fat_g: float, precision: int = 3):
+    """
+    Convert daily macronutrient grams into target macro ratios (share of calories).
+
+    Ratios are rounded to `precision` decimals so nearby predictions share meal plan cache entries.
+
+    Returns:
+        dict: {'fat', 'carb', 'protein'} ratios, or None (planner defaults) if the grams carry no calories.
+    """
+    macro_calories = {'fat': fat_g * 9, 'carb': carbs_g * 4, 'protein': protein_g * 4}
+    total = sum(max(calories, 0) for calories in macro_calories.values())
+    if total <= 0:
+        return None
+    return {macro: round(max(calories, 0) / total, precision) for macro, calories in macro_calories.items()}
+
+def rank_dishes(scores, mask=None, top_k=1) -> np.ndarray:
+    """
+    Return the positions of the top_k lowest-scoring dishes, best first.
+
+    Uses argpartition so only the top_k candidates are sorted, not the whole catalog.
+
+    Args:
+        scores (np.ndarray): Score of each dish (lower is better).
+        mask (np.ndarray): Optional boolean array; only dishes where it is True are ranked.
+        top_k (int): Number of positions to return.
+
+    Returns:
+        np.ndarray: Up to top_k positions; the first one is the first dish with the lowest score.
+    """
+    if mask is not None:
+        scores = np.where(mask, scores, np.inf)
+    if len(scores) == 0 or top_k <= 0:
+        return np.empty(0, dtype=int)
+
+    # np.argmin keeps the first dish among equal scores, like DataFrame.idxmin
+    best = int(np.argmin(scores))
+    if not np.isfinite(scores[best]):
+        return np.empty(0, dtype=int)
+    if top_k == 1:
+        return np.array([best])
+
+    top_k = min(top_k, len(scores))
+    candidates = np.argpartition(scores, top_k - 1)[:top_k] if top_k < len(scores) else np.arange(len(scores))
+    candidates = candidates[(candidates != best) & np.isfinite(scores[candidates])]
+    # Order the remaining candidates by score, then by position for ties
+    candidates = candidates[np.lexsort((candidates, scores[candidates]))]
+    return np.concatenate(([best], candidates[:top_k - 1]))
+
+
+def select_dish_for_meal(target_calories, available_dishes, target_macro_profile, mask=None, num_alternatives=0):
     """
     Selects a dish that best matches the target calorie count and macronutrient profile.
 
@@ -59,101 +124,154 @@ def select_dish_for_meal(target_calories, available_dishes, target_macro_profile
         available_dishes (pd.DataFrame): DataFrame containing dish information,
                                        including 'total_calories', 'fat_pc', 'carb_pc', 'protein_pc'.
         target_macro_profile (dict): Dictionary with target ratios for 'fat', 'carb', 'protein'.
+        mask (np.ndarray): Optional boolean array aligned with available_dishes;
+                           only dishes where it is True can be selected.
+        num_alternatives (int): Number of next-best dishes to return alongside the selection.
 
     Returns:
         tuple: A tuple containing:
                - pd.Series: The selected dish (full row from available_dishes).
                - str: The dish ID of the selected dish.
-    """
+               - pd.DataFrame: The next-best dishes, best first (empty if num_alternatives is 0).
 
-    # 2. Calculate the absolute difference between each dish's total_calories and the target_calories
-    available_dishes['calorie_deviation'] = abs(available_dishes['total_calories'] - target_calories)
+    Raises:
+        ValueError: If no dish is available for selection
+    """
 
-    # 3. Calculate a 'macronutrient deviation score' for each dish
-    # Initialize macro deviation score
-    available_dishes['macro_deviation'] = 0.0
+    # 1. Calculate the absolute difference between each dish's total_calories and the target_calories
+    calorie_deviation = np.abs(available_dishes['total_calories'].to_numpy(dtype=float) - target_calories)
 
-    # Calculate deviation for each macronutrient
+    # 2. Calculate a 'macronutrient deviation score' for each dish
+    macro_deviation = np.zeros(len(available_dishes))
     for macro, target_ratio in target_macro_profile.items():
         # Multiply target ratio by 100 to compare with percentage columns (e.g., fat_pc)
         target_percentage = target_ratio * 100
-        available_dishes['macro_deviation'] += abs(available_dishes[f'{macro}_pc'] - target_percentage)
+        macro_deviation += np.abs(available_dishes[f'{macro}_pc'].to_numpy(dtype=float) - target_percentage)
 
-    # 4. Combine these two deviation measures into a single score
+    # 3. Combine these two deviation measures into a single score
     # Using equal weights for now, can be adjusted if needed
-    available_dishes['combined_score'] = available_dishes['calorie_deviation'] + available_dishes['macro_deviation']
+    combined_score = calorie_deviation + macro_deviation
+
+    # 4. Rank the allowed dishes once; the best is selected, the rest are alternatives
+    ranked = rank_dishes(combined_score, mask, 1 + num_alternatives)
+    if len(ranked) == 0:
+        raise ValueError("No dishes available for this meal")
 
-    # 5. Identify the dish with the lowest combined score
-    selected_dish_row = available_dishes.loc[available_dishes['combined_score'].idxmin()]
+    selected_dish_row = available_dishes.iloc[ranked[0]]
     selected_dish_id = selected_dish_row['dish']
 
-    # 6. Return the selected dish as a pandas Series and its dish ID
-    return selected_dish_row, selected_dish_id
+    # 5. Return the selected dish as a pandas Series, its dish ID and the alternatives
+    return selected_dish_row, selected_dish_id, available_dishes.iloc[ranked[1:]]
 
 
-def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distribution_ratios=None, target_macro_ratios=None) -> list:
-    daily_calorie_target = total_calories
-    num_meals = meals_per_day
-    
-    # Use provided ratios or calculate defaults based on number of meals
-    if calorie_distribution_ratios is None:
-        # Calculate calorie distribution ratios based on number of meals
-        if num_meals == 2:
-            # Breakfast and Dinner - more calories for dinner
-            calorie_distribution_ratios = [0.40, 0.60]
-        elif num_meals == 3:
-            # Breakfast, Lunch, Dinner
-            calorie_distribution_ratios = [0.25, 0.40, 0.35]
-        elif num_meals == 4:
-            # Breakfast, Mid-Morning, Lunch, Dinner
-            calorie_distribution_ratios = [0.20, 0.15, 0.35, 0.30]
-        else:
-            # Default: equal distribution
-            calorie_distribution_ratios = [1.0 / num_meals] * num_meals
-        
-        # Ensure ratios sum to exactly 1.0 to prevent exceeding target
-        ratio_sum = sum(calorie_distribution_ratios)
-        if ratio_sum != 1.0:
-            calorie_distribution_ratios = [r / ratio_sum for r in calorie_distribution_ratios]
-    else:
-        # Ensure provided ratios match number of meals
-        if len(calorie_distribution_ratios) != num_meals:
-            # If mismatch, use default for that number of meals
-            if num_meals == 2:
-                calorie_distribution_ratios = [0.40, 0.60]
-            elif num_meals == 3:
-                calorie_distribution_ratios = [0.25, 0.40, 0.35]
-            elif num_meals == 4:
-                calorie_distribution_ratios = [0.20, 0.15, 0.35, 0.30]
-            else:
-                calorie_distribution_ratios = [1.0 / num_meals] * num_meals
-    
-    # Use provided macro ratios or defaults
-    if target_macro_ratios is None:
-        target_macro_ratios = {'fat': 0.30, 'carb': 0.45, 'protein': 0.25}
-    data = data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios)
+def build_meal_details(dish_row, catalog) -> dict:
+    """Turn a selected catalog row into a meal dictionary with its ingredients."""
+    meal = dish_row.to_dict()
+
+    # Look up the ingredients of the dish in the catalog index
+    meal['ingredients_list'] = get_dish_ingredients(catalog, meal['dish'])
+
+    # Record the catalog snapshot the dish came from (used to version image URLs)
+    meal['catalog_version'] = catalog['version']
+    return meal
+
+
+def build_alternative_details(alternative_rows, catalog, excluded_dish_ids, num_alternatives) -> list:
+    """Return up to num_alternatives meal dictionaries for dishes not in excluded_dish_ids."""
+    alternatives = []
+    for _, alternative_row in alternative_rows.iterrows():
+        if len(alternatives) == num_alternatives:
+            break
+        if alternative_row['dish'] in excluded_dish_ids:
+            continue
+        alternatives.append(build_meal_details(alternative_row, catalog))
+    return alternatives
+
+
+def summarize_meal_plan(meal_plan, daily_calorie_target, target_macro_ratios) -> dict:
+    """
+    Calculate the daily totals of a meal plan and its actual macronutrient split.
+
+    Returns:
+        dict: Target and actual calories, plus target/actual percentage and grams per macro.
+    """
+    # Calculate daily totals
+    total_plan_calories = sum(meal['total_calories'] for meal in meal_plan)
+    totals = {
+        'fat': sum(meal['total_fat'] for meal in meal_plan),
+        'carb': sum(meal['total_carb'] for meal in meal_plan),
+        'protein': sum(meal['total_protein'] for meal in meal_plan),
+    }
+    calories_per_gram = {'fat': 9, 'carb': 4, 'protein': 4}
+
+    macros = {}
+    for macro, grams in totals.items():
+        # Calculate actual macronutrient percentages for the meal plan
+        actual_pc = (grams * calories_per_gram[macro] / total_plan_calories) * 100 if total_plan_calories > 0 else 0
+        macros[macro] = {
+            'target_pc': target_macro_ratios.get(macro, 0) * 100,
+            'actual_pc': actual_pc,
+            'grams': grams,
+        }
+
+    return {
+        'target_calories': daily_calorie_target,
+        'actual_calories': total_plan_calories,
+        'macros': macros,
+    }
+
+
+def print_daily_summary(summary):
+    """Print the daily summary produced by summarize_meal_plan."""
+    print("\n--- Daily Summary ---")
+    print(f"Target Daily Calories: {summary['target_calories']:.1f} kcal")
+    print(f"Actual Plan Calories:  {summary['actual_calories']:.1f} kcal\n")
+
+    print("Macronutrient Breakdown:")
+    for label, macro in (("Fat", 'fat'), ("Carbs", 'carb'), ("Protein", 'protein')):
+        values = summary['macros'][macro]
+        print(f"  {label}: Target {values['target_pc']:.1f}% | Actual {values['actual_pc']:.1f}% ({values['grams']:.1f}g)")
+
+
+def select_meals(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios,
+                 num_candidates=0, exclude_ingredients=None, include_ingredients=None):
+    """
+    Select the dish of each meal slot in turn.
+
+    Yields:
+        tuple: (meal dictionary, next-best dish rows, catalog) as soon as each slot is decided.
+    """
+    with time_stage("meal_planner", "data_preparation"):
+        data = data_preparation(daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios)
     available_dishes = data['available_dishes']
-    dish_ingredients = data['dish_ingredients']
-    ingredients = data['ingredients']
+    catalog = data['catalog']
     meal_calorie_targets = data['meal_calorie_targets']
     
     # Ensure we only generate the requested number of meals
     if len(meal_calorie_targets) > num_meals:
         meal_calorie_targets = meal_calorie_targets[:num_meals]
     
-    meal_plan = []
+    dish_ids = catalog['dish_ids']
+    remaining = np.ones(len(available_dishes), dtype=bool)
+
+    # Apply allergen / dietary filters from the ingredient index before any scoring
+    with time_stage("meal_planner", "ingredient_filter"):
+        ingredient_mask = ingredient_filter_mask(catalog, exclude_ingredients, include_ingredients)
+    if ingredient_mask is not None:
+        remaining &= ingredient_mask
+        print(f"Dishes matching ingredient filters: {int(remaining.sum())}")
 
     for i, target_calorie in enumerate(meal_calorie_targets):
         print(f"\n--- Planning for Meal {i+1} with target calories: {target_calorie:.1f} kcal ---")
 
-        selected_dish_row, selected_dish_id = select_dish_for_meal(
-            target_calorie,
-            available_dishes,
-            target_macro_ratios
-        )
-
-        # Store the selected dish details
-        meal_plan.append(selected_dish_row.to_dict())
+        with time_stage("meal_planner", "scoring"):
+            selected_dish_row, selected_dish_id, alternative_rows = select_dish_for_meal(
+                target_calorie,
+                available_dishes,
+                target_macro_ratios,
+                mask=remaining,
+                num_alternatives=num_candidates
+            )
 
         print(f"Selected dish for Meal {i+1}: {selected_dish_id} with {selected_dish_row['total_calories']:.1f} kcal")
         
@@ -170,49 +288,218 @@ def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distri
         logger.info(f"  Mass: {meal_mass:.1f}g")
         logger.info(f"  Calories: {selected_dish_row['total_calories']:.1f} kcal")
 
-        # Remove the selected dish from available_dishes for subsequent meals
-        available_dishes = available_dishes[available_dishes['dish'] != selected_dish_id].copy()
-        print(f"Remaining available dishes: {available_dishes.shape[0]}")
+        # Remove the selected dish from the candidates of subsequent meals
+        remaining &= dish_ids != selected_dish_id
+        print(f"Remaining available dishes: {int(remaining.sum())}")
+
+        yield build_meal_details(selected_dish_row, catalog), alternative_rows, catalog
 
-    # Build full meal plan details with ingredients
-    full_meal_plan_details = []
 
-    for meal in meal_plan:
-        dish_id = meal['dish']
+def generate_meal_plan(total_calories: float, meals_per_day: int, calorie_distribution_ratios=None, target_macro_ratios=None,
+                       num_alternatives: int = 0, exclude_ingredients=None, include_ingredients=None) -> list:
+    daily_calorie_target = total_calories
+    num_meals = meals_per_day
+    
+    # Use provided ratios or calculate defaults based on number of meals
+    calorie_distribution_ratios = resolve_calorie_distribution(num_meals, calorie_distribution_ratios)
 
-        # Filter dish_ingredients for the current dish_id
-        ingredients_for_dish = dish_ingredients[dish_ingredients['dish_id'] == dish_id]['ingr_name'].tolist()
+    # Use provided macro ratios or defaults
+    target_macro_ratios = resolve_macro_ratios(target_macro_ratios)
 
-        # Add the list of ingredients to the meal dictionary
-        meal['ingredients_list'] = ingredients_for_dish
+    # Later meals may pick one of an earlier meal's alternatives, so rank a few extra
+    # candidates and drop the ones that end up selected
+    num_candidates = num_alternatives + num_meals if num_alternatives > 0 else 0
 
-        # Append the updated meal dictionary to the full_meal_plan_details list
+    full_meal_plan_details = []
+    meal_alternatives = []
+    catalog = None
+    for meal, alternative_rows, catalog in select_meals(
+        daily_calorie_target, num_meals, calorie_distribution_ratios, target_macro_ratios,
+        num_candidates, exclude_ingredients, include_ingredients
+    ):
         full_meal_plan_details.append(meal)
+        meal_alternatives.append(alternative_rows)
 
-    # Calculate daily totals
-    total_plan_calories = sum(meal['total_calories'] for meal in full_meal_plan_details)
-    total_plan_fat = sum(meal['total_fat'] for meal in full_meal_plan_details)
-    total_plan_carb = sum(meal['total_carb'] for meal in full_meal_plan_details)
-    total_plan_protein = sum(meal['total_protein'] for meal in full_meal_plan_details)
+    if num_alternatives > 0:
+        # Attach the best alternatives that were not selected for another meal
+        selected_ids = {meal['dish'] for meal in full_meal_plan_details}
+        for meal, alternative_rows in zip(full_meal_plan_details, meal_alternatives):
+            meal['alternatives'] = build_alternative_details(alternative_rows, catalog, selected_ids, num_alternatives)
 
-    print("\n--- Daily Summary ---")
-    print(f"Target Daily Calories: {daily_calorie_target:.1f} kcal")
-    print(f"Actual Plan Calories:  {total_plan_calories:.1f} kcal\n")
+    print_daily_summary(summarize_meal_plan(full_meal_plan_details, daily_calorie_target, target_macro_ratios))
 
-    print("Macronutrient Breakdown:")
+    return full_meal_plan_details
 
-    # Calculate actual macronutrient percentages for the meal plan
-    if total_plan_calories > 0:
-        actual_fat_pc = (total_plan_fat * 9 / total_plan_calories) * 100
-        actual_carb_pc = (total_plan_carb * 4 / total_plan_calories) * 100
-        actual_protein_pc = (total_plan_protein * 4 / total_plan_calories) * 100
-    else:
-        actual_fat_pc = 0
-        actual_carb_pc = 0
-        actual_protein_pc = 0
 
-    print(f"  Fat: Target {target_macro_ratios['fat']*100:.1f}% | Actual {actual_fat_pc:.1f}% ({total_plan_fat:.1f}g)")
-    print(f"  Carbs: Target {target_macro_ratios['carb']*100:.1f}% | Actual {actual_carb_pc:.1f}% ({total_plan_carb:.1f}g)")
-    print(f"  Protein: Target {target_macro_ratios['protein']*100:.1f}% | Actual {actual_protein_pc:.1f}% ({total_plan_protein:.1f}g)")
+def iter_meal_plan(total_calories: float, meals_per_day: int, calorie_distribution_ratios=None, target_macro_ratios=None,
+                   num_alternatives: int = 0, exclude_ingredients=None, include_ingredients=None):
+    """
+    Plan a day of meals like generate_meal_plan, yielding each meal as soon as its slot is decided.
+
+    Alternatives of a streamed meal can only exclude the dishes selected so far,
+    so one of them may be picked for a later meal of the same day.
 
-    return full_meal_plan_details
+    Yields:
+        tuple: ('meal', meal dictionary) for each meal slot, then ('summary', daily summary)
+               as returned by summarize_meal_plan.
+    """
+    calorie_distribution_ratios = resolve_calorie_distribution(meals_per_day, calorie_distribution_ratios)
+    target_macro_ratios = resolve_macro_ratios(target_macro_ratios)
+    num_candidates = num_alternatives + meals_per_day if num_alternatives > 0 else 0
+
+    meal_plan = []
+    selected_ids = set()
+    for meal, alternative_rows, catalog in select_meals(
+        total_calories, meals_per_day, calorie_distribution_ratios, target_macro_ratios,
+        num_candidates, exclude_ingredients, include_ingredients
+    ):
+        selected_ids.add(meal['dish'])
+        if num_alternatives > 0:
+            meal['alternatives'] = build_alternative_details(alternative_rows, catalog, selected_ids, num_alternatives)
+        meal_plan.append(meal)
+        yield 'meal', meal
+
+    yield 'summary', summarize_meal_plan(meal_plan, total_calories, target_macro_ratios)
+
+
+def generate_weekly_meal_plan(total_calories: float, meals_per_day: int, num_days: int = 7,
+                              calorie_distribution_ratios=None, target_macro_ratios=None,
+                              dish_repeat_window: int = 0, key_ingredients=None,
+                              ingredient_repeat_window: int = 0, num_alternatives: int = 0,
+                              exclude_ingredients=None, include_ingredients=None, catalog=None) -> list:
+    """
+    Generate meal plans for several days in one pass over the shared dish catalog.
+
+    Every meal slot is scored against the whole catalog once; each day then
+    walks the ranked candidates of its slots and skips dishes that break the
+    variety constraints.
+
+    Args:
+        total_calories (float): Daily calorie target.
+        meals_per_day (int): Number of meals per day.
+        num_days (int): Number of days to plan.
+        calorie_distribution_ratios (list): Optional calorie ratio per meal.
+        target_macro_ratios (dict): Optional target ratios for 'fat', 'carb', 'protein'.
+        dish_repeat_window (int): A dish used on a day cannot be used again
+                                  on the following `dish_repeat_window` days.
+        key_ingredients (list): Ingredient names tracked by `ingredient_repeat_window`.
+        ingredient_repeat_window (int): A key ingredient used on a day cannot be used
+                                        again on the following `ingredient_repeat_window` days.
+        num_alternatives (int): Number of next-best dishes attached to each meal as 'alternatives'.
+        exclude_ingredients (list): Dishes containing any of these ingredients are never planned.
+        include_ingredients (list): If given, only dishes containing at least one of these are planned.
+        catalog (dict): Dish catalog to plan from. If None, uses the shared catalog.
+
+    Returns:
+        list: One list of meal dictionaries (same shape as generate_meal_plan) per day.
+    """
+    if catalog is None:
+        catalog = get_dish_catalog()
+
+    calorie_distribution_ratios = resolve_calorie_distribution(meals_per_day, calorie_distribution_ratios)
+    target_macro_ratios = resolve_macro_ratios(target_macro_ratios)
+    meal_calorie_targets = [ratio * total_calories for ratio in calorie_distribution_ratios][:meals_per_day]
+
+    available_dishes = catalog['available_dishes']
+    dish_ids = catalog['dish_ids']
+
+    # Rank every dish for every meal slot once; the ranking is shared by all days
+    with time_stage("meal_planner", "weekly_scoring"):
+        scores = score_dishes(catalog, meal_calorie_targets, target_macro_ratios)
+        ranked_candidates = np.argsort(scores, axis=1, kind='stable')
+
+    # Drop dishes rejected by the ingredient filters from every slot's ranking
+    ingredient_mask = ingredient_filter_mask(catalog, exclude_ingredients, include_ingredients)
+    if ingredient_mask is not None:
+        ranked_candidates = [ranked[ingredient_mask[ranked]] for ranked in ranked_candidates]
+        if len(ranked_candidates) and len(ranked_candidates[0]) == 0:
+            raise ValueError("No dishes match the ingredient filters")
+
+    # Key ingredients of each dish, only needed for the ingredient window
+    key_ingredients = {name.lower() for name in (key_ingredients or [])}
+    dish_key_ingredients = {}
+    if key_ingredients and ingredient_repeat_window > 0:
+        for dish_id, names in catalog['dish_ingredient_index'].items():
+            tracked = {str(name).lower() for name in names} & key_ingredients
+            if tracked:
+                dish_key_ingredients[dish_id] = tracked
+
+    def repeats_recent(dish_id, recent_dishes, recent_ingredients):
+        return dish_id in recent_dishes or bool(dish_key_ingredients.get(dish_id, set()) & recent_ingredients)
+
+    def plan_day(recent_dishes, recent_ingredients):
+        day_dishes = set()
+        day_rows = []
+        for slot in range(len(meal_calorie_targets)):
+            fallback = None
+            chosen = None
+            for position in ranked_candidates[slot]:
+                dish_id = dish_ids[position]
+                if dish_id in day_dishes:
+                    continue
+                if fallback is None:
+                    fallback = position
+                if repeats_recent(dish_id, recent_dishes, recent_ingredients):
+                    continue
+                chosen = position
+                break
+            if chosen is None:
+                # Variety constraints exhausted the catalog, relax them for this slot
+                logger.warning(f"No dish satisfies the repeat windows for meal {slot + 1}, allowing a repeat")
+                chosen = fallback
+            if chosen is None:
+                # Same error as generate_meal_plan: the filters leave fewer dishes than meals
+                raise ValueError("No dishes available for this meal")
+            day_dishes.add(dish_ids[chosen])
+            day_rows.append(chosen)
+
+        # Alternatives follow the same variety rules as the selected dishes
+        day_alternatives = []
+        for slot in range(len(day_rows)):
+            alternatives = []
+            for position in ranked_candidates[slot]:
+                if len(alternatives) == num_alternatives:
+                    break
+                dish_id = dish_ids[position]
+                if dish_id in day_dishes or repeats_recent(dish_id, recent_dishes, recent_ingredients):
+                    continue
+                alternatives.append(position)
+            day_alternatives.append(alternatives)
+        return day_rows, day_alternatives
+
+    if dish_repeat_window <= 0 and (not dish_key_ingredients or ingredient_repeat_window <= 0):
+        # No constraint links the days together, so every day gets the same plan
+        day_rows, day_alternatives = plan_day(set(), set())
+        planned_rows = [day_rows] * num_days
+        planned_alternatives = [day_alternatives] * num_days
+    else:
+        planned_rows = []
+        planned_alternatives = []
+        for day in range(num_days):
+            recent_dishes = set()
+            for previous in planned_rows[max(0, day - dish_repeat_window):day] if dish_repeat_window > 0 else []:
+                recent_dishes.update(dish_ids[position] for position in previous)
+            recent_ingredients = set()
+            for previous in planned_rows[max(0, day - ingredient_repeat_window):day] if ingredient_repeat_window > 0 else []:
+                for position in previous:
+                    recent_ingredients.update(dish_key_ingredients.get(dish_ids[position], set()))
+            day_rows, day_alternatives = plan_day(recent_dishes, recent_ingredients)
+            planned_rows.append(day_rows)
+            planned_alternatives.append(day_alternatives)
+
+    # Build full meal plan details with ingredients
+    weekly_plan = []
+    for day_rows, day_alternatives in zip(planned_rows, planned_alternatives):
+        day_plan = []
+        for position, alternative_positions in zip(day_rows, day_alternatives):
+            meal = build_meal_details(available_dishes.iloc[position], catalog)
+            if num_alternatives > 0:
+                meal['alternatives'] = [
+                    build_meal_details(available_dishes.iloc[alternative_position], catalog)
+                    for alternative_position in alternative_positions
+                ]
+            day_plan.append(meal)
+        weekly_plan.append(day_plan)
+
+    logger.info(f"Planned {num_days} days x {len(meal_calorie_targets)} meals from {len(dish_ids)} dishes")
+    return weekly_plan
@@ -13,6 +13,9 @@ import io
 from pathlib import Path
 import tempfile
 
+from services.metrics import time_stage
+
+
 def calories_from_macro(protein, carbs, fat):
     """Calculate calories from macronutrients."""
     return protein * 4 + carbs * 4 + fat * 9
@@ -126,7 +129,7 @@ def predict_nutrients_from_image(image_file, model_path: str = None) -> dict:
         
         # Suppress optimizer warnings since we're only using the model for inference
         import warnings
-        with warnings.catch_warnings():
+        with warnings.catch_warnings(), time_stage("nutrients_predictor", "model_load"):
             warnings.filterwarnings("ignore", category=UserWarning, message=".*optimizer.*")
             portion_independent = tf.keras.models.load_model(str(model_path), compile=False)
         
@@ -141,17 +144,19 @@ def predict_nutrients_from_image(image_file, model_path: str = None) -> dict:
             image_file.file.seek(0)
             
             # Create a temporary file to save the image
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(image_bytes)
-                temp_file_path = temp_file.name
+            with time_stage("nutrients_predictor", "temp_file_io"):
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+                    temp_file.write(image_bytes)
+                    temp_file_path = temp_file.name
             
             # Load image using TensorFlow's utility function
             # This automatically handles image decoding and resizing to target_size
-            user_img = tf.keras.utils.load_img(temp_file_path, target_size=(320, 320))
-            
-            img_320 = user_img.resize((320, 320))
-            x_image_model = np.array(img_320)
-            x_image_model = np.expand_dims(x_image_model, axis=0)
+            with time_stage("nutrients_predictor", "decode"):
+                user_img = tf.keras.utils.load_img(temp_file_path, target_size=(320, 320))
+                
+                img_320 = user_img.resize((320, 320))
+                x_image_model = np.array(img_320)
+                x_image_model = np.expand_dims(x_image_model, axis=0)
 
             # The x_regression_models variable is already correctly sized for 320x320
             x_regression_models = x_image_model.copy() # Simply assign the same processed image for consistency
@@ -163,7 +168,8 @@ def predict_nutrients_from_image(image_file, model_path: str = None) -> dict:
                 os.unlink(temp_file_path)
         
         # Make prediction
-        prediction_output = make_portion_independent_prediction(x_image_model, portion_independent, 100)
+        with time_stage("nutrients_predictor", "inference"):
+            prediction_output = make_portion_independent_prediction(x_image_model, portion_independent, 100)
         
         # prediction_output is a dictionary with the following keys:
         # 'protein': the predicted protein in grams
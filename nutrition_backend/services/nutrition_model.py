@@ -0,0 +1,431 @@
+"""
+Nutrition Model Service
+
+This module serves the tabular nutrition model trained by train.py (a
+ColumnTransformer of StandardScaler/OneHotEncoder feeding a
+MultiOutputRegressor of RandomForests). Single requests skip the pandas
+DataFrame and ColumnTransformer round trip: features are encoded straight
+into a NumPy row from the fitted scaler/encoder parameters and the forests
+run with a serving-time n_jobs instead of the n_jobs=-1 they were trained with.
+With one thread, the forests are compiled into flat node arrays
+(CompiledForest) and evaluated for all targets in one vectorized pass.
+
+The compiled arrays can be saved as .npy files and loaded with mmap_mode, so
+every worker maps the same read-only pages instead of unpickling its own copy
+of the forests (sklearn trees copy their node arrays when unpickled).
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import weakref
+from pathlib import Path
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+
+from services.metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+# Threads per forest at serving time; one row does not amortize a joblib dispatch over every core
+NUTRITION_MODEL_N_JOBS = int(os.getenv("NUTRITION_MODEL_N_JOBS", "1"))
+
+# Pickled sklearn pipeline written by train.py, and its compiled flat-array export
+NUTRITION_MODEL_PATH = os.getenv("NUTRITION_MODEL_PATH", "artifacts/nutrition_model.pkl")
+NUTRITION_MODEL_COMPILED_PATH = os.getenv("NUTRITION_MODEL_COMPILED_PATH", "artifacts/nutrition_model_compiled")
+
+# How the serving model was loaded (see load_nutrition_model)
+NUTRITION_MODEL_STATUS = {"source": None}
+
+
+class CompiledForest:
+    """
+    All trees of one or more RandomForestRegressors flattened into contiguous node arrays.
+
+    Either one single-output forest per target (MultiOutputRegressor) or one native
+    multi-output forest, whose leaves hold every target (value is then 2-D).
+
+    Nodes of every tree are stored back to back (leaves point at themselves), so a
+    batch of rows is walked through all trees at once, one level per step.
+    """
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'tree_targets', 'is_leaf')
+
+    def __init__(self, feature, threshold, left, right, value, roots, tree_targets, max_depth, is_leaf=None):
+        """
+        Args:
+            feature (np.ndarray): Split feature of each node (0 for leaves).
+            threshold (np.ndarray): Split threshold of each node; rows with x <= threshold go left.
+            left (np.ndarray): Global index of each node's left child (itself for leaves).
+            right (np.ndarray): Global index of each node's right child (itself for leaves).
+            value (np.ndarray): Prediction of each node (only read at leaves); (n_nodes, n_targets) for a multi-output forest.
+            roots (np.ndarray): Global index of the root node of each tree.
+            tree_targets (np.ndarray): Target (output column) each tree predicts, in non-decreasing order.
+            max_depth (int): Depth of the deepest tree.
+            is_leaf (np.ndarray): Optional precomputed leaf flag of each node.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.tree_targets = tree_targets
+        self.max_depth = int(max_depth)
+        self.is_leaf = is_leaf if is_leaf is not None else left == np.arange(len(left))
+        if value.ndim == 2:
+            # One multi-output forest: every tree predicts every target
+            self.num_targets = value.shape[1]
+        else:
+            self.num_targets = int(tree_targets[-1]) + 1 if len(tree_targets) else 0
+        self.target_starts = np.searchsorted(tree_targets, np.arange(self.num_targets))
+        self.trees_per_target = np.bincount(tree_targets, minlength=self.num_targets)
+
+    @classmethod
+    def from_estimators(cls, estimators):
+        """
+        Compile fitted single-output forests, one per target, or a single multi-output forest.
+
+        Raises:
+            ValueError: If an estimator is not a fitted tree ensemble of that shape
+        """
+        multi_output = (
+            len(estimators) == 1
+            and isinstance(estimators[0], (RandomForestRegressor, ExtraTreesRegressor))
+            and estimators[0].n_outputs_ > 1
+        )
+        features, thresholds, lefts, rights, values = [], [], [], [], []
+        roots, tree_targets = [], []
+        offset = 0
+        max_depth = 0
+        for target, estimator in enumerate(estimators):
+            if not isinstance(estimator, (RandomForestRegressor, ExtraTreesRegressor)) or (
+                estimator.n_outputs_ != 1 and not multi_output
+            ):
+                raise ValueError(f"Cannot compile estimator {type(estimator).__name__}")
+            for tree in estimator.estimators_:
+                tree = tree.tree_
+                nodes = np.arange(tree.node_count)
+                is_leaf = tree.children_left == -1
+                features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+                thresholds.append(tree.threshold.astype(np.float64))
+                lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+                rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+                values.append((tree.value[:, :, 0] if multi_output else tree.value[:, 0, 0]).astype(np.float64))
+                roots.append(offset)
+                tree_targets.append(target)
+                max_depth = max(max_depth, tree.max_depth)
+                offset += tree.node_count
+
+        return cls(
+            np.concatenate(features),
+            np.concatenate(thresholds),
+            np.concatenate(lefts).astype(np.intp),
+            np.concatenate(rights).astype(np.intp),
+            np.concatenate(values),
+            np.asarray(roots, dtype=np.intp),
+            np.asarray(tree_targets, dtype=np.intp),
+            max_depth,
+        )
+
+    def save(self, directory):
+        """Write every node array as an .npy file (loadable with mmap_mode) into directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, directory, max_depth: int, mmap_mode='r'):
+        """
+        Load node arrays written by save.
+
+        With mmap_mode='r' the arrays are read-only memory maps, shared between processes.
+        """
+        directory = Path(directory)
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(max_depth=max_depth, **arrays)
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Predict every target for a batch of encoded rows.
+
+        Args:
+            X (np.ndarray): (n_rows, n_features) encoded rows.
+
+        Returns:
+            np.ndarray: (n_rows, num_targets) forest averages, like model.predict.
+        """
+        # Trees are fitted on float32 features and compare them against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        num_rows, num_features = X.shape
+        flat_X = X.ravel()
+
+        # Current node of every (row, tree) pair, row-major; pairs drop out once they reach a leaf
+        nodes = np.tile(self.roots, num_rows)
+        feature_offsets = np.repeat(np.arange(num_rows, dtype=np.intp) * num_features, self.num_trees)
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            goes_left = flat_X[feature_offsets[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(goes_left, self.left[current], self.right[current])
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+
+        if self.value.ndim == 2:
+            return self.value[nodes].reshape(num_rows, self.num_trees, self.num_targets).mean(axis=1)
+        leaf_values = self.value[nodes].reshape(num_rows, self.num_trees)
+        return np.add.reduceat(leaf_values, self.target_starts, axis=1) / self.trees_per_target
+
+
+class FastNutritionPredictor:
+    """Single-row inference for a fitted nutrition pipeline."""
+
+    def __init__(self, pipeline, n_jobs: int = NUTRITION_MODEL_N_JOBS):
+        """
+        Args:
+            pipeline: Fitted sklearn Pipeline with 'preprocess' and 'regressor' steps (a
+                MultiOutputRegressor or a native multi-output regressor).
+            n_jobs (int): n_jobs set on every forest of the regressor.
+
+        Raises:
+            ValueError: If the pipeline uses preprocessing this encoder does not reproduce
+        """
+        if not isinstance(pipeline, Pipeline):
+            raise ValueError(f"Expected a fitted sklearn Pipeline, got {type(pipeline).__name__}")
+        preprocess = pipeline.named_steps['preprocess']
+        regressor = pipeline.named_steps['regressor']
+
+        # Each encoder step writes a contiguous slice of the feature row
+        self.numeric_columns = []
+        self.numeric_mean = []
+        self.numeric_scale = []
+        self.categorical_columns = []
+        offset = 0
+        for name, transformer, columns in preprocess.transformers_:
+            if transformer == 'drop' or len(columns) == 0:
+                continue
+            kind = type(transformer).__name__
+            if kind == 'StandardScaler':
+                mean = transformer.mean_ if transformer.mean_ is not None else np.zeros(len(columns))
+                scale = transformer.scale_ if transformer.scale_ is not None else np.ones(len(columns))
+                self.numeric_columns.append((offset, list(columns)))
+                self.numeric_mean.append(np.asarray(mean, dtype=np.float64))
+                self.numeric_scale.append(np.asarray(scale, dtype=np.float64))
+                offset += len(columns)
+            elif kind == 'OneHotEncoder':
+                if transformer.drop_idx_ is not None or getattr(transformer, 'infrequent_categories_', None):
+                    raise ValueError(f"Unsupported OneHotEncoder options in transformer '{name}'")
+                for column, categories in zip(columns, transformer.categories_):
+                    positions = {category: offset + i for i, category in enumerate(categories)}
+                    self.categorical_columns.append((column, positions))
+                    offset += len(categories)
+            else:
+                raise ValueError(f"Unsupported transformer '{name}' ({kind})")
+
+        self.num_features = offset
+        self.n_jobs = n_jobs
+        self.regressor = regressor
+        # MultiOutputRegressor fits one estimator per target; native multi-output forests are used as is
+        self.estimators = list(regressor.estimators_) if isinstance(regressor, MultiOutputRegressor) else [regressor]
+        for estimator in self.estimators:
+            if hasattr(estimator, 'n_jobs'):
+                estimator.n_jobs = n_jobs
+
+        # With one serving thread, evaluate the compiled forests: forest.predict would
+        # re-validate the rows and dispatch a joblib job per tree
+        self.compiled = None
+        if n_jobs == 1:
+            try:
+                self.compiled = CompiledForest.from_estimators(self.estimators)
+            except ValueError as e:
+                logger.info(f"Using the forests' own predict: {e}")
+
+    def save(self, directory):
+        """
+        Save the encoder parameters and compiled forests, so the predictor loads without sklearn objects.
+
+        Raises:
+            ValueError: If the forests were not compiled (n_jobs other than 1)
+        """
+        if self.compiled is None:
+            raise ValueError("Only predictors with compiled forests can be saved")
+        directory = Path(directory)
+        self.compiled.save(directory)
+        encoder = {
+            'num_features': self.num_features,
+            'numeric_columns': self.numeric_columns,
+            'numeric_mean': [mean.tolist() for mean in self.numeric_mean],
+            'numeric_scale': [scale.tolist() for scale in self.numeric_scale],
+            'categorical_columns': self.categorical_columns,
+            'max_depth': self.compiled.max_depth,
+        }
+        # Write the metadata last: its presence marks a complete export
+        with open(directory / 'encoder.json', 'w') as f:
+            json.dump(encoder, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Load a predictor written by save, memory-mapping the node arrays.
+
+        Raises:
+            FileNotFoundError: If the directory holds no complete export
+        """
+        directory = Path(directory)
+        with open(directory / 'encoder.json', 'r') as f:
+            encoder = json.load(f)
+
+        predictor = cls.__new__(cls)
+        predictor.num_features = encoder['num_features']
+        predictor.numeric_columns = [(offset, columns) for offset, columns in encoder['numeric_columns']]
+        predictor.numeric_mean = [np.asarray(mean, dtype=np.float64) for mean in encoder['numeric_mean']]
+        predictor.numeric_scale = [np.asarray(scale, dtype=np.float64) for scale in encoder['numeric_scale']]
+        predictor.categorical_columns = [(column, positions) for column, positions in encoder['categorical_columns']]
+        predictor.n_jobs = 1
+        predictor.regressor = None
+        predictor.estimators = []
+        predictor.compiled = CompiledForest.load(directory, encoder['max_depth'], mmap_mode=mmap_mode)
+        return predictor
+
+    def encode(self, features: dict) -> np.ndarray:
+        """Encode one input dictionary into a (1, num_features) row, like the ColumnTransformer."""
+        return self.encode_batch([features])
+
+    def encode_batch(self, rows: list) -> np.ndarray:
+        """Encode input dictionaries into a (len(rows), num_features) matrix, like the ColumnTransformer."""
+        X = np.zeros((len(rows), self.num_features), dtype=np.float64)
+        for (offset, columns), mean, scale in zip(self.numeric_columns, self.numeric_mean, self.numeric_scale):
+            values = np.array([[float(features[column]) for column in columns] for features in rows]).reshape(len(rows), len(columns))
+            X[:, offset:offset + len(columns)] = (values - mean) / scale
+        for column, positions in self.categorical_columns:
+            for i, features in enumerate(rows):
+                # Unknown categories encode as all zeros (handle_unknown="ignore")
+                position = positions.get(features[column])
+                if position is not None:
+                    X[i, position] = 1.0
+        return X
+
+    def predict(self, features: dict) -> np.ndarray:
+        """Return the predicted targets of one input dictionary, in training target order."""
+        return self.predict_batch([features])[0]
+
+    def predict_batch(self, rows: list) -> np.ndarray:
+        """Return a (len(rows), num_targets) array of predicted targets."""
+        with time_stage("nutrition_model", "encode"):
+            X = self.encode_batch(rows)
+        with time_stage("nutrition_model", "inference"):
+            if self.compiled is not None:
+                return self.compiled.predict(X)
+            return np.asarray(self.regressor.predict(X)).reshape(len(rows), -1)
+
+
+# Predictors built per loaded model object, so swapping the model rebuilds its predictor
+_FAST_PREDICTORS = weakref.WeakKeyDictionary()
+
+
+def get_fast_predictor(model):
+    """
+    Return the FastNutritionPredictor of a loaded model.
+
+    Returns:
+        FastNutritionPredictor: Predictor for the model, or None if the model is not
+        a pipeline this module can encode for (callers fall back to model.predict).
+    """
+    if isinstance(model, FastNutritionPredictor):
+        return model
+
+    try:
+        return _FAST_PREDICTORS[model]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+
+    try:
+        predictor = FastNutritionPredictor(model)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.info(f"Fast nutrition inference unavailable, using model.predict: {e}")
+        predictor = None
+    _FAST_PREDICTORS[model] = predictor
+    return predictor
+
+
+def resident_set_size():
+    """Return the current resident set size of this process in bytes (peak RSS without /proc)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def load_nutrition_model(model_path=None, compiled_path=None):
+    """
+    Load the serving nutrition model, preferring the memory-mapped compiled export.
+
+    The compiled export is used when it exists and is not older than the pickle;
+    otherwise the pickled pipeline is loaded with joblib. Load time and resident
+    size are recorded in NUTRITION_MODEL_STATUS.
+
+    Returns:
+        FastNutritionPredictor or Pipeline: The loaded model, or None if no artifact exists.
+    """
+    import joblib
+
+    model_path = Path(model_path or NUTRITION_MODEL_PATH)
+    compiled_path = Path(compiled_path or NUTRITION_MODEL_COMPILED_PATH)
+    compiled_meta = compiled_path / 'encoder.json'
+
+    rss_before = resident_set_size()
+    start = time.perf_counter()
+    model = None
+    source = None
+    if compiled_meta.exists() and (
+        not model_path.exists() or compiled_meta.stat().st_mtime >= model_path.stat().st_mtime
+    ):
+        model = FastNutritionPredictor.load(compiled_path)
+        source = str(compiled_path)
+    elif model_path.exists():
+        if compiled_meta.exists():
+            logger.warning(f"{compiled_path} is older than {model_path}; loading the pickle")
+        model = joblib.load(model_path)
+        source = str(model_path)
+    load_seconds = time.perf_counter() - start
+
+    NUTRITION_MODEL_STATUS.clear()
+    NUTRITION_MODEL_STATUS.update({
+        'source': source,
+        'memory_mapped': isinstance(model, FastNutritionPredictor),
+        'load_seconds': round(load_seconds, 4),
+        'rss_bytes': resident_set_size(),
+        'rss_delta_bytes': resident_set_size() - rss_before,
+    })
+    if isinstance(model, FastNutritionPredictor):
+        NUTRITION_MODEL_STATUS['mapped_bytes'] = model.compiled.nbytes
+    if source:
+        logger.info(
+            f"Loaded nutrition model from {source} in {load_seconds * 1000:.1f} ms "
+            f"(RSS +{NUTRITION_MODEL_STATUS['rss_delta_bytes'] / 2**20:.1f} MiB)"
+        )
+    return model
+
+
+def get_nutrition_model_status() -> dict:
+    """Return how the serving nutrition model was loaded."""
+    return dict(NUTRITION_MODEL_STATUS)
@@ -0,0 +1,314 @@
+"""
+Cold archive of old predictions.
+
+The retention job (archive_predictions.py) moves predictions older than the
+retention age out of the hot `predictions` table into zstd-compressed Parquet
+files, then deletes them from the table in batches. Each run streams the rows
+of a month into a new part file (predictions-YYYY-MM-<n>.parquet), one row
+group per batch, so neither memory nor the write depends on the size of the
+month and earlier parts are never rewritten.
+
+Rows are read in (user_id, created_at DESC, id) order, so each part is sorted
+that way and reading one user's rows only touches the row groups whose
+user_id range contains the user.
+The `archived_user_months` table records which months hold rows of each user;
+/history continues into those months (and no others) once a user's hot rows
+run out.
+"""
+
+import logging
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import DateTime, Float, Integer, delete, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database_models import ArchivedUserMonth, Prediction
+
+logger = logging.getLogger(__name__)
+
+# Directory of the monthly archive files (predictions-YYYY-MM-<part>.parquet)
+PREDICTION_ARCHIVE_PATH = os.getenv("PREDICTION_ARCHIVE_PATH", "archive/predictions")
+# Rows older than this many days are archived
+PREDICTION_RETENTION_DAYS = int(os.getenv("PREDICTION_RETENTION_DAYS", "365"))
+# Rows per read / delete batch of the retention job, and per Parquet row group
+# (smaller groups skip more data when reading one user)
+PREDICTION_ARCHIVE_BATCH_SIZE = int(os.getenv("PREDICTION_ARCHIVE_BATCH_SIZE", "10000"))
+
+ARROW_TYPES = {Integer: pa.int64(), Float: pa.float64(), DateTime: pa.timestamp("us")}
+
+# One Arrow field per predictions column
+ARCHIVE_SCHEMA = pa.schema([
+    pa.field(column.name, next((arrow for sql, arrow in ARROW_TYPES.items() if isinstance(column.type, sql)), pa.string()))
+    for column in Prediction.__table__.columns
+])
+
+ARCHIVE_FILE_PATTERN = re.compile(r"predictions-(\d{4}-\d{2})(?:-(\d+))?\.parquet")
+
+# Row order of each part (the order of ix_predictions_user_id_created_at_id)
+ARCHIVE_SORT_KEYS = [("user_id", "ascending"), ("created_at", "descending"), ("id", "ascending")]
+
+INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(start: datetime) -> datetime:
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def archive_file(archive_path, month: datetime, part: int) -> Path:
+    """Path of part `part` of the month starting at `month`."""
+    return Path(archive_path) / f"predictions-{month:%Y-%m}-{part}.parquet"
+
+
+def parse_archive_file(path: Path):
+    """(month start, part) of an archive file, or None for other files."""
+    match = ARCHIVE_FILE_PATTERN.fullmatch(path.name)
+    if match is None:
+        return None
+    # Archives written before part files existed hold one predictions-YYYY-MM.parquet (part 0)
+    return datetime.strptime(match.group(1), "%Y-%m"), int(match.group(2) or 0)
+
+
+def month_parts(archive_path, month: datetime) -> list:
+    """Paths of the part files of a month, in part order."""
+    root = Path(archive_path)
+    parts = []
+    for path in root.glob(f"predictions-{month:%Y-%m}*.parquet"):
+        parsed = parse_archive_file(path)
+        if parsed is not None and parsed[0] == month:
+            parts.append((parsed[1], path))
+    return [path for _, path in sorted(parts)]
+
+
+def archived_months(archive_path=None) -> list:
+    """(month start, part paths) of every archived month, newest first."""
+    root = Path(archive_path or PREDICTION_ARCHIVE_PATH)
+    if not root.is_dir():
+        return []
+    months = {}
+    for path in root.glob("predictions-*.parquet"):
+        parsed = parse_archive_file(path)
+        if parsed is not None:
+            months.setdefault(parsed[0], []).append((parsed[1], path))
+    return [(month, [path for _, path in sorted(parts)]) for month, parts in sorted(months.items(), reverse=True)]
+
+
+def archived_ids(paths) -> set:
+    """Ids already written to the given part files (only the id column is read)."""
+    return {id_ for path in paths for id_ in pq.read_table(path, columns=["id"])["id"].to_pylist()}
+
+
+def after_position(row):
+    """WHERE clause of the rows after `row` in (user_id, created_at DESC, id) order."""
+    return (Prediction.user_id > row["user_id"]) | ((Prediction.user_id == row["user_id"]) & (
+        (Prediction.created_at < row["created_at"])
+        | ((Prediction.created_at == row["created_at"]) & (Prediction.id > row["id"]))
+    ))
+
+
+def read_month_batches(db, in_month, batch_size: int):
+    """
+    Row dict batches of a month in (user_id, created_at DESC, id) order, walking the
+    /history index with a keyset; rows without a user_id follow in id order.
+    """
+    passes = [
+        (Prediction.user_id.is_not(None), [Prediction.user_id, Prediction.created_at.desc(), Prediction.id],
+         after_position),
+        (Prediction.user_id.is_(None), [Prediction.id], lambda row: Prediction.id > row["id"]),
+    ]
+    for condition, order, after in passes:
+        last = None
+        while True:
+            rows = db.execute(
+                select(*Prediction.__table__.columns)
+                .where(*in_month, condition, *([after(last)] if last is not None else []))
+                .order_by(*order)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+            last = rows[-1]
+
+
+def write_month_part(path: Path, batches) -> list:
+    """
+    Stream row batches into a new part file, one row group per batch.
+
+    The file is written under a temporary name and renamed once its footer is written,
+    so readers never open a partial part.
+
+    Returns:
+        list: Ids of the rows written, in batches.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    written = []
+    with pq.ParquetWriter(tmp_path, ARCHIVE_SCHEMA, compression="zstd") as writer:
+        for rows in batches:
+            writer.write_table(pa.Table.from_pylist(rows, schema=ARCHIVE_SCHEMA), row_group_size=len(rows))
+            written.append([row["id"] for row in rows])
+    if written:
+        os.replace(tmp_path, path)
+    else:
+        tmp_path.unlink()
+    return written
+
+
+def archived_users_insert(db):
+    """INSERT into archived_user_months for the session's database (add on_conflict_do_nothing)."""
+    return INSERTS[db.get_bind().dialect.name](ArchivedUserMonth)
+
+
+def archived_user_months_query(user_id: str, before=None):
+    """Archive months holding rows of a user, newest first (only months up to `before`, if given)."""
+    query = select(ArchivedUserMonth.month).where(ArchivedUserMonth.user_id == user_id)
+    if before is not None:
+        query = query.where(ArchivedUserMonth.month <= month_start(before[0]))
+    return query.order_by(ArchivedUserMonth.month.desc())
+
+
+def reindex_archive(session_factory, archive_path=None) -> int:
+    """
+    Rebuild archived_user_months from the user_id column of every month file
+    (for archives written before the table existed).
+
+    Returns:
+        int: Number of months indexed.
+    """
+    months = archived_months(archive_path)
+    with session_factory() as db:
+        for month, paths in months:
+            user_ids = pc.unique(pa.concat_arrays([
+                pq.read_table(path, columns=["user_id"])["user_id"].combine_chunks() for path in paths
+            ])).drop_null().to_pylist()
+            for start in range(0, len(user_ids), PREDICTION_ARCHIVE_BATCH_SIZE):
+                db.execute(archived_users_insert(db).values([
+                    {"user_id": user_id, "month": month} for user_id in user_ids[start:start + PREDICTION_ARCHIVE_BATCH_SIZE]
+                ]).on_conflict_do_nothing())
+            db.commit()
+    return len(months)
+
+
+def archive_predictions(session_factory, older_than: datetime, archive_path=None,
+                        batch_size: int = PREDICTION_ARCHIVE_BATCH_SIZE) -> dict:
+    """
+    Move predictions created before `older_than` into the monthly archive files.
+
+    Each month is read in batches of `batch_size` rows and streamed into a new part
+    file, one row group per batch. Once the part is complete, the users of the month
+    are recorded in archived_user_months, then the ids are deleted from the table,
+    one transaction per batch. A run interrupted before its deletes is completed by
+    the next run: ids already in an earlier part of the month are deleted without
+    being written again.
+
+    Args:
+        session_factory: Sync sessionmaker of the database.
+        older_than (datetime): Rows with created_at before this are archived.
+        archive_path: Directory of the month files (default PREDICTION_ARCHIVE_PATH).
+        batch_size (int): Rows per read, per row group and per delete transaction.
+
+    Returns:
+        dict: Archived row count per month ('YYYY-MM').
+    """
+    archive_path = archive_path or PREDICTION_ARCHIVE_PATH
+    archived = {}
+
+    with session_factory() as db:
+        oldest = db.scalar(select(func.min(Prediction.created_at)).where(Prediction.created_at < older_than))
+        if oldest is None:
+            return archived
+
+        month = month_start(oldest)
+        while month < older_than:
+            end = min(next_month(month), older_than)
+            in_month = (Prediction.created_at >= month, Prediction.created_at < end)
+
+            parts = month_parts(archive_path, month)
+            already_archived = archived_ids(parts) if parts else set()
+            duplicate_ids = []
+
+            def new_rows():
+                for rows in read_month_batches(db, in_month, batch_size):
+                    duplicate_ids.extend(row["id"] for row in rows if row["id"] in already_archived)
+                    rows = [row for row in rows if row["id"] not in already_archived]
+                    if rows:
+                        yield rows
+
+            part = max((parse_archive_file(path)[1] for path in parts), default=0) + 1
+            batch_ids = write_month_part(archive_file(archive_path, month, part), new_rows())
+            db.rollback()
+
+            if batch_ids or duplicate_ids:
+                # Let /history find the month before its rows leave the table
+                db.execute(archived_users_insert(db).from_select(
+                    ["user_id", "month"],
+                    select(Prediction.user_id, literal(month, DateTime))
+                    .where(*in_month, Prediction.user_id.is_not(None))
+                    .distinct()
+                ).on_conflict_do_nothing())
+                db.commit()
+
+                for ids in batch_ids + [duplicate_ids[start:start + batch_size]
+                                        for start in range(0, len(duplicate_ids), batch_size)]:
+                    db.execute(delete(Prediction).where(Prediction.id.in_(ids)))
+                    db.commit()
+
+                count = sum(len(ids) for ids in batch_ids)
+                archived[f"{month:%Y-%m}"] = count
+                logger.info(f"Archived {count} predictions of {month:%Y-%m}")
+            month = next_month(month)
+
+    return archived
+
+
+def read_archived_history(user_id: str, limit: int, before=None, archive_path=None, months=None) -> list:
+    """
+    Archived predictions of a user in /history order (created_at DESC, id).
+
+    Args:
+        user_id (str): User whose rows are read.
+        limit (int): Maximum number of rows.
+        before (tuple): Optional (created_at, id) keyset position; only rows after it in
+            history order are returned.
+        archive_path: Directory of the month files (default PREDICTION_ARCHIVE_PATH).
+        months (list): Only read these months (see archived_user_months_query) instead
+            of every month file.
+
+    Returns:
+        list: Row dicts with every predictions column.
+    """
+    if months is not None:
+        root = archive_path or PREDICTION_ARCHIVE_PATH
+        month_files = sorted(((month, month_parts(root, month)) for month in months), reverse=True)
+    else:
+        month_files = archived_months(archive_path)
+
+    rows = []
+    for month, paths in month_files:
+        if len(rows) >= limit:
+            break
+        if not paths or (before is not None and month > before[0]):
+            continue
+
+        table = pa.concat_tables([
+            pq.read_table(path, filters=[("user_id", "=", user_id)], schema=ARCHIVE_SCHEMA) for path in paths
+        ])
+        for row in table.sort_by(ARCHIVE_SORT_KEYS[1:]).to_pylist():
+            if before is not None and not (
+                row["created_at"] < before[0] or (row["created_at"] == before[0] and row["id"] > before[1])
+            ):
+                continue
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+    return rows
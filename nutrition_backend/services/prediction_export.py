@@ -0,0 +1,129 @@
+"""
+Bulk export of saved predictions as NDJSON, CSV or Parquet.
+
+Rows are read through a server-side cursor (yield_per), so only one batch is
+held in memory at a time, and every batch is encoded and handed to the caller
+straight away. Used by GET /api/export/predictions and export_predictions.py.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+
+from database_models import Prediction
+from services.prediction_archive import ARCHIVE_SCHEMA
+
+# Rows fetched from the cursor (and encoded) at a time
+PREDICTION_EXPORT_BATCH_SIZE = int(os.getenv("PREDICTION_EXPORT_BATCH_SIZE", "5000"))
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+EXPORT_COLUMNS = [column.name for column in Prediction.__table__.columns]
+
+
+def export_query(user_id: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 batch_size: int = PREDICTION_EXPORT_BATCH_SIZE):
+    """All predictions columns in id order, optionally for one user and a created_at range [start, end)."""
+    query = select(*Prediction.__table__.columns).order_by(Prediction.id)
+    if user_id is not None:
+        query = query.where(Prediction.user_id == user_id)
+    if start is not None:
+        query = query.where(Prediction.created_at >= start)
+    if end is not None:
+        query = query.where(Prediction.created_at < end)
+    return query.execution_options(yield_per=batch_size)
+
+
+class ExportEncoder:
+    """Turns batches of row mappings into chunks of one NDJSON, CSV or Parquet document."""
+
+    def __init__(self, export_format: str):
+        if export_format not in EXPORT_MEDIA_TYPES:
+            raise ValueError(f"Unknown export format: {export_format}")
+        self.export_format = export_format
+        self._buffer = io.BytesIO()
+        self._parquet_writer = None
+
+    def header(self) -> bytes:
+        if self.export_format == "csv":
+            return (",".join(EXPORT_COLUMNS) + "\r\n").encode()
+        return b""
+
+    def encode(self, rows) -> bytes:
+        """Encode one batch of rows (mappings of column -> value)."""
+        if self.export_format == "ndjson":
+            return "".join(
+                json.dumps({column: row[column] for column in EXPORT_COLUMNS}, default=datetime.isoformat) + "\n"
+                for row in rows
+            ).encode()
+
+        if self.export_format == "csv":
+            text = io.StringIO()
+            writer = csv.writer(text)
+            writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in rows)
+            return text.getvalue().encode()
+
+        # Parquet: one row group per batch, written to an in-memory sink that is emptied after each batch
+        table = pa.Table.from_pylist([dict(row) for row in rows], schema=ARCHIVE_SCHEMA)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self._buffer, ARCHIVE_SCHEMA, compression="zstd")
+        self._parquet_writer.write_table(table)
+        return self._take_buffer()
+
+    def close(self) -> bytes:
+        """Remaining bytes of the document (the Parquet footer)."""
+        if self.export_format != "parquet":
+            return b""
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self._buffer, ARCHIVE_SCHEMA, compression="zstd")
+        self._parquet_writer.close()
+        return self._take_buffer()
+
+    def _take_buffer(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def export_predictions(session, export_format: str, user_id: Optional[str] = None, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None, batch_size: int = PREDICTION_EXPORT_BATCH_SIZE):
+    """
+    Yield the encoded export of the matching predictions chunk by chunk (sync session).
+
+    Args:
+        session: Sync Session; the rows are streamed through a server-side cursor.
+        export_format (str): 'ndjson', 'csv' or 'parquet'.
+        user_id, start, end: Optional filters (created_at in [start, end)).
+        batch_size (int): Rows per cursor fetch and per encoded chunk.
+    """
+    encoder = ExportEncoder(export_format)
+    yield encoder.header()
+    result = session.execute(export_query(user_id, start, end, batch_size))
+    for rows in result.mappings().partitions():
+        yield encoder.encode(rows)
+    yield encoder.close()
+
+
+async def stream_predictions(session_factory, export_format: str, user_id: Optional[str] = None,
+                             start: Optional[datetime] = None, end: Optional[datetime] = None,
+                             batch_size: int = PREDICTION_EXPORT_BATCH_SIZE):
+    """Async version of export_predictions; opens its own AsyncSession for the lifetime of the stream."""
+    encoder = ExportEncoder(export_format)
+    yield encoder.header()
+    async with session_factory() as session:
+        result = await session.stream(export_query(user_id, start, end, batch_size))
+        async for rows in result.mappings().partitions():
+            yield encoder.encode(rows)
+    yield encoder.close()
@@ -0,0 +1,153 @@
+"""
+Aggregates over a user's saved predictions.
+
+Trends are computed in SQL: predictions are averaged per day / week / month
+bucket, then window functions add the rolling average and the change from the
+previous bucket. Both count calendar buckets: the window frame ranges over a
+numeric bucket index, so buckets without predictions still take their place
+in the rolling window, and the delta is only set when the previous calendar
+bucket has predictions. Only the buckets that are returned (plus the window
+before them) are scanned, via the (user_id, created_at) index, so the cost
+depends on the requested range and not on how long the user's history is.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, case, func, literal, select
+
+from database_models import Prediction
+from services.metrics import time_stage
+
+# Columns reported by /history/{user_id}/trends
+TREND_COLUMNS = ["daily_kcal_need", "protein_g_per_day", "carbs_g_per_day", "fat_g_per_day"]
+
+
+def bucket_start(moment: datetime, bucket: str) -> date:
+    """First day of the bucket containing `moment` (weeks start on Monday)."""
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def shift_bucket(start: date, bucket: str, count: int) -> date:
+    """Start of the bucket `count` buckets after (negative: before) the one starting at `start`."""
+    if bucket == "month":
+        months = start.year * 12 + start.month - 1 + count
+        return date(months // 12, months % 12 + 1, 1)
+    return start + timedelta(days=count * (7 if bucket == "week" else 1))
+
+
+def bucket_expression(dialect_name: str, bucket: str, column):
+    """SQL expression for the first day of the bucket containing `column`."""
+    # Constants are inlined so the SELECT and GROUP BY expressions compare equal
+    def const(value):
+        return literal(value, literal_execute=True)
+
+    if dialect_name == "sqlite":
+        if bucket == "week":
+            return func.date(column, const("weekday 0"), const("-6 days"))
+        if bucket == "month":
+            return func.strftime(const("%Y-%m-01"), column)
+        return func.date(column)
+    return func.date_trunc(const(bucket), column)
+
+
+def bucket_index_expression(dialect_name: str, bucket: str, period):
+    """
+    Numeric SQL expression ordering bucket starts on a calendar scale, plus the step between buckets.
+
+    Returns:
+        tuple: (expression, step), consecutive buckets being `step` apart.
+    """
+    if dialect_name == "sqlite":
+        if bucket == "month":
+            return func.strftime("%Y", period).cast(Integer) * 12 + func.strftime("%m", period).cast(Integer), 1
+        return func.julianday(period), 7 if bucket == "week" else 1
+    # Integer indexes, so PostgreSQL can take the integer RANGE offsets
+    if bucket == "month":
+        return (func.extract("year", period) * 12 + func.extract("month", period)).cast(Integer), 1
+    return (func.extract("epoch", period) / 86400).cast(Integer), 7 if bucket == "week" else 1
+
+
+def history_trends_query(dialect_name: str, user_id: str, bucket: str, window: int, since: datetime):
+    """Per-bucket averages, rolling averages and deltas of a user's predictions since `since`."""
+    period = bucket_expression(dialect_name, bucket, Prediction.created_at).label("period")
+    per_period = (
+        select(
+            period,
+            func.count().label("predictions"),
+            *[func.avg(getattr(Prediction, name)).label(name) for name in TREND_COLUMNS]
+        )
+        .where(Prediction.user_id == user_id, Prediction.created_at >= since)
+        .group_by(period)
+        .subquery()
+    )
+
+    # RANGE over the bucket index, so the frame spans `window` calendar buckets whether or not they have rows
+    index, step = bucket_index_expression(dialect_name, bucket, per_period.c.period)
+    previous_is_adjacent = func.lag(index).over(order_by=index) == index - step
+
+    columns = [per_period.c.period, per_period.c.predictions]
+    for name in TREND_COLUMNS:
+        value = per_period.c[name]
+        columns += [
+            value.label(f"{name}_average"),
+            func.avg(value).over(order_by=index, range_=(-(window - 1) * step, 0)).label(f"{name}_rolling_average"),
+            case(
+                (previous_is_adjacent, value - func.lag(value).over(order_by=index)),
+            ).label(f"{name}_delta"),
+        ]
+    return select(*columns).order_by(per_period.c.period)
+
+
+def format_trend_row(row) -> dict:
+    """One HistoryTrendPeriod dict from a history_trends_query row."""
+    period = row.period
+    if isinstance(period, str):
+        period = date.fromisoformat(period[:10])
+    elif isinstance(period, datetime):
+        period = period.date()
+
+    trend = {"period_start": period, "predictions": row.predictions}
+    for name in TREND_COLUMNS:
+        delta = getattr(row, f"{name}_delta")
+        trend[name] = {
+            "average": round(float(getattr(row, f"{name}_average")), 1),
+            "rolling_average": round(float(getattr(row, f"{name}_rolling_average")), 1),
+            "delta": round(float(delta), 1) if delta is not None else None,
+        }
+    return trend
+
+
+async def get_history_trends(db, user_id: str, bucket: str = "week", periods: int = 12, window: int = 4) -> list:
+    """
+    Trend periods of a user's predictions, oldest first.
+
+    Args:
+        db: AsyncSession.
+        user_id (str): User whose predictions are aggregated.
+        bucket (str): 'day', 'week' or 'month'.
+        periods (int): Number of most recent buckets to cover, ending with the bucket of
+            the user's latest prediction; buckets without predictions are skipped.
+        window (int): Calendar buckets per rolling average, empty ones included (they
+            just add no rows to the mean).
+
+    Returns:
+        list: HistoryTrendPeriod dicts.
+    """
+    with time_stage("db", "history_trends"):
+        latest = await db.scalar(select(func.max(Prediction.created_at)).where(Prediction.user_id == user_id))
+    if latest is None:
+        return []
+
+    first_returned = shift_bucket(bucket_start(latest, bucket), bucket, -(periods - 1))
+    # Scan enough buckets before the first returned one for its rolling average and delta
+    since = datetime.combine(shift_bucket(first_returned, bucket, -max(window - 1, 1)), datetime.min.time())
+
+    with time_stage("db", "history_trends"):
+        rows = (await db.execute(history_trends_query(db.bind.dialect.name, user_id, bucket, window, since))).all()
+    trends = [format_trend_row(row) for row in rows]
+    return [trend for trend in trends if trend["period_start"] >= first_returned]
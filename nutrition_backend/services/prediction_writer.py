@@ -0,0 +1,170 @@
+"""
+Write-behind persistence for nutrition predictions.
+
+With PREDICTION_WRITE_BEHIND=1 the save endpoints hand rows to PredictionWriter
+instead of committing them inline. Ids come from blocks reserved ahead of time,
+so the response still carries saved_id and user_id; a background task inserts
+the queued rows in bulk every flush interval (or once a batch fills up).
+
+Rows accepted but not yet flushed are lost if the process is killed; the queue
+is drained on a normal shutdown. /history shows a row once it is flushed.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database_models import Prediction, format_user_id, reserve_prediction_ids
+from services.history_cache import history_cache
+from services.metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: 1 / true enables write-behind for /predict-and-save, /predict/batch and /api/plan-from-profile
+PREDICTION_WRITE_BEHIND = os.getenv("PREDICTION_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+# Longest time (seconds) an accepted row waits before it is flushed
+PREDICTION_FLUSH_INTERVAL = float(os.getenv("PREDICTION_FLUSH_INTERVAL", "0.2"))
+# Rows per bulk insert
+PREDICTION_FLUSH_BATCH_SIZE = int(os.getenv("PREDICTION_FLUSH_BATCH_SIZE", "500"))
+# Ids reserved per round trip to the id sequence
+PREDICTION_ID_BLOCK_SIZE = int(os.getenv("PREDICTION_ID_BLOCK_SIZE", "1000"))
+# Queued rows before saves wait for the writer (backpressure)
+PREDICTION_QUEUE_MAX_SIZE = int(os.getenv("PREDICTION_QUEUE_MAX_SIZE", "10000"))
+# Attempts per batch before it is dropped and logged
+PREDICTION_FLUSH_RETRIES = 3
+
+
+class PredictionWriter:
+    """Queue of prediction rows flushed to the database by a background asyncio task."""
+
+    def __init__(self, flush_interval: float = PREDICTION_FLUSH_INTERVAL,
+                 batch_size: int = PREDICTION_FLUSH_BATCH_SIZE,
+                 id_block_size: int = PREDICTION_ID_BLOCK_SIZE,
+                 max_queue_size: int = PREDICTION_QUEUE_MAX_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.id_block_size = id_block_size
+        self.max_queue_size = max_queue_size
+        self.session_factory = None
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self._queue = None
+        self._ids = []
+        self._id_lock = None
+        self._task = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, session_factory):
+        """Start the flush task on the running event loop, writing through `session_factory`."""
+        if self._task is not None:
+            return
+        self.session_factory = session_factory
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._id_lock = asyncio.Lock()
+        self._ids = []
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="prediction-writer")
+
+    async def stop(self):
+        """Flush every queued row, then stop the task."""
+        if self._task is None:
+            return
+        self._stopping = True
+        await self._queue.put(None)  # wakes the task if it is waiting for the first row
+        await self._task
+        self._task = None
+
+    async def save(self, rows: list) -> list:
+        """
+        Queue prediction rows (column -> value dicts) and return their ids right away.
+
+        Returns:
+            list: {"saved_id", "user_id"} per row, in order.
+        """
+        ids = await self._take_ids(len(rows))
+        now = datetime.utcnow()
+        saved = []
+        for row_id, row in zip(ids, rows):
+            user_id = row.get("user_id") or format_user_id(row_id)
+            await self._queue.put({**row, "id": row_id, "user_id": user_id, "created_at": now})
+            saved.append({"saved_id": row_id, "user_id": user_id})
+        return saved
+
+    def stats(self) -> dict:
+        """Queue depth and flush counters."""
+        return {
+            "running": self.running,
+            "queued_rows": self._queue.qsize() if self._queue is not None else 0,
+            "reserved_ids": len(self._ids),
+            "flushed_rows": self.flushed_rows,
+            "dropped_rows": self.dropped_rows,
+        }
+
+    async def _take_ids(self, count: int) -> list:
+        async with self._id_lock:
+            if len(self._ids) < count:
+                async with self.session_factory() as db:
+                    with time_stage("db", "reserve_prediction_ids"):
+                        self._ids.extend(await reserve_prediction_ids(db, max(count - len(self._ids), self.id_block_size)))
+                        await db.commit()
+            ids, self._ids = self._ids[:count], self._ids[count:]
+            return ids
+
+    async def _next_batch(self) -> list:
+        """Wait for the first row, then collect rows until the batch is full or the interval ends."""
+        loop = asyncio.get_running_loop()
+        try:
+            first = await asyncio.wait_for(self._queue.get(), self.flush_interval)
+        except asyncio.TimeoutError:
+            return []
+        if first is None:
+            return []
+        batch = [first]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            # Past the deadline (or shutting down) only take rows that are already queued
+            timeout = 0 if self._stopping else deadline - loop.time()
+            try:
+                if timeout <= 0:
+                    row = self._queue.get_nowait()
+                else:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if row is None:
+                break
+            batch.append(row)
+        return batch
+
+    async def _flush(self, batch: list):
+        for attempt in range(1, PREDICTION_FLUSH_RETRIES + 1):
+            try:
+                async with self.session_factory() as db:
+                    with time_stage("db", "flush_predictions"):
+                        await db.execute(insert(Prediction), batch)
+                        await db.commit()
+                # The rows are visible from now on, so cached first pages of their users are stale
+                history_cache.invalidate(row["user_id"] for row in batch)
+                self.flushed_rows += len(batch)
+                return
+            except Exception as e:
+                logger.warning(f"Prediction flush of {len(batch)} rows failed (attempt {attempt}): {e}")
+                await asyncio.sleep(self.flush_interval * attempt)
+        self.dropped_rows += len(batch)
+        logger.error(f"Dropped {len(batch)} prediction rows (ids {batch[0]['id']}..{batch[-1]['id']})")
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+
+
+prediction_writer = PredictionWriter()
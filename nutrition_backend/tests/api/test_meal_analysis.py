@@ -4,6 +4,7 @@ Tests for meal analysis API endpoints.
 import pytest
 from unittest.mock import patch, MagicMock
 import base64
+import json
 
 # Client fixture is defined in conftest.py
 
@@ -53,6 +54,32 @@ class TestAnalyzeMeal:
                 assert len(data["nutrients"]) > 0
                 assert data["calories_per_100g"] > 0
     
+    @pytest.mark.asyncio
+    async def test_analyze_meal_reuses_stored_analysis(self, client, test_db, sample_image_file):
+        """Test that a photo analyzed before is answered from meal_analyses without inference."""
+        from database_models import MealAnalysis
+
+        mock_nutrients = {'protein': 25.0, 'fat': 10.0, 'carbs': 30.0, 'calories': 310.0}
+        mock_ingredients = {'predictions': ['chicken', 'rice'], 'probabilities': [85.5, 70.2]}
+
+        with patch('app.predict_nutrients_from_image', return_value=mock_nutrients) as mock_predict:
+            with patch('app.predict_ingredients_from_image', return_value=mock_ingredients):
+                files = {"image": sample_image_file}
+                first = await client.post("/api/analyze-meal?user_id=user_000001", files=files)
+                second = await client.post("/api/analyze-meal?user_id=user_000001", files=files)
+                other_user = await client.post("/api/analyze-meal?user_id=user_000002", files=files)
+
+        assert first.status_code == second.status_code == other_user.status_code == 200
+        assert first.json() == second.json() == other_user.json()
+        assert mock_predict.call_count == 1
+
+        # One row per user, written after each response
+        stored = test_db.query(MealAnalysis).order_by(MealAnalysis.user_id).all()
+        assert [row.user_id for row in stored] == ["user_000001", "user_000002"]
+        assert stored[0].image_hash == stored[1].image_hash
+        assert stored[0].calories_per_100g == first.json()["calories_per_100g"]
+        assert stored[0].ingredients == first.json()["ingredients"]
+    
     @pytest.mark.asyncio
     async def test_analyze_meal_no_image(self, client):
         """Test meal analysis without image."""
@@ -134,6 +161,65 @@ class TestSuggestMeals:
             assert "ingredients" in meal
             assert "nutrients" in meal
             assert "mass" in meal
+            assert meal["image"] == "/api/dish-images/Grilled%20Chicken"
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_inline_images(self, client, sample_meal_request):
+        """Test that inline image mode still returns base64 data URLs."""
+        mock_meal_plan = [
+            {'dish': 'Meal 1', 'total_calories': 1000.0, 'total_fat': 20.0,
+             'total_carb': 100.0, 'total_protein': 50.0, 'total_mass': 300.0,
+             'ingredients_list': ['item1'], 'rgb_image': b'fake_image_data'}
+        ]
+
+        with patch('app.generate_meal_plan', return_value=mock_meal_plan):
+            request = {**sample_meal_request, "image_mode": "inline"}
+            response = await client.post("/api/suggest-meals", json=request)
+
+            assert response.status_code == 200
+            image = response.json()[0]["image"]
+            assert image == "data:image/jpeg;base64," + base64.b64encode(b'fake_image_data').decode('utf-8')
+
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_inline_images_from_store(self, client, sample_meal_request, sample_dish_catalog):
+        """Test that inline mode reads image bytes from the image store."""
+        mock_meal_plan = [
+            {'dish': 'dish_1', 'total_calories': 1000.0, 'total_fat': 20.0,
+             'total_carb': 100.0, 'total_protein': 50.0, 'total_mass': 300.0,
+             'ingredients_list': ['egg'], 'has_image': True}
+        ]
+
+        with patch('app.generate_meal_plan', return_value=mock_meal_plan):
+            with patch('app.get_dish_catalog', return_value=sample_dish_catalog):
+                request = {**sample_meal_request, "image_mode": "inline"}
+                response = await client.post("/api/suggest-meals", json=request)
+
+                image = response.json()[0]["image"]
+                assert image == "data:image/jpeg;base64," + base64.b64encode(b'image_1').decode('utf-8')
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_inline_images_read_off_event_loop(self, client, sample_meal_request):
+        """Test that inline images are read from the store in the worker thread, not on the event loop."""
+        import threading
+        reader_threads = []
+        mock_meal_plan = [
+            {'dish': 'dish_1', 'total_calories': 1000.0, 'total_fat': 20.0,
+             'total_carb': 100.0, 'total_protein': 50.0, 'total_mass': 300.0,
+             'ingredients_list': ['egg'], 'has_image': True}
+        ]
+
+        def read_image(catalog, dish_id):
+            reader_threads.append(threading.current_thread())
+            return b'image_1'
+
+        with patch('app.generate_meal_plan', return_value=mock_meal_plan), \
+                patch('app.get_dish_catalog', return_value={}), \
+                patch('app.read_dish_image', side_effect=read_image):
+            response = await client.post("/api/suggest-meals", json={**sample_meal_request, "image_mode": "inline"})
+
+        assert response.status_code == 200
+        assert reader_threads and reader_threads[0] is not threading.current_thread()
     
     @pytest.mark.asyncio
     async def test_suggest_meals_different_meal_counts(self, client):
@@ -194,6 +280,103 @@ class TestSuggestMeals:
         response = await client.post("/api/suggest-meals", json=incomplete_request)
         assert response.status_code == 422  # Validation error
     
+    @pytest.mark.asyncio
+    async def test_suggest_meals_alternatives(self, client, sample_meal_request):
+        """Test that alternatives are summarized for each meal."""
+        alternative = {'dish': 'Dish B', 'total_calories': 950.0, 'total_fat': 18.0,
+                       'total_carb': 95.0, 'total_protein': 45.0, 'total_mass': 280.0,
+                       'ingredients_list': ['item2'], 'rgb_image': b'fake_image_data'}
+        mock_meal_plan = [
+            {'dish': 'Dish A', 'total_calories': 1000.0, 'total_fat': 20.0,
+             'total_carb': 100.0, 'total_protein': 50.0, 'total_mass': 300.0,
+             'ingredients_list': ['item1'], 'rgb_image': b'', 'alternatives': [alternative]}
+        ]
+
+        with patch('app.generate_meal_plan', return_value=mock_meal_plan) as mock_plan:
+            request = {**sample_meal_request, "num_alternatives": 1}
+            response = await client.post("/api/suggest-meals", json=request)
+
+            assert response.status_code == 200
+            alternatives = response.json()[0]["alternatives"]
+            assert alternatives[0]["dish_id"] == "Dish B"
+            assert alternatives[0]["image"] == "/api/dish-images/Dish%20B"
+            assert mock_plan.call_args.kwargs["num_alternatives"] == 1
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_versioned_image_url(self, client, sample_meal_request):
+        """Test that image URLs carry the catalog version they were planned from."""
+        mock_meal_plan = [
+            {'dish': 'dish_1', 'total_calories': 1000.0, 'total_fat': 20.0,
+             'total_carb': 100.0, 'total_protein': 50.0, 'total_mass': 300.0,
+             'ingredients_list': ['item1'], 'rgb_image': b'data', 'catalog_version': 'abc123'}
+        ]
+
+        with patch('app.generate_meal_plan', return_value=mock_meal_plan):
+            response = await client.post("/api/suggest-meals", json=sample_meal_request)
+            assert response.json()[0]["image"] == "/api/dish-images/dish_1?v=abc123"
+    
+    @pytest.mark.asyncio
+    async def test_suggest_meals_cached(self, client, sample_meal_request):
+        """Test that a repeated request is served from the meal plan cache."""
+        mock_meal_plan = [
+            {'dish': 'Meal 1', 'total_calories': 1000.0, 'total_fat': 20.0,
+             'total_carb': 100.0, 'total_protein': 50.0, 'total_mass': 300.0,
+             'ingredients_list': ['item1'], 'rgb_image': b''}
+        ]
+
+        with patch('app.generate_meal_plan', return_value=mock_meal_plan) as mock_plan:
+            first = await client.post("/api/suggest-meals", json=sample_meal_request)
+            second = await client.post("/api/suggest-meals", json=sample_meal_request)
+
+            assert first.json() == second.json()
+            assert mock_plan.call_count == 1
+
+        stats = (await client.get("/api/meal-plan-cache/stats")).json()
+        assert stats["hits"] >= 1
+        assert stats["entries"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_suggest_meals_ingredient_filters(self, client, sample_meal_request):
+        """Test that ingredient filters reach the planner and empty results are a 400."""
+        request = {**sample_meal_request, "exclude_ingredients": ["peanut"], "include_ingredients": ["rice"]}
+
+        with patch('app.generate_meal_plan', side_effect=ValueError("No dishes available for this meal")) as mock_plan:
+            response = await client.post("/api/suggest-meals", json=request)
+
+            assert response.status_code == 400
+            assert mock_plan.call_args.kwargs["exclude_ingredients"] == ["peanut"]
+            assert mock_plan.call_args.kwargs["include_ingredients"] == ["rice"]
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_unknown_excluded_ingredient(self, client, sample_meal_request, sample_dish_catalog):
+        """Test that an excluded ingredient missing from the catalog is a 400 naming it."""
+        request = {**sample_meal_request, "exclude_ingredients": ["egg", "peanut"]}
+
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            response = await client.post("/api/suggest-meals", json=request)
+            week_response = await client.post("/api/suggest-meal-plan/week", json={**request, "num_days": 2})
+
+        assert response.status_code == 400
+        assert "Unknown ingredients in exclude_ingredients: peanut" in response.json()["detail"]
+        assert week_response.status_code == 400
+        assert "peanut" in week_response.json()["detail"]
+    
+    @pytest.mark.asyncio
+    async def test_suggest_meals_plans_off_event_loop(self, client, sample_meal_request):
+        """Test that the planner runs in a worker thread, not on the event loop."""
+        import threading
+        planner_threads = []
+
+        def plan(*args, **kwargs):
+            planner_threads.append(threading.current_thread())
+            return []
+
+        with patch('app.generate_meal_plan', side_effect=plan):
+            response = await client.post("/api/suggest-meals", json=sample_meal_request)
+
+        assert response.status_code == 200
+        assert planner_threads and planner_threads[0] is not threading.current_thread()
+    
     @pytest.mark.asyncio
     async def test_suggest_meals_service_error(self, client, sample_meal_request):
         """Test meal suggestion when service raises an error."""
@@ -201,3 +384,180 @@ class TestSuggestMeals:
             response = await client.post("/api/suggest-meals", json=sample_meal_request)
             assert response.status_code == 500
             assert "error" in response.json()["detail"].lower()
+
+
+class TestSuggestMealsStream:
+    """Tests for the streaming meal suggestion endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_stream_sse(self, client, sample_meal_request, sample_dish_catalog):
+        """Test that each meal is sent as an SSE event, followed by the summary."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            response = await client.post("/api/suggest-meals/stream", json=sample_meal_request)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+        assert [lines[0] for lines in events] == ["event: meal"] * 3 + ["event: summary"]
+
+        first_meal = json.loads(events[0][1][len("data: "):])
+        assert first_meal["meal_name"] == "Breakfast"
+        assert first_meal["image"].startswith("/api/dish-images/")
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_stream_ndjson(self, client, sample_meal_request, sample_dish_catalog):
+        """Test the NDJSON stream format."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            response = await client.post("/api/suggest-meals/stream?format=ndjson", json=sample_meal_request)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert [event["type"] for event in events] == ["meal"] * 3 + ["summary"]
+        assert events[-1]["data"]["target_calories"] == sample_meal_request["total_calories"]
+
+    @pytest.mark.asyncio
+    async def test_suggest_meals_stream_no_matching_dishes(self, client, sample_meal_request, sample_dish_catalog):
+        """Test that a plan failing before the first meal is a 400, not a broken stream."""
+        request = {**sample_meal_request, "include_ingredients": ["unknown"]}
+
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            response = await client.post("/api/suggest-meals/stream", json=request)
+
+        assert response.status_code == 400
+
+
+class TestSuggestWeeklyMealPlan:
+    """Tests for the weekly meal plan endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_suggest_meal_plan_week_success(self, client, sample_meal_request):
+        """Test successful weekly meal plan."""
+        day_plan = [
+            {'dish': f'Dish {i}', 'total_calories': 600.0, 'total_fat': 15.0,
+             'total_carb': 45.0, 'total_protein': 50.0, 'total_mass': 200.0,
+             'ingredients_list': ['chicken'], 'rgb_image': b''}
+            for i in range(3)
+        ]
+        request = {**sample_meal_request, "num_days": 2, "dish_repeat_window": 1}
+
+        with patch('app.generate_weekly_meal_plan', return_value=[day_plan, day_plan]) as mock_plan:
+            response = await client.post("/api/suggest-meal-plan/week", json=request)
+
+            assert response.status_code == 200
+            data = response.json()
+            assert [day["day"] for day in data] == [1, 2]
+            assert len(data[0]["meals"]) == 3
+            assert data[0]["meals"][0]["meal_name"] == "Breakfast"
+            assert mock_plan.call_args.kwargs["dish_repeat_window"] == 1
+
+    @pytest.mark.asyncio
+    async def test_suggest_meal_plan_week_plans_off_event_loop(self, client, sample_meal_request):
+        """Test that the weekly planner runs in a worker thread, not on the event loop."""
+        import threading
+        planner_threads = []
+
+        def plan(*args, **kwargs):
+            planner_threads.append(threading.current_thread())
+            return [[]]
+
+        with patch('app.generate_weekly_meal_plan', side_effect=plan):
+            response = await client.post("/api/suggest-meal-plan/week", json={**sample_meal_request, "num_days": 1})
+
+        assert response.status_code == 200
+        assert planner_threads and planner_threads[0] is not threading.current_thread()
+
+    @pytest.mark.asyncio
+    async def test_suggest_meal_plan_week_invalid_days(self, client, sample_meal_request):
+        """Test weekly meal plan with an invalid number of days."""
+        request = {**sample_meal_request, "num_days": 0}
+        response = await client.post("/api/suggest-meal-plan/week", json=request)
+        assert response.status_code == 422
+
+
+class TestDishImages:
+    """Tests for the cached dish image endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_get_dish_image(self, client, sample_dish_catalog):
+        """Test that thumbnails are served with caching headers."""
+        with patch('app.get_dish_catalog', return_value=sample_dish_catalog):
+            response = await client.get("/api/dish-images/dish_1")
+
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "image/jpeg"
+            assert response.headers["etag"] == sample_dish_catalog["thumbnails"]["dish_1"]["etag"]
+            assert "max-age" in response.headers["cache-control"]
+
+    @pytest.mark.asyncio
+    async def test_get_dish_image_not_modified(self, client, sample_dish_catalog):
+        """Test that a matching If-None-Match returns 304 without a body."""
+        etag = sample_dish_catalog["thumbnails"]["dish_1"]["etag"]
+        with patch('app.get_dish_catalog', return_value=sample_dish_catalog):
+            response = await client.get("/api/dish-images/dish_1", headers={"If-None-Match": etag})
+
+            assert response.status_code == 304
+            assert response.content == b""
+
+    @pytest.mark.asyncio
+    async def test_get_dish_image_off_event_loop(self, client, sample_dish_catalog):
+        """Test that the catalog is loaded in a worker thread, not on the event loop."""
+        import threading
+        catalog_threads = []
+
+        def load_catalog():
+            catalog_threads.append(threading.current_thread())
+            return sample_dish_catalog
+
+        with patch('app.get_dish_catalog', side_effect=load_catalog):
+            response = await client.get("/api/dish-images/dish_1")
+
+        assert response.status_code == 200
+        assert catalog_threads and catalog_threads[0] is not threading.current_thread()
+
+    @pytest.mark.asyncio
+    async def test_get_dish_image_not_found(self, client, sample_dish_catalog):
+        """Test requesting the image of an unknown dish."""
+        with patch('app.get_dish_catalog', return_value=sample_dish_catalog):
+            response = await client.get("/api/dish-images/unknown")
+            assert response.status_code == 404
+
+
+class TestCatalogAdmin:
+    """Tests for the dish catalog status and reload endpoints."""
+
+    @pytest.mark.asyncio
+    async def test_reload_catalog(self, client, sample_dish_catalog, admin_headers):
+        """Test reloading the catalog through the admin endpoint."""
+        with patch('app.reload_dish_catalog', return_value=sample_dish_catalog) as mock_reload:
+            response = await client.post("/api/admin/reload-catalog", headers=admin_headers)
+
+            assert response.status_code == 200
+            assert response.json()["version"] == sample_dish_catalog["version"]
+            mock_reload.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_reload_catalog_requires_token(self, client):
+        """Test that the admin token is enforced when configured."""
+        with patch('app.ADMIN_TOKEN', 'secret'):
+            response = await client.post("/api/admin/reload-catalog", headers={"X-Admin-Token": "wrong"})
+            assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_reload_catalog_disabled_without_token(self, client):
+        """Test that admin endpoints refuse every call when no token is configured."""
+        with patch('app.ADMIN_TOKEN', None):
+            with patch('app.reload_dish_catalog') as mock_reload:
+                response = await client.post("/api/admin/reload-catalog", headers={"X-Admin-Token": ""})
+
+                assert response.status_code == 403
+                mock_reload.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_catalog_status(self, client):
+        """Test the catalog status endpoint."""
+        response = await client.get("/api/catalog")
+        assert response.status_code == 200
+        assert "version" in response.json()
@@ -1,11 +1,14 @@
 """
 Tests for nutrition prediction API endpoints.
 """
+import json
+from datetime import datetime
 import pytest
 from unittest.mock import patch, MagicMock
 import pandas as pd
 
 from database_models import Prediction
+from services.meal_plan_predictor import generate_meal_plan
 
 # Client fixture is defined in conftest.py
 
@@ -28,6 +31,53 @@ class TestHealthEndpoint:
         assert response.status_code == 200
         assert response.json()["status"] == "healthy"
 
+    @pytest.mark.asyncio
+    async def test_nutrition_model_status(self, client):
+        """Test the nutrition model load metrics endpoint."""
+        response = await client.get("/api/nutrition-model")
+        assert response.status_code == 200
+        assert "source" in response.json()
+
+
+class TestMetricsEndpoint:
+    """Tests for the Prometheus metrics endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_metrics_record_stages_and_requests(self, client, sample_user_input, mock_nutrition_model):
+        """Test that a prediction shows up in the stage and per-route request histograms."""
+        from prometheus_client import REGISTRY
+
+        def count(name, labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        stage = {"component": "nutrition_model", "stage": "pipeline_inference"}
+        route = {"method": "POST", "route": "/predict", "status": "200"}
+        stages_before = count("nutrition_stage_duration_seconds_count", stage)
+        requests_before = count("nutrition_http_request_duration_seconds_count", route)
+
+        with patch('app.model', mock_nutrition_model):
+            assert (await client.post("/predict", json=sample_user_input)).status_code == 200
+
+        assert count("nutrition_stage_duration_seconds_count", stage) == stages_before + 1
+        assert count("nutrition_http_request_duration_seconds_count", route) == requests_before + 1
+
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'nutrition_stage_duration_seconds_bucket{component="nutrition_model",le="0.0005",stage="pipeline_inference"}' in response.text
+        # The scrape itself is in flight while the metrics are rendered
+        assert 'nutrition_http_requests_in_progress{method="GET",route="/metrics"} 1.0' in response.text
+
+    @pytest.mark.asyncio
+    async def test_metrics_route_label_is_the_template(self, client):
+        """Test that path parameters do not create one label value per user."""
+        from prometheus_client import REGISTRY
+
+        await client.get("/history/user_000123")
+        labels = {"method": "GET", "route": "/history/{user_id}", "status": "200"}
+        assert REGISTRY.get_sample_value("nutrition_http_request_duration_seconds_count", labels) >= 1
+        assert "user_000123" not in (await client.get("/metrics")).text
+
 
 class TestNutritionPrediction:
     """Tests for nutrition prediction endpoints."""
@@ -86,22 +136,21 @@ class TestPredictAndSave:
     async def test_predict_and_save_success(self, client, sample_user_input, test_db, mock_nutrition_model):
         """Test successful prediction and save to database."""
         with patch('app.model', mock_nutrition_model):
-            with patch('app.SessionLocal', return_value=test_db):
-                response = await client.post("/predict-and-save", json=sample_user_input)
+            response = await client.post("/predict-and-save", json=sample_user_input)
                 
-                assert response.status_code == 200
-                data = response.json()
-                assert "saved_id" in data
-                assert "user_id" in data
-                assert "daily_kcal_need" in data
-                assert data["user_id"].startswith("user_")
+            assert response.status_code == 200
+            data = response.json()
+            assert "saved_id" in data
+            assert "user_id" in data
+            assert "daily_kcal_need" in data
+            assert data["user_id"].startswith("user_")
                 
-                # Verify data was saved to database
-                saved_prediction = test_db.query(Prediction).filter(
-                    Prediction.user_id == data["user_id"]
-                ).first()
-                assert saved_prediction is not None
-                assert saved_prediction.age == sample_user_input["age"]
+            # Verify data was saved to database
+            saved_prediction = test_db.query(Prediction).filter(
+                Prediction.user_id == data["user_id"]
+            ).first()
+            assert saved_prediction is not None
+            assert saved_prediction.age == sample_user_input["age"]
     
     @pytest.mark.asyncio
     async def test_predict_and_save_model_not_available(self, client, sample_user_input):
@@ -111,48 +160,395 @@ class TestPredictAndSave:
             assert response.status_code == 503
 
 
+class TestPredictBatch:
+    """Tests for the batch prediction endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_predict_batch_success(self, client, sample_user_input, trained_nutrition_model):
+        """Test that a batch returns one prediction per profile, matching /predict."""
+        profiles = [{**sample_user_input, "age": age} for age in (25, 40, 65)]
+
+        with patch('app.model', trained_nutrition_model):
+            response = await client.post("/predict/batch", json=profiles)
+            single = [(await client.post("/predict", json=profile)).json() for profile in profiles]
+
+        assert response.status_code == 200
+        assert response.json() == single
+
+    @pytest.mark.asyncio
+    async def test_predict_batch_save(self, client, sample_user_input, test_db, trained_nutrition_model):
+        """Test that save=true stores every prediction in one bulk insert."""
+        profiles = [{**sample_user_input, "age": age} for age in (25, 40, 65)]
+
+        with patch('app.model', trained_nutrition_model):
+            response = await client.post("/predict/batch?save=true", json=profiles)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [row["user_id"] for row in data] == ["user_000001", "user_000002", "user_000003"]
+
+        saved = test_db.query(Prediction).order_by(Prediction.id).all()
+        assert [row.id for row in saved] == [row["saved_id"] for row in data]
+        assert [row.age for row in saved] == [25, 40, 65]
+        assert all(row.created_at is not None for row in saved)
+
+    @pytest.mark.asyncio
+    async def test_predict_batch_too_large(self, client, sample_user_input, trained_nutrition_model):
+        """Test that batches over the limit are rejected."""
+        with patch('app.model', trained_nutrition_model):
+            with patch('app.PREDICT_BATCH_MAX_SIZE', 2):
+                response = await client.post("/predict/batch", json=[sample_user_input] * 3)
+                assert response.status_code == 413
+
+    @pytest.mark.asyncio
+    async def test_predict_batch_model_not_available(self, client, sample_user_input):
+        """Test batch prediction when model is not available."""
+        with patch('app.model', None):
+            response = await client.post("/predict/batch", json=[sample_user_input])
+            assert response.status_code == 503
+
+
+class TestUserIdAllocation:
+    """Tests for database-assigned user ids."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_saves_get_unique_user_ids(self, async_test_db, test_db, sample_user_input):
+        """Concurrent writers each get a distinct user_id derived from their row id."""
+        import asyncio
+        from app import save_prediction
+        from models import UserInput
+
+        result = {"daily_kcal_need": 2000, "protein_g_per_day": 150.0, "carbs_g_per_day": 250.0, "fat_g_per_day": 65.0}
+        profile = UserInput(**sample_user_input)
+
+        async def save_one():
+            async with async_test_db() as db:
+                return await save_prediction(db, profile, result)
+
+        saved = await asyncio.gather(*(save_one() for _ in range(80)))
+
+        user_ids = [row["user_id"] for row in saved]
+        assert len(set(user_ids)) == 80
+        assert all(row["user_id"] == f"user_{row['saved_id']:06d}" for row in saved)
+
+        # The stored rows carry the same ids the responses returned
+        stored = {row.id: row.user_id for row in test_db.query(Prediction).all()}
+        assert stored == {row["saved_id"]: row["user_id"] for row in saved}
+
+    def test_explicit_user_id_is_kept(self, test_db, sample_user_input):
+        """Rows inserted with a user_id keep it."""
+        row = Prediction(user_id="clinic_42", **sample_user_input)
+        test_db.add(row)
+        test_db.commit()
+        test_db.refresh(row)
+        assert row.user_id == "clinic_42"
+
+
 class TestHistoryEndpoint:
     """Tests for prediction history endpoint."""
     
     @pytest.mark.asyncio
     async def test_get_history_empty(self, client, test_db):
         """Test getting history for user with no predictions."""
-        with patch('app.SessionLocal', return_value=test_db):
-            response = await client.get("/history/user_000001")
-            assert response.status_code == 200
-            assert response.json() == []
+        response = await client.get("/history/user_000001")
+        assert response.status_code == 200
+        assert response.json() == []
     
     @pytest.mark.asyncio
     async def test_get_history_with_data(self, client, sample_user_input, test_db, mock_nutrition_model):
         """Test getting history for user with predictions."""
         with patch('app.model', mock_nutrition_model):
-            with patch('app.SessionLocal', return_value=test_db):
-                # Create a prediction first
-                pred_response = await client.post("/predict-and-save", json=sample_user_input)
-                user_id = pred_response.json()["user_id"]
+            # Create a prediction first
+            pred_response = await client.post("/predict-and-save", json=sample_user_input)
+            user_id = pred_response.json()["user_id"]
                 
-                # Get history
-                response = await client.get(f"/history/{user_id}")
-                assert response.status_code == 200
-                data = response.json()
-                assert len(data) > 0
-                assert "id" in data[0]
-                assert "user_id" in data[0]
-                assert "created_at" in data[0]
-                assert data[0]["user_id"] == user_id
+            # Get history
+            response = await client.get(f"/history/{user_id}")
+            assert response.status_code == 200
+            data = response.json()
+            assert len(data) > 0
+            assert "id" in data[0]
+            assert "user_id" in data[0]
+            assert "created_at" in data[0]
+            assert data[0]["user_id"] == user_id
     
     @pytest.mark.asyncio
     async def test_get_history_limit(self, client, sample_user_input, test_db, mock_nutrition_model):
         """Test that history endpoint limits results to 20."""
         with patch('app.model', mock_nutrition_model):
-            with patch('app.SessionLocal', return_value=test_db):
-                # Create multiple predictions
-                user_id = None
-                for _ in range(25):
-                    pred_response = await client.post("/predict-and-save", json=sample_user_input)
-                    user_id = pred_response.json()["user_id"]
+            # Create multiple predictions
+            user_id = None
+            for _ in range(25):
+                pred_response = await client.post("/predict-and-save", json=sample_user_input)
+                user_id = pred_response.json()["user_id"]
                 
-                # Get history - should be limited to 20
-                response = await client.get(f"/history/{user_id}")
-                assert response.status_code == 200
-                assert len(response.json()) <= 20
+            # Get history - should be limited to 20
+            response = await client.get(f"/history/{user_id}")
+            assert response.status_code == 200
+            assert len(response.json()) <= 20
+
+
+    @pytest.mark.asyncio
+    async def test_get_history_pages_with_cursor(self, client, sample_user_input, test_db):
+        """Test that cursors walk the whole history once, newest first, across equal timestamps."""
+        from datetime import datetime, timedelta
+
+        base = datetime(2026, 1, 1)
+        for i in range(25):
+            # Pairs of rows share a timestamp to exercise the id tie-breaker
+            test_db.add(Prediction(user_id="user_pages", created_at=base + timedelta(minutes=i // 2), **sample_user_input))
+        test_db.add(Prediction(user_id="someone_else", created_at=base, **sample_user_input))
+        test_db.commit()
+        expected = [
+            row.id for row in test_db.query(Prediction)
+            .filter(Prediction.user_id == "user_pages")
+            .order_by(Prediction.created_at.desc(), Prediction.id)
+        ]
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 7, **({"cursor": cursor} if cursor else {})}
+            response = await client.get("/history/user_pages", params=params)
+            assert response.status_code == 200
+            seen += [row["id"] for row in response.json()]
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        assert seen == expected
+        assert pages == 4
+
+    @pytest.mark.asyncio
+    async def test_get_history_cached_until_next_save(self, client, sample_user_input, test_db, mock_nutrition_model):
+        """Test that the first page is cached and a save for the user invalidates it."""
+        from services.history_cache import history_cache
+
+        # Cache an empty first page for the user id the next save will get
+        assert (await client.get("/history/user_000001")).json() == []
+
+        with patch('app.model', mock_nutrition_model):
+            saved = (await client.post("/predict-and-save", json=sample_user_input)).json()
+        assert saved["user_id"] == "user_000001"
+
+        first = await client.get("/history/user_000001")
+        assert [row["id"] for row in first.json()] == [saved["saved_id"]]
+
+        # Served from the cache: a change made behind the API's back is not seen
+        test_db.query(Prediction).update({"daily_kcal_need": 1})
+        test_db.commit()
+        cached = await client.get("/history/user_000001")
+        assert cached.json() == first.json()
+        assert history_cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_get_history_invalid_cursor(self, client):
+        """Test that a malformed cursor is rejected."""
+        response = await client.get("/history/user_000001", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_get_history_limit_too_large(self, client):
+        """Test that page sizes above HISTORY_MAX_PAGE_SIZE are rejected."""
+        response = await client.get("/history/user_000001", params={"limit": 10_000})
+        assert response.status_code == 422
+
+    def test_history_order_comes_from_composite_index(self, test_db):
+        """Test that a history page is an index range scan with no separate sort."""
+        from sqlalchemy import text
+
+        plan = " ".join(row[3] for row in test_db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM predictions WHERE user_id = 'u' "
+            "AND created_at <= '2026-01-01' AND (created_at < '2026-01-01' OR id > 5) "
+            "ORDER BY created_at DESC, id LIMIT 21"
+        )))
+        assert "ix_predictions_user_id_created_at_id" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+class TestHistoryTrends:
+    """Tests for the history trends endpoint."""
+
+    @staticmethod
+    def add_predictions(test_db, sample_user_input, rows):
+        for created_at, kcal in rows:
+            test_db.add(Prediction(
+                user_id="user_trends", created_at=created_at, daily_kcal_need=kcal,
+                protein_g_per_day=kcal / 20, carbs_g_per_day=kcal / 8, fat_g_per_day=kcal / 30,
+                **sample_user_input
+            ))
+        test_db.commit()
+
+    @pytest.mark.asyncio
+    async def test_weekly_trends(self, client, sample_user_input, test_db):
+        """Test per-week averages, rolling averages and deltas (weeks without predictions are not returned)."""
+        from datetime import datetime
+        self.add_predictions(test_db, sample_user_input, [
+            (datetime(2026, 1, 5, 8), 2000), (datetime(2026, 1, 11, 20), 2200),
+            (datetime(2026, 1, 12, 9), 2400),
+            (datetime(2026, 1, 28, 9), 1800),
+        ])
+
+        response = await client.get("/history/user_trends/trends", params={"bucket": "week", "window": 2})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["bucket"] == "week"
+        assert [period["period_start"] for period in data["periods"]] == ["2026-01-05", "2026-01-12", "2026-01-26"]
+        assert [period["predictions"] for period in data["periods"]] == [2, 1, 1]
+        assert [period["daily_kcal_need"] for period in data["periods"]] == [
+            {"average": 2100.0, "rolling_average": 2100.0, "delta": None},
+            {"average": 2400.0, "rolling_average": 2250.0, "delta": 300.0},
+            # The week of 2026-01-19 is empty: the window holds only this week and there is no delta
+            {"average": 1800.0, "rolling_average": 1800.0, "delta": None},
+        ]
+        assert data["periods"][1]["protein_g_per_day"]["average"] == 120.0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("bucket,rows,expected", [
+        ("day", [(datetime(2026, 3, 1), 2000), (datetime(2026, 3, 2), 2300), (datetime(2026, 3, 5), 1700)],
+         [(2000.0, None), (2150.0, 300.0), (1700.0, None)]),
+        ("month", [(datetime(2025, 11, 3), 2000), (datetime(2025, 12, 9), 2300), (datetime(2026, 2, 20), 1700)],
+         [(2000.0, None), (2150.0, 300.0), (2000.0, None)]),
+    ])
+    async def test_trends_count_calendar_periods_across_gaps(self, client, sample_user_input, test_db,
+                                                             bucket, rows, expected):
+        """Test that rolling windows and deltas span calendar periods, not just the periods with predictions."""
+        self.add_predictions(test_db, sample_user_input, rows)
+
+        response = await client.get("/history/user_trends/trends", params={"bucket": bucket, "window": 3})
+
+        assert response.status_code == 200
+        assert [
+            (period["daily_kcal_need"]["rolling_average"], period["daily_kcal_need"]["delta"])
+            for period in response.json()["periods"]
+        ] == expected
+
+    @pytest.mark.asyncio
+    async def test_trends_keep_window_before_first_period(self, client, sample_user_input, test_db):
+        """Test that the first returned period still gets its rolling average and delta."""
+        from datetime import datetime
+        self.add_predictions(test_db, sample_user_input, [
+            (datetime(2025, 11, 3), 2000), (datetime(2025, 12, 9), 2300), (datetime(2026, 1, 20), 2000),
+        ])
+
+        response = await client.get("/history/user_trends/trends", params={"bucket": "month", "periods": 2, "window": 2})
+
+        assert response.status_code == 200
+        periods = response.json()["periods"]
+        assert [period["period_start"] for period in periods] == ["2025-12-01", "2026-01-01"]
+        assert periods[0]["daily_kcal_need"] == {"average": 2300.0, "rolling_average": 2150.0, "delta": 300.0}
+
+    @pytest.mark.asyncio
+    async def test_trends_unknown_user(self, client):
+        """Test that a user without predictions gets no periods."""
+        response = await client.get("/history/nobody/trends")
+        assert response.status_code == 200
+        assert response.json()["periods"] == []
+
+
+class TestExportPredictions:
+    """Tests for the streaming export endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_export_ndjson(self, client, sample_user_input, test_db, admin_headers):
+        """Test that the export streams every matching prediction."""
+        from datetime import datetime
+        for day in range(1, 4):
+            test_db.add(Prediction(user_id="user_export", created_at=datetime(2026, 2, day), **sample_user_input))
+        test_db.add(Prediction(user_id="someone_else", created_at=datetime(2026, 2, 1), **sample_user_input))
+        test_db.commit()
+
+        response = await client.get(
+            "/api/export/predictions", params={"user_id": "user_export", "start": "2026-02-02"}, headers=admin_headers
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["created_at"] for row in rows] == ["2026-02-02T00:00:00", "2026-02-03T00:00:00"]
+        assert rows[0]["age"] == sample_user_input["age"]
+
+    @pytest.mark.asyncio
+    async def test_export_parquet(self, client, sample_user_input, test_db, admin_headers):
+        """Test that the Parquet export is a readable file."""
+        import io
+        import pyarrow.parquet as pq
+        test_db.add(Prediction(user_id="user_export", **sample_user_input))
+        test_db.commit()
+
+        response = await client.get("/api/export/predictions", params={"format": "parquet"}, headers=admin_headers)
+
+        assert response.status_code == 200
+        assert pq.read_table(io.BytesIO(response.content)).column("user_id").to_pylist() == ["user_export"]
+
+    @pytest.mark.asyncio
+    async def test_export_requires_admin_token(self, client):
+        """Test that the export is protected by the admin token when one is configured."""
+        with patch('app.ADMIN_TOKEN', 'secret'):
+            response = await client.get("/api/export/predictions")
+            assert response.status_code == 403
+
+            response = await client.get("/api/export/predictions", headers={"X-Admin-Token": "wrong"})
+            assert response.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_export_disabled_without_admin_token(self, client, sample_user_input, test_db):
+        """Test that nobody can export when no admin token is configured (the default)."""
+        test_db.add(Prediction(user_id="user_export", **sample_user_input))
+        test_db.commit()
+
+        with patch('app.ADMIN_TOKEN', None):
+            response = await client.get("/api/export/predictions")
+            assert response.status_code == 403
+            assert "user_export" not in response.text
+
+            response = await client.get("/api/export/predictions", headers={"X-Admin-Token": ""})
+            assert response.status_code == 403
+
+
+class TestPlanFromProfile:
+    """Tests for the profile-to-meal-plan endpoint."""
+
+    @pytest.mark.asyncio
+    async def test_plan_from_profile_success(self, client, sample_user_input, mock_nutrition_model, sample_dish_catalog):
+        """Test that predicted calories and macro grams drive the meal plan."""
+        request = {"profile": sample_user_input, "meals_per_day": 3}
+
+        with patch('app.model', mock_nutrition_model):
+            with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+                with patch('app.generate_meal_plan', side_effect=generate_meal_plan) as mock_plan:
+                    response = await client.post("/api/plan-from-profile", json=request)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["daily_kcal_need"] == 2000
+        assert len(data["meals"]) == 3
+        assert data["saved_id"] is None
+
+        # 150g protein, 250g carbs, 65g fat -> 600 + 1000 + 585 kcal
+        assert data["target_macro_ratios"] == pytest.approx({"fat": 0.268, "carb": 0.458, "protein": 0.275})
+        assert mock_plan.call_args.args[0] == 2000
+        assert mock_plan.call_args.args[3] == data["target_macro_ratios"]
+
+    @pytest.mark.asyncio
+    async def test_plan_from_profile_save(self, client, sample_user_input, test_db, mock_nutrition_model, sample_dish_catalog):
+        """Test that save=true stores the prediction like /predict-and-save."""
+        request = {"profile": sample_user_input, "meals_per_day": 2, "save": True}
+
+        with patch('app.model', mock_nutrition_model):
+            with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+                response = await client.post("/api/plan-from-profile", json=request)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["user_id"].startswith("user_")
+        saved_prediction = test_db.query(Prediction).filter(Prediction.id == data["saved_id"]).first()
+        assert saved_prediction.daily_kcal_need == 2000
+
+    @pytest.mark.asyncio
+    async def test_plan_from_profile_model_not_available(self, client, sample_user_input):
+        """Test that a missing nutrition model is a 503."""
+        with patch('app.model', None):
+            response = await client.post("/api/plan-from-profile", json={"profile": sample_user_input, "meals_per_day": 3})
+            assert response.status_code == 503
@@ -6,41 +6,98 @@ import pytest_asyncio
 import os
 from httpx import AsyncClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 # Import app and database components
 from app import app
-from db import Base, SessionLocal
+from db import Base, get_async_session_factory, get_db, to_async_url
 from database_models import Prediction
 
 
-# Test database URL (in-memory SQLite for testing)
-TEST_DATABASE_URL = "sqlite:///:memory:"
+@pytest.fixture(scope="function")
+def test_database_url(tmp_path):
+    """SQLite file database shared by the sync test session and the app's async sessions."""
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = create_engine(url)
+
+    # Create all tables
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield url
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
 
 
 @pytest.fixture(scope="function")
-def test_db():
+def test_db(test_database_url):
     """Create a test database session."""
-    # Create in-memory SQLite database
-    engine = create_engine(
-        TEST_DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
+    engine = create_engine(test_database_url, connect_args={"check_same_thread": False})
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
-    # Create all tables
-    Base.metadata.create_all(bind=engine)
-    
+
     # Create session
     db = TestingSessionLocal()
-    
+
     try:
         yield db
     finally:
         db.close()
-        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def async_test_db(test_database_url):
+    """Serve the app's request-scoped sessions (get_db) and session factory from the test database."""
+    # NullPool: every session opens its own connection on the current test's event loop
+    engine = create_async_engine(to_async_url(test_database_url), poolclass=NullPool, connect_args={"timeout": 30})
+    TestingAsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_session_factory] = lambda: TestingAsyncSessionLocal
+    try:
+        yield TestingAsyncSessionLocal
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        app.dependency_overrides.pop(get_async_session_factory, None)
+
+
+@pytest.fixture(autouse=True)
+def clear_meal_plan_cache():
+    """Start every test with an empty meal plan cache."""
+    from services.meal_plan_cache import meal_plan_cache
+    meal_plan_cache.clear()
+    yield
+    meal_plan_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_history_cache():
+    """Start every test with an empty history cache (each test has its own database)."""
+    from services.history_cache import history_cache
+    history_cache.clear()
+    yield
+    history_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def prediction_archive_path(tmp_path, monkeypatch):
+    """Per-test directory for the monthly prediction archive files."""
+    path = tmp_path / "archive"
+    monkeypatch.setattr("services.prediction_archive.PREDICTION_ARCHIVE_PATH", str(path))
+    return path
+
+
+@pytest.fixture
+def admin_headers(monkeypatch):
+    """Configure an admin token and return the headers that pass require_admin."""
+    monkeypatch.setattr("app.ADMIN_TOKEN", "test-admin-token")
+    return {"X-Admin-Token": "test-admin-token"}
 
 
 @pytest_asyncio.fixture(scope="function")
@@ -88,6 +145,36 @@ def sample_meal_request():
     }
 
 
+@pytest.fixture
+def sample_dish_catalog():
+    """Small in-memory dish catalog for meal plan tests."""
+    import pandas as pd
+    from services.dish_catalog import prepare_dish_catalog
+
+    dishes = pd.DataFrame({
+        "dish_id": [f"dish_{i}" for i in range(1, 9)],
+        "total_calories": [300.0, 450.0, 520.0, 610.0, 700.0, 380.0, 800.0, 0.0],
+        "total_mass": [200.0, 250.0, 300.0, 320.0, 350.0, 220.0, 400.0, 50.0],
+        "total_fat": [10.0, 15.0, 18.0, 20.0, 25.0, 12.0, 30.0, 0.0],
+        "total_carb": [35.0, 50.0, 60.0, 70.0, 75.0, 40.0, 90.0, 0.0],
+        "total_protein": [18.0, 28.0, 30.0, 38.0, 42.0, 25.0, 45.0, 0.0],
+    })
+    image_df = pd.DataFrame({
+        "dish": dishes["dish_id"],
+        "rgb_image": [f"image_{i}".encode() for i in range(1, 9)],
+    })
+    dish_ingredients = pd.DataFrame({
+        "dish_id": ["dish_1", "dish_1", "dish_2", "dish_3", "dish_3", "dish_4",
+                    "dish_5", "dish_5", "dish_6", "dish_7", "dish_8"],
+        "ingr_name": ["egg", "bread", "chicken", "rice", "chicken", "salmon",
+                      "beef", "potato", "egg", "pasta", "water"],
+    })
+    ingredients = pd.DataFrame({
+        "ingr_name": ["egg", "bread", "chicken", "rice", "salmon", "beef", "potato", "pasta", "water"],
+    })
+    return prepare_dish_catalog(image_df, dishes, dish_ingredients, ingredients)
+
+
 @pytest.fixture
 def sample_image_bytes():
     """Create a sample image file for testing."""
@@ -102,6 +189,67 @@ def sample_image_bytes():
     return img_bytes.read()
 
 
+def fit_nutrition_pipeline(regressor):
+    """Fit a pipeline with the train.py layout on synthetic profiles."""
+    import numpy as np
+    import pandas as pd
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    rng = np.random.default_rng(0)
+    n = 200
+    X = pd.DataFrame({
+        "age": rng.integers(18, 80, n),
+        "gender": rng.choice(["male", "Female"], n),
+        "height_cm": rng.uniform(150, 200, n),
+        "weight_kg": rng.uniform(45, 120, n),
+        "goal": rng.choice(["weight_loss", "Maintain", "muscle_gain"], n),
+        "has_diabetes": rng.integers(0, 2, n),
+        "has_hypertension": rng.integers(0, 2, n),
+        "steps_per_day": rng.integers(1000, 20000, n),
+        "active_minutes": rng.integers(0, 120, n),
+        "calories_burned_active": rng.uniform(50, 900, n),
+        "resting_heart_rate": rng.uniform(50, 90, n),
+        "avg_heart_rate": rng.uniform(60, 130, n),
+        "stress_score": rng.uniform(0, 100, n),
+    })
+    kcal = 10 * X["weight_kg"] + 6.25 * X["height_cm"] - 5 * X["age"] + X["calories_burned_active"]
+    y = pd.DataFrame({
+        "daily_kcal_need": kcal,
+        "protein_g_per_day": kcal * 0.25 / 4 + rng.normal(0, 5, n),
+        "carbs_g_per_day": kcal * 0.5 / 4,
+        "fat_g_per_day": kcal * 0.25 / 9,
+    })
+
+    numeric_features = [column for column in X.columns if column not in ("gender", "goal")]
+    preprocess = ColumnTransformer(transformers=[
+        ("num", StandardScaler(), numeric_features),
+        ("cat", OneHotEncoder(handle_unknown="ignore"), ["gender", "goal"]),
+    ])
+    model = Pipeline(steps=[("preprocess", preprocess), ("regressor", regressor)])
+    return model.fit(X, y)
+
+
+@pytest.fixture(scope="session")
+def trained_nutrition_model():
+    """Small nutrition pipeline with the train.py layout (one forest per target)."""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.multioutput import MultiOutputRegressor
+
+    return fit_nutrition_pipeline(
+        MultiOutputRegressor(RandomForestRegressor(n_estimators=10, random_state=42, n_jobs=-1))
+    )
+
+
+@pytest.fixture(scope="session")
+def native_nutrition_model():
+    """Small nutrition pipeline with one native multi-output forest."""
+    from sklearn.ensemble import RandomForestRegressor
+
+    return fit_nutrition_pipeline(RandomForestRegressor(n_estimators=10, max_depth=8, random_state=42))
+
+
 @pytest.fixture
 def mock_nutrition_model(monkeypatch):
     """Mock the nutrition model loading."""
@@ -0,0 +1,83 @@
+"""
+Tests for the per-user history cache.
+"""
+from services.history_cache import HistoryCache, page_size_bytes
+
+
+def make_page(user_id, rows=3):
+    return {"rows": [{"id": i, "user_id": user_id, "daily_kcal_need": 2000} for i in range(rows)], "next_cursor": None}
+
+
+class TestHistoryCache:
+    """Tests for the LRU bounds, invalidation and counters."""
+
+    def test_hit_and_miss(self):
+        """A stored page is returned for the same user and page size only."""
+        cache = HistoryCache()
+        assert cache.get("user_1", 20) is None
+        cache.put("user_1", 20, make_page("user_1"), cache.generation("user_1"))
+
+        assert cache.get("user_1", 20) == make_page("user_1")
+        assert cache.get("user_1", 50) is None
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 2, 0.3333)
+
+    def test_evicts_least_recently_used_user(self):
+        """The entry bound counts users."""
+        cache = HistoryCache(max_entries=2)
+        for user_id in ("a", "b"):
+            cache.put(user_id, 20, make_page(user_id), cache.generation(user_id))
+        cache.get("a", 20)
+        cache.put("c", 20, make_page("c"), cache.generation("c"))
+
+        assert cache.get("b", 20) is None
+        assert cache.get("a", 20) is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_byte_bound(self):
+        """Pages are evicted to stay under max_bytes; pages larger than it are not stored."""
+        size = page_size_bytes(make_page("a"))
+        cache = HistoryCache(max_bytes=2 * size)
+        for user_id in ("a", "b", "c"):
+            cache.put(user_id, 20, make_page(user_id), cache.generation(user_id))
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["bytes"] <= 2 * size
+
+        cache.put("big", 20, make_page("big", rows=100), cache.generation("big"))
+        assert cache.get("big", 20) is None
+
+    def test_invalidate_drops_user_and_stale_fills(self):
+        """Writes drop the user's pages, and pages loaded before a write are not stored."""
+        cache = HistoryCache()
+        cache.put("a", 20, make_page("a"), cache.generation("a"))
+        cache.put("a", 5, make_page("a"), cache.generation("a"))
+        generation = cache.generation("a")
+
+        cache.invalidate(["a"])
+        assert cache.get("a", 20) is None
+        assert cache.stats()["bytes"] == 0
+
+        cache.put("a", 20, make_page("a"), generation)
+        assert cache.get("a", 20) is None
+
+    def test_writes_of_other_users_keep_fills(self):
+        """A write only makes pages of the same user stale."""
+        cache = HistoryCache()
+        generation = cache.generation("a")
+
+        cache.invalidate(["b"])
+        cache.put("a", 20, make_page("a"), generation)
+        assert cache.get("a", 20) is not None
+
+    def test_stale_fill_after_generation_eviction(self):
+        """Users dropped from the bounded generation map still reject pages loaded before their write."""
+        cache = HistoryCache(max_entries=2)
+        generation = cache.generation("a")
+
+        cache.invalidate(["a"])
+        cache.invalidate(["b", "c"])
+        cache.put("a", 20, make_page("a"), generation)
+        assert cache.get("a", 20) is None
+
+        cache.put("a", 20, make_page("a"), cache.generation("a"))
+        assert cache.get("a", 20) is not None
@@ -0,0 +1,44 @@
+"""
+Tests for stored meal analyses.
+"""
+import pytest
+
+from database_models import MealAnalysis
+from services.meal_analysis_store import find_meal_analysis, image_hash, save_meal_analysis
+
+
+ANALYSIS = {
+    "ingredients": [{"name": "Rice", "amount": 100.0, "unit": "g", "possibility": 80.0}],
+    "nutrients": [{"name": "Protein", "amount": 5.0, "unit": "g", "percentage": 10.0}],
+    "calories_per_100g": 130.0,
+}
+
+
+class TestMealAnalysisStore:
+    """Tests for the meal_analyses result cache."""
+
+    @pytest.mark.asyncio
+    async def test_prefers_own_row(self, async_test_db):
+        """A user's own analysis wins over another user's row of the same image."""
+        hash_ = image_hash(b"photo")
+        await save_meal_analysis(async_test_db, "user_000001", hash_, {**ANALYSIS, "calories_per_100g": 1.0})
+        await save_meal_analysis(async_test_db, "user_000002", hash_, ANALYSIS)
+
+        own = await find_meal_analysis(async_test_db, "user_000002", hash_)
+        other = await find_meal_analysis(async_test_db, "user_000003", hash_)
+
+        assert own == {"user_id": "user_000002", "analysis": ANALYSIS}
+        assert other["user_id"] in ("user_000001", "user_000002")
+        assert await find_meal_analysis(async_test_db, "user_000002", image_hash(b"other photo")) is None
+
+    @pytest.mark.asyncio
+    async def test_model_version(self, async_test_db, test_db):
+        """Rows of another model version are not reused, and are replaced by the next save."""
+        hash_ = image_hash(b"photo")
+        await save_meal_analysis(async_test_db, None, hash_, ANALYSIS, model_version="1")
+
+        assert await find_meal_analysis(async_test_db, None, hash_, model_version="2") is None
+
+        await save_meal_analysis(async_test_db, None, hash_, {**ANALYSIS, "calories_per_100g": 140.0}, model_version="2")
+        stored = test_db.query(MealAnalysis).one()
+        assert (stored.user_id, stored.model_version, stored.calories_per_100g) == ("", "2", 140.0)
@@ -0,0 +1,362 @@
+"""
+Tests for the dish catalog and meal plan services.
+"""
+import pytest
+from unittest.mock import patch
+
+from services.dish_catalog import (
+    CatalogWatcher,
+    add_catalog_reload_listener,
+    get_catalog_version,
+    get_dish_catalog,
+    encode_thumbnail,
+    get_dish_ingredients,
+    get_dish_thumbnail,
+    read_dish_image,
+    ingredient_filter_mask,
+    load_dish_catalog,
+    reload_dish_catalog,
+)
+from services.dish_image_store import DishImageStore
+from services.meal_plan_cache import MealPlanCache
+from services.meal_plan_predictor import generate_meal_plan, generate_weekly_meal_plan, iter_meal_plan, rank_dishes
+
+
+class TestDishCatalog:
+    """Tests for the shared dish catalog."""
+
+    def test_catalog_drops_zero_calorie_dishes(self, sample_dish_catalog):
+        """Dishes without calories are never offered to the planner."""
+        dishes = sample_dish_catalog['available_dishes']
+        assert "dish_8" not in set(dishes['dish'])
+        assert len(sample_dish_catalog['calories']) == len(dishes)
+
+    def test_dish_ingredient_index(self, sample_dish_catalog):
+        """Ingredients are looked up from the prebuilt index in table order."""
+        assert get_dish_ingredients(sample_dish_catalog, "dish_1") == ["egg", "bread"]
+        assert get_dish_ingredients(sample_dish_catalog, "missing") == []
+
+    def test_ingredient_filter_mask(self, sample_dish_catalog):
+        """Exclusions and inclusions are resolved from the ingredient bitsets."""
+        dish_ids = sample_dish_catalog['dish_ids']
+
+        excluded = ingredient_filter_mask(sample_dish_catalog, exclude_ingredients=['Chicken', 'egg'])
+        assert set(dish_ids[excluded]) == {"dish_4", "dish_5", "dish_7"}
+
+        included = ingredient_filter_mask(sample_dish_catalog, include_ingredients=['rice', 'salmon'])
+        assert set(dish_ids[included]) == {"dish_3", "dish_4"}
+
+        assert ingredient_filter_mask(sample_dish_catalog) is None
+
+    def test_ingredient_filter_mask_unknown_exclusion(self, sample_dish_catalog):
+        """Excluded ingredients missing from the catalog are reported instead of ignored."""
+        with pytest.raises(ValueError, match="Unknown ingredients in exclude_ingredients: peanut, shrimp"):
+            ingredient_filter_mask(sample_dish_catalog, exclude_ingredients=['egg', 'Shrimp', 'peanut'])
+
+    def test_thumbnails_are_prebuilt(self, sample_dish_catalog):
+        """Every dish with an image gets a thumbnail with a strong ETag."""
+        thumbnail = get_dish_thumbnail(sample_dish_catalog, "dish_1")
+        assert thumbnail["data"]
+        assert thumbnail["etag"].startswith('"') and thumbnail["etag"].endswith('"')
+        assert get_dish_thumbnail(sample_dish_catalog, "missing") is None
+
+    def test_encode_thumbnail_resizes(self):
+        """Large images are shrunk to fit the thumbnail box."""
+        from PIL import Image
+        import io
+
+        img_bytes = io.BytesIO()
+        Image.new('RGB', (1280, 960), color='green').save(img_bytes, format='PNG')
+
+        thumbnail = Image.open(io.BytesIO(encode_thumbnail(img_bytes.getvalue())))
+        assert thumbnail.format == 'JPEG'
+        assert max(thumbnail.size) <= 320
+
+
+def sync_after(start, blob_path, images):
+    """Worker process of the concurrent sync test."""
+    start.wait()
+    DishImageStore.sync(blob_path, images)
+
+
+class TestDishImageStore:
+    """Tests for the out-of-core dish image store."""
+
+    def test_catalog_frame_has_no_image_bytes(self, sample_dish_catalog):
+        """Images are served from the store, not held in the DataFrame."""
+        dishes = sample_dish_catalog['available_dishes']
+        assert 'rgb_image' not in dishes.columns
+        assert dishes['has_image'].all()
+        assert read_dish_image(sample_dish_catalog, "dish_2") == b"image_2"
+        assert read_dish_image(sample_dish_catalog, "missing") is None
+
+    def test_sync_is_append_only(self, tmp_path):
+        """Unchanged images are not rewritten and changed ones are appended."""
+        blob_path = tmp_path / "dish_images.blob"
+        store = DishImageStore.sync(blob_path, [("dish_1", b"aaaa"), ("dish_2", b"bb")])
+        assert store.get("dish_1") == b"aaaa"
+        size = blob_path.stat().st_size
+
+        store = DishImageStore.sync(blob_path, [("dish_1", b"aaaa"), ("dish_2", b"bb")])
+        assert blob_path.stat().st_size == size
+
+        store = DishImageStore.sync(blob_path, [("dish_1", b"cc"), ("dish_2", b"bb")])
+        assert blob_path.stat().st_size == size + 2
+        assert store.get("dish_1") == b"cc"
+        assert store.get("dish_2") == b"bb"
+        assert DishImageStore.open(blob_path).get("dish_1") == b"cc"
+
+    def test_concurrent_syncs_from_several_processes(self, tmp_path):
+        """Workers syncing the same images at once leave every index entry on its own bytes."""
+        import multiprocessing
+
+        blob_path = tmp_path / "dish_images.blob"
+        images = [(f"dish_{i}", f"image_{i}".encode() * 20000) for i in range(40)]
+
+        start = multiprocessing.Event()
+        workers = [multiprocessing.Process(target=sync_after, args=(start, blob_path, images)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        start.set()
+        for worker in workers:
+            worker.join(timeout=30)
+        assert [worker.exitcode for worker in workers] == [0] * 4
+
+        store = DishImageStore.open(blob_path)
+        assert [store.get(dish_id) for dish_id, _ in images] == [image for _, image in images]
+        assert blob_path.stat().st_size == sum(len(image) for _, image in images)
+
+    def test_load_dish_catalog_from_dataset(self, tmp_path):
+        """Loading a dataset directory moves the images into the blob store."""
+        import pandas as pd
+
+        pd.DataFrame({"dish": ["dish_1", "dish_2"], "rgb_image": [b"img1", b"img2"]}).to_pickle(tmp_path / "dish_images.pkl")
+        pd.DataFrame({
+            "dish_id": ["dish_1", "dish_2"], "total_calories": [300.0, 500.0], "total_mass": [200.0, 250.0],
+            "total_fat": [10.0, 15.0], "total_carb": [35.0, 50.0], "total_protein": [18.0, 28.0],
+        }).to_excel(tmp_path / "dishes.xlsx", index=False)
+        pd.DataFrame({"dish_id": ["dish_1", "dish_2"], "ingr_name": ["egg", "rice"]}).to_excel(
+            tmp_path / "dish_ingredients.xlsx", index=False)
+        pd.DataFrame({"ingr_name": ["egg", "rice"]}).to_excel(tmp_path / "ingredients.xlsx", index=False)
+
+        catalog = load_dish_catalog(tmp_path)
+
+        assert (tmp_path / "dish_images.blob").exists()
+        assert 'rgb_image' not in catalog['available_dishes'].columns
+        assert read_dish_image(catalog, "dish_2") == b"img2"
+        assert catalog['version'] != 'memory'
+
+
+class TestCatalogReload:
+    """Tests for hot-reloading the dish catalog."""
+
+    @pytest.fixture(autouse=True)
+    def isolated_catalog(self, monkeypatch):
+        """Keep the shared catalog and listeners untouched by these tests."""
+        monkeypatch.setattr('services.dish_catalog.DISH_CATALOG', None)
+        monkeypatch.setattr('services.dish_catalog.CATALOG_RELOAD_LISTENERS', [])
+
+    def test_reload_swaps_catalog(self, sample_dish_catalog):
+        """A reload replaces the catalog while earlier snapshots stay intact."""
+        new_catalog = {**sample_dish_catalog, 'version': 'v2'}
+        with patch('services.dish_catalog.load_dish_catalog', side_effect=[sample_dish_catalog, new_catalog]):
+            snapshot = get_dish_catalog()
+            reload_dish_catalog()
+
+        assert get_dish_catalog() is new_catalog
+        assert get_catalog_version() == 'v2'
+        assert snapshot['version'] == 'memory'
+        assert len(snapshot['dish_ids']) == len(sample_dish_catalog['dish_ids'])
+
+    def test_watcher_reloads_on_dataset_change(self, sample_dish_catalog):
+        """The watcher reloads only when the dataset fingerprint changes."""
+        watcher = CatalogWatcher(interval=1)
+        with patch('services.dish_catalog.load_dish_catalog', return_value=sample_dish_catalog):
+            get_dish_catalog()
+            with patch('services.dish_catalog.dataset_fingerprint', return_value='memory'):
+                assert watcher.check() is False
+            with patch('services.dish_catalog.dataset_fingerprint', return_value='changed'):
+                assert watcher.check() is True
+
+
+class TestGenerateMealPlan:
+    """Tests for single-day meal plan generation."""
+
+    def test_generate_meal_plan_uses_catalog(self, sample_dish_catalog):
+        """Each meal is a distinct dish with its ingredients attached."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            plan = generate_meal_plan(2000, 3)
+
+        assert len(plan) == 3
+        assert len({meal['dish'] for meal in plan}) == 3
+        assert all('ingredients_list' in meal for meal in plan)
+
+    def test_generate_meal_plan_accepts_carbs_alias(self, sample_dish_catalog):
+        """'carbs' is accepted as an alias of 'carb' in the macro ratios."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            plan = generate_meal_plan(2000, 2, target_macro_ratios={'protein': 0.3, 'carbs': 0.4, 'fat': 0.3})
+
+        assert len(plan) == 2
+
+
+    def test_generate_meal_plan_alternatives(self, sample_dish_catalog):
+        """Alternatives are the next-best dishes not selected for any meal."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            plan = generate_meal_plan(2000, 3, num_alternatives=2)
+
+        selected = {meal['dish'] for meal in plan}
+        for meal in plan:
+            assert len(meal['alternatives']) == 2
+            assert not {alternative['dish'] for alternative in meal['alternatives']} & selected
+            assert all('ingredients_list' in alternative for alternative in meal['alternatives'])
+
+    def test_generate_meal_plan_excludes_ingredients(self, sample_dish_catalog):
+        """Dishes containing excluded ingredients are never selected."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            plan = generate_meal_plan(2000, 3, exclude_ingredients=['chicken'], num_alternatives=1)
+
+        for meal in [*plan, *(alternative for meal in plan for alternative in meal['alternatives'])]:
+            assert 'chicken' not in meal['ingredients_list']
+
+    def test_generate_meal_plan_no_matching_dishes(self, sample_dish_catalog):
+        """A filter that matches no dish raises a ValueError."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            with pytest.raises(ValueError):
+                generate_meal_plan(2000, 2, include_ingredients=['unknown'])
+
+    def test_iter_meal_plan_streams_meals_then_summary(self, sample_dish_catalog):
+        """The streamed plan selects the same dishes and ends with the daily summary."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            plan = generate_meal_plan(2000, 3)
+            events = list(iter_meal_plan(2000, 3, num_alternatives=1))
+
+        assert [event for event, _ in events] == ['meal', 'meal', 'meal', 'summary']
+        assert [data['dish'] for _, data in events[:3]] == [meal['dish'] for meal in plan]
+        assert all(len(data['alternatives']) == 1 for _, data in events[:3])
+
+        summary = events[-1][1]
+        assert summary['target_calories'] == 2000
+        assert summary['actual_calories'] == pytest.approx(sum(meal['total_calories'] for meal in plan))
+        assert set(summary['macros']) == {'fat', 'carb', 'protein'}
+
+    def test_rank_dishes(self):
+        """Ranking returns the lowest scores first and respects the mask."""
+        import numpy as np
+
+        scores = np.array([5.0, 1.0, 3.0, 1.0, 2.0])
+        assert rank_dishes(scores, top_k=3).tolist() == [1, 3, 4]
+        mask = np.array([True, False, True, False, True])
+        assert rank_dishes(scores, mask, top_k=5).tolist() == [4, 2, 0]
+        assert rank_dishes(scores, np.zeros(5, dtype=bool)).tolist() == []
+
+
+class TestGenerateWeeklyMealPlan:
+    """Tests for multi-day meal plan generation."""
+
+    def test_weekly_plan_matches_daily_plan_without_windows(self, sample_dish_catalog):
+        """Without repeat windows every day equals the single-day plan."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            daily = generate_meal_plan(1800, 3)
+        weekly = generate_weekly_meal_plan(1800, 3, num_days=3, catalog=sample_dish_catalog)
+
+        assert len(weekly) == 3
+        for day_plan in weekly:
+            assert [meal['dish'] for meal in day_plan] == [meal['dish'] for meal in daily]
+
+    def test_weekly_plan_dish_repeat_window(self, sample_dish_catalog):
+        """Dishes are not repeated on consecutive days within the window."""
+        weekly = generate_weekly_meal_plan(1000, 2, num_days=3, dish_repeat_window=1,
+                                           catalog=sample_dish_catalog)
+
+        for previous, current in zip(weekly, weekly[1:]):
+            assert not {meal['dish'] for meal in previous} & {meal['dish'] for meal in current}
+
+    def test_weekly_plan_ingredient_repeat_window(self, sample_dish_catalog):
+        """Key ingredients are not repeated on consecutive days within the window."""
+        weekly = generate_weekly_meal_plan(1000, 2, num_days=2, key_ingredients=['Chicken'],
+                                           ingredient_repeat_window=1, catalog=sample_dish_catalog)
+
+        days_with_chicken = [
+            any('chicken' in meal['ingredients_list'] for meal in day_plan)
+            for day_plan in weekly
+        ]
+        assert days_with_chicken != [True, True]
+
+    def test_weekly_plan_include_ingredients(self, sample_dish_catalog):
+        """Only dishes containing an included ingredient are planned."""
+        weekly = generate_weekly_meal_plan(1000, 2, num_days=2, include_ingredients=['egg', 'chicken'],
+                                           catalog=sample_dish_catalog)
+
+        for day_plan in weekly:
+            for meal in day_plan:
+                assert {'egg', 'chicken'} & set(meal['ingredients_list'])
+
+    def test_weekly_plan_relaxes_exhausted_window(self, sample_dish_catalog):
+        """When the window exhausts the catalog, a repeat is allowed rather than dropping meals."""
+        weekly = generate_weekly_meal_plan(2000, 4, num_days=3, dish_repeat_window=2,
+                                           catalog=sample_dish_catalog)
+
+        assert all(len(day_plan) == 4 for day_plan in weekly)
+
+    def test_weekly_plan_too_few_dishes_for_meals(self, sample_dish_catalog):
+        """Filters leaving fewer dishes than meals raise like generate_meal_plan instead of dropping meals."""
+        # Only dish_2 and dish_3 contain chicken
+        with pytest.raises(ValueError, match="No dishes available"):
+            generate_weekly_meal_plan(2000, 3, num_days=2, include_ingredients=['chicken'],
+                                      catalog=sample_dish_catalog)
+
+    def test_weekly_meals_have_daily_meal_shape(self, sample_dish_catalog):
+        """Weekly meals and alternatives carry the same keys as generate_meal_plan's."""
+        with patch('services.meal_plan_predictor.get_dish_catalog', return_value=sample_dish_catalog):
+            daily = generate_meal_plan(2000, 2, num_alternatives=1)
+        weekly = generate_weekly_meal_plan(2000, 2, num_days=1, num_alternatives=1, catalog=sample_dish_catalog)
+
+        assert set(weekly[0][0]) == set(daily[0])
+        assert set(weekly[0][0]['alternatives'][0]) == set(daily[0]['alternatives'][0])
+
+
+class TestMealPlanCache:
+    """Tests for the meal plan LRU cache."""
+
+    def test_cache_hits_and_misses(self):
+        """A repeated key is served from the cache without recomputing."""
+        cache = MealPlanCache(max_entries=4)
+        calls = []
+        key = cache.make_key(2000, 3, None, {'fat': 0.3, 'carb': 0.45, 'protein': 0.25})
+
+        first = cache.get_or_compute(key, lambda: calls.append(1) or [{'dish': 'dish_1'}])
+        second = cache.get_or_compute(key, lambda: calls.append(1) or [{'dish': 'dish_2'}])
+
+        assert first == second == [{'dish': 'dish_1'}]
+        assert len(calls) == 1
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_cache_evicts_least_recently_used(self):
+        """The cache never grows past its size bound."""
+        cache = MealPlanCache(max_entries=2)
+        for calories in (1000, 1500, 2000):
+            cache.get_or_compute(cache.make_key(calories, 3), lambda: [])
+
+        assert cache.stats()['entries'] == 2
+        cache.get_or_compute(cache.make_key(1000, 3), lambda: [])
+        assert cache.stats()['hits'] == 0
+
+    def test_calorie_bucketing(self):
+        """Calorie targets are rounded to the configured bucket."""
+        assert MealPlanCache(calorie_bucket=50).bucket_calories(2024) == 2000
+        assert MealPlanCache(calorie_bucket=50).bucket_calories(10) == 50
+        assert MealPlanCache().bucket_calories(2024) == 2024
+
+    def test_cache_cleared_on_catalog_reload(self, sample_dish_catalog, monkeypatch):
+        """Reloading the catalog invalidates every cached plan."""
+        monkeypatch.setattr('services.dish_catalog.DISH_CATALOG', None)
+        monkeypatch.setattr('services.dish_catalog.CATALOG_RELOAD_LISTENERS', [])
+        cache = MealPlanCache()
+        add_catalog_reload_listener(cache.clear)
+        cache.get_or_compute(cache.make_key(2000, 3), lambda: [])
+
+        with patch('services.dish_catalog.load_dish_catalog', return_value=sample_dish_catalog):
+            reload_dish_catalog()
+
+        assert cache.stats()['entries'] == 0
@@ -0,0 +1,167 @@
+"""
+Tests for the nutrition model serving path.
+"""
+import pytest
+import numpy as np
+import pandas as pd
+from unittest.mock import MagicMock
+
+from services.nutrition_model import (
+    CompiledForest,
+    FastNutritionPredictor,
+    get_fast_predictor,
+    get_nutrition_model_status,
+    load_nutrition_model,
+)
+
+
+class TestFastNutritionPredictor:
+    """Tests for single-row nutrition inference."""
+
+    def test_matches_pipeline(self, trained_nutrition_model, sample_user_input):
+        """The fast path predicts the same targets as the full pipeline."""
+        predictor = FastNutritionPredictor(trained_nutrition_model)
+
+        for profile in [
+            sample_user_input,
+            {**sample_user_input, "gender": "Female", "goal": "Maintain", "age": 55},
+            {**sample_user_input, "gender": "unknown", "goal": "unknown"},
+        ]:
+            expected = trained_nutrition_model.predict(pd.DataFrame([profile]))[0]
+            np.testing.assert_allclose(predictor.predict(profile), expected)
+
+    def test_encode_matches_column_transformer(self, trained_nutrition_model, sample_user_input):
+        """Encoded rows match the fitted ColumnTransformer output."""
+        predictor = FastNutritionPredictor(trained_nutrition_model)
+        preprocess = trained_nutrition_model.named_steps["preprocess"]
+
+        expected = preprocess.transform(pd.DataFrame([sample_user_input]))
+        np.testing.assert_allclose(predictor.encode(sample_user_input), np.asarray(expected))
+
+    def test_serving_n_jobs(self, trained_nutrition_model):
+        """Forests run with the serving-time n_jobs."""
+        predictor = FastNutritionPredictor(trained_nutrition_model, n_jobs=1)
+        assert all(estimator.n_jobs == 1 for estimator in predictor.estimators)
+
+    def test_threaded_forests_match_pipeline(self, trained_nutrition_model, sample_user_input):
+        """With several serving threads the forests' own predict is used."""
+        import copy
+
+        predictor = FastNutritionPredictor(copy.deepcopy(trained_nutrition_model), n_jobs=2)
+        assert predictor.compiled is None
+
+        expected = trained_nutrition_model.predict(pd.DataFrame([sample_user_input]))[0]
+        np.testing.assert_allclose(predictor.predict(sample_user_input), expected)
+
+    def test_get_fast_predictor_unsupported_model(self):
+        """Models that are not a fitted pipeline fall back to model.predict."""
+        assert get_fast_predictor(MagicMock()) is None
+
+    def test_get_fast_predictor_cached(self, trained_nutrition_model):
+        """The predictor is built once per model object."""
+        assert get_fast_predictor(trained_nutrition_model) is get_fast_predictor(trained_nutrition_model)
+
+
+class TestCompiledForest:
+    """Tests for the flat-array forest engine."""
+
+    def test_matches_model_predict(self, trained_nutrition_model):
+        """All targets of a batch match model.predict to floating-point tolerance."""
+        preprocess = trained_nutrition_model.named_steps["preprocess"]
+        regressor = trained_nutrition_model.named_steps["regressor"]
+        compiled = CompiledForest.from_estimators(regressor.estimators_)
+
+        rng = np.random.default_rng(1)
+        X = rng.normal(size=(64, compiled_features(preprocess)))
+        np.testing.assert_allclose(compiled.predict(X), regressor.predict(X))
+
+    def test_layout(self, trained_nutrition_model):
+        """Every tree of every target is flattened into one set of node arrays."""
+        regressor = trained_nutrition_model.named_steps["regressor"]
+        compiled = CompiledForest.from_estimators(regressor.estimators_)
+
+        trees = [tree for forest in regressor.estimators_ for tree in forest.estimators_]
+        assert compiled.num_trees == len(trees)
+        assert compiled.num_targets == len(regressor.estimators_)
+        assert len(compiled.value) == sum(tree.tree_.node_count for tree in trees)
+
+    def test_predict_batch(self, trained_nutrition_model, sample_user_input):
+        """Batch predictions match the pipeline row for row."""
+        predictor = FastNutritionPredictor(trained_nutrition_model)
+        profiles = [{**sample_user_input, "age": age, "weight_kg": 50.0 + age} for age in range(20, 70, 5)]
+
+        expected = trained_nutrition_model.predict(pd.DataFrame(profiles))
+        np.testing.assert_allclose(predictor.predict_batch(profiles), expected)
+
+    def test_native_multi_output_forest(self, native_nutrition_model, sample_user_input, tmp_path):
+        """A native multi-output forest compiles, saves and predicts like the pipeline."""
+        predictor = FastNutritionPredictor(native_nutrition_model)
+        assert predictor.compiled.value.ndim == 2
+
+        profiles = [sample_user_input, {**sample_user_input, "gender": "Female", "age": 61}]
+        expected = native_nutrition_model.predict(pd.DataFrame(profiles))
+        np.testing.assert_allclose(predictor.predict_batch(profiles), expected)
+
+        predictor.save(tmp_path)
+        np.testing.assert_allclose(FastNutritionPredictor.load(tmp_path).predict_batch(profiles), expected)
+
+    def test_rejects_non_forest(self):
+        """Estimators without fitted trees cannot be compiled."""
+        with pytest.raises(ValueError):
+            CompiledForest.from_estimators([MagicMock(estimators_=[])])
+
+
+def compiled_features(preprocess) -> int:
+    """Number of encoded features produced by a fitted ColumnTransformer."""
+    return len(preprocess.get_feature_names_out())
+
+
+class TestCompiledArtifact:
+    """Tests for the memory-mapped compiled model artifact."""
+
+    def test_save_and_load_memory_mapped(self, trained_nutrition_model, sample_user_input, tmp_path):
+        """A saved predictor loads as read-only memory maps and predicts the same targets."""
+        FastNutritionPredictor(trained_nutrition_model).save(tmp_path)
+        loaded = FastNutritionPredictor.load(tmp_path)
+
+        assert isinstance(loaded.compiled.threshold, np.memmap)
+        assert not loaded.compiled.threshold.flags.writeable
+
+        profiles = [sample_user_input, {**sample_user_input, "gender": "Female", "goal": "unknown"}]
+        expected = trained_nutrition_model.predict(pd.DataFrame(profiles))
+        np.testing.assert_allclose(loaded.predict_batch(profiles), expected)
+
+    def test_load_nutrition_model_prefers_compiled(self, trained_nutrition_model, tmp_path):
+        """The compiled export is loaded when present, and load metrics are recorded."""
+        import joblib
+
+        model_path = tmp_path / "nutrition_model.pkl"
+        compiled_path = tmp_path / "nutrition_model_compiled"
+        joblib.dump(trained_nutrition_model, model_path)
+        FastNutritionPredictor(trained_nutrition_model).save(compiled_path)
+
+        model = load_nutrition_model(model_path, compiled_path)
+
+        assert isinstance(model, FastNutritionPredictor)
+        assert get_fast_predictor(model) is model
+        status = get_nutrition_model_status()
+        assert status["source"] == str(compiled_path)
+        assert status["memory_mapped"] is True
+        assert status["load_seconds"] >= 0
+        assert status["rss_bytes"] > 0
+
+    def test_load_nutrition_model_pickle_fallback(self, trained_nutrition_model, tmp_path):
+        """Without a compiled export the pickled pipeline is loaded."""
+        import joblib
+
+        model_path = tmp_path / "nutrition_model.pkl"
+        joblib.dump(trained_nutrition_model, model_path)
+
+        model = load_nutrition_model(model_path, tmp_path / "missing")
+
+        assert not isinstance(model, FastNutritionPredictor)
+        assert get_nutrition_model_status()["memory_mapped"] is False
+
+    def test_load_nutrition_model_missing(self, tmp_path):
+        """No artifact at all loads no model."""
+        assert load_nutrition_model(tmp_path / "missing.pkl", tmp_path / "missing") is None
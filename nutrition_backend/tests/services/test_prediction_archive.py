@@ -0,0 +1,206 @@
+"""
+Tests for the monthly prediction archive.
+"""
+from datetime import datetime
+
+import pyarrow.parquet as pq
+import pytest
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+
+from database_models import ArchivedUserMonth, Prediction
+from services.prediction_archive import archive_predictions, archived_months, read_archived_history, reindex_archive
+
+
+def add_predictions(test_db, sample_user_input, rows):
+    for user_id, created_at in rows:
+        test_db.add(Prediction(user_id=user_id, created_at=created_at, daily_kcal_need=2000, **sample_user_input))
+    test_db.commit()
+
+
+class TestArchivePredictions:
+    """Tests for the retention job."""
+
+    def test_moves_old_rows_into_month_files(self, test_db, sample_user_input, prediction_archive_path):
+        """Rows before the cutoff end up in one Parquet part per month, one row group per batch, and leave the table."""
+        add_predictions(test_db, sample_user_input, [
+            ("user_a", datetime(2025, 1, 3)), ("user_b", datetime(2025, 1, 20)),
+            ("user_a", datetime(2025, 2, 14)),
+            ("user_a", datetime(2025, 3, 2)), ("user_a", datetime(2025, 3, 20)),
+        ])
+        session_factory = sessionmaker(bind=test_db.get_bind())
+
+        archived = archive_predictions(session_factory, datetime(2025, 3, 10), batch_size=2)
+
+        assert archived == {"2025-01": 2, "2025-02": 1, "2025-03": 1}
+        assert [month.strftime("%Y-%m") for month, _ in archived_months()] == ["2025-03", "2025-02", "2025-01"]
+        january = pq.read_table(prediction_archive_path / "predictions-2025-01-1.parquet")
+        assert january.column("user_id").to_pylist() == ["user_a", "user_b"]
+        assert pq.ParquetFile(prediction_archive_path / "predictions-2025-01-1.parquet").num_row_groups == 1
+        assert january.column("age").to_pylist() == [sample_user_input["age"]] * 2
+        assert [row.created_at for row in test_db.query(Prediction).all()] == [datetime(2025, 3, 20)]
+
+    def test_batches_are_sorted_row_groups(self, test_db, sample_user_input, prediction_archive_path):
+        """Each batch is one row group, and the part is in (user_id, created_at DESC, id) order."""
+        add_predictions(test_db, sample_user_input, [
+            ("user_b", datetime(2025, 1, 2)), ("user_a", datetime(2025, 1, 3)), (None, datetime(2025, 1, 4)),
+            ("user_a", datetime(2025, 1, 9)), ("user_b", datetime(2025, 1, 20)),
+        ])
+        # Rows inserted without a user_id get one from the database; clear it to cover NULL user_ids
+        test_db.query(Prediction).filter(Prediction.created_at == datetime(2025, 1, 4)).update({"user_id": None})
+        test_db.commit()
+
+        archive_predictions(sessionmaker(bind=test_db.get_bind()), datetime(2025, 2, 1), batch_size=2)
+
+        part = pq.ParquetFile(prediction_archive_path / "predictions-2025-01-1.parquet")
+        assert part.num_row_groups == 3
+        table = part.read()
+        assert list(zip(table.column("user_id").to_pylist(), table.column("created_at").to_pylist())) == [
+            ("user_a", datetime(2025, 1, 9)), ("user_a", datetime(2025, 1, 3)),
+            ("user_b", datetime(2025, 1, 20)), ("user_b", datetime(2025, 1, 2)),
+            (None, datetime(2025, 1, 4)),
+        ]
+        assert test_db.query(Prediction).count() == 0
+
+    def test_rerun_writes_new_part(self, test_db, sample_user_input):
+        """A later run adds a new part to the month instead of rewriting the earlier ones."""
+        add_predictions(test_db, sample_user_input, [("user_a", datetime(2025, 3, 2)), ("user_a", datetime(2025, 3, 20))])
+        session_factory = sessionmaker(bind=test_db.get_bind())
+
+        archive_predictions(session_factory, datetime(2025, 3, 10))
+        first_part = archived_months()[0][1][0]
+        first_part_mtime = first_part.stat().st_mtime_ns
+        archive_predictions(session_factory, datetime(2025, 4, 1))
+        archive_predictions(session_factory, datetime(2025, 4, 1))
+
+        (_, paths), = archived_months()
+        assert [path.name for path in paths] == ["predictions-2025-03-1.parquet", "predictions-2025-03-2.parquet"]
+        assert first_part.stat().st_mtime_ns == first_part_mtime
+        assert [pq.read_table(path).column("created_at").to_pylist() for path in paths] == [
+            [datetime(2025, 3, 2)], [datetime(2025, 3, 20)]
+        ]
+        assert test_db.query(Prediction).count() == 0
+
+    def test_rerun_after_interrupted_deletes(self, test_db, sample_user_input):
+        """Rows archived by a run that stopped before its deletes are deleted, not written again."""
+        add_predictions(test_db, sample_user_input, [("user_a", datetime(2025, 3, 2)), ("user_a", datetime(2025, 3, 5))])
+        session_factory = sessionmaker(bind=test_db.get_bind())
+
+        with patch('services.prediction_archive.delete', side_effect=RuntimeError("stopped")):
+            with pytest.raises(RuntimeError):
+                archive_predictions(session_factory, datetime(2025, 3, 10))
+        assert test_db.query(Prediction).count() == 2
+
+        archived = archive_predictions(session_factory, datetime(2025, 3, 10))
+
+        assert archived == {"2025-03": 0}
+        (_, paths), = archived_months()
+        assert len(paths) == 1
+        assert test_db.query(Prediction).count() == 0
+
+    def test_reads_single_file_months(self, test_db, sample_user_input, prediction_archive_path):
+        """Month files written before part files existed are read as part 0."""
+        add_predictions(test_db, sample_user_input, [("user_a", datetime(2025, 1, 3))])
+        archive_predictions(sessionmaker(bind=test_db.get_bind()), datetime(2025, 2, 1))
+        (prediction_archive_path / "predictions-2025-01-1.parquet").rename(
+            prediction_archive_path / "predictions-2025-01.parquet"
+        )
+
+        assert [path.name for path in archived_months()[0][1]] == ["predictions-2025-01.parquet"]
+        assert [row["created_at"] for row in read_archived_history("user_a", limit=10)] == [datetime(2025, 1, 3)]
+
+
+    def test_records_archived_months_of_each_user(self, test_db, sample_user_input):
+        """archived_user_months lists the months holding rows of each user, also after a reindex."""
+        add_predictions(test_db, sample_user_input, [
+            ("user_a", datetime(2025, 1, 3)), ("user_b", datetime(2025, 1, 20)), ("user_a", datetime(2025, 1, 21)),
+            ("user_a", datetime(2025, 2, 14)),
+        ])
+        session_factory = sessionmaker(bind=test_db.get_bind())
+        archive_predictions(session_factory, datetime(2025, 6, 1))
+
+        def months():
+            return sorted((row.user_id, row.month) for row in test_db.query(ArchivedUserMonth).all())
+
+        expected = [
+            ("user_a", datetime(2025, 1, 1)), ("user_a", datetime(2025, 2, 1)), ("user_b", datetime(2025, 1, 1)),
+        ]
+        assert months() == expected
+
+        test_db.query(ArchivedUserMonth).delete()
+        test_db.commit()
+        assert reindex_archive(session_factory) == 2
+        assert months() == expected
+
+
+class TestArchivedHistory:
+    """Tests for reading archived rows in history order."""
+
+    def test_read_in_history_order_after_position(self, test_db, sample_user_input):
+        """Rows of one user come back newest first, across months, after the keyset position."""
+        add_predictions(test_db, sample_user_input, [
+            ("user_a", datetime(2025, 1, 3)), ("user_b", datetime(2025, 1, 20)),
+            ("user_a", datetime(2025, 2, 14)), ("user_a", datetime(2025, 2, 20)),
+        ])
+        archive_predictions(sessionmaker(bind=test_db.get_bind()), datetime(2025, 6, 1))
+
+        rows = read_archived_history("user_a", limit=10)
+        assert [row["created_at"] for row in rows] == [datetime(2025, 2, 20), datetime(2025, 2, 14), datetime(2025, 1, 3)]
+
+        after = read_archived_history("user_a", limit=1, before=(rows[0]["created_at"], rows[0]["id"]))
+        assert [row["created_at"] for row in after] == [datetime(2025, 2, 14)]
+
+    @pytest.mark.asyncio
+    async def test_history_cursor_continues_into_archive(self, client, test_db, sample_user_input):
+        """/history pages run from the table into the archived months."""
+        add_predictions(test_db, sample_user_input, [("user_a", datetime(2025, month, 1)) for month in range(1, 8)])
+        archive_predictions(sessionmaker(bind=test_db.get_bind()), datetime(2025, 5, 1))
+        assert test_db.query(Prediction).count() == 3
+
+        seen, cursor = [], None
+        while True:
+            response = await client.get("/history/user_a", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+            seen += [row["created_at"] for row in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        assert seen == [datetime(2025, month, 1).isoformat() for month in range(7, 0, -1)]
+
+    @pytest.mark.asyncio
+    async def test_history_skips_archive_without_archived_rows(self, client, test_db, sample_user_input):
+        """A short page of a user with nothing archived does not open any month file."""
+        add_predictions(test_db, sample_user_input, [("user_a", datetime(2025, 1, 3)), ("user_b", datetime(2025, 9, 1))])
+        archive_predictions(sessionmaker(bind=test_db.get_bind()), datetime(2025, 6, 1))
+
+        with patch('app.read_archived_history', wraps=read_archived_history) as mock_read:
+            response = await client.get("/history/user_b")
+            assert len(response.json()) == 1
+            mock_read.assert_not_called()
+
+            response = await client.get("/history/user_a")
+            assert len(response.json()) == 1
+            mock_read.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_interrupted_archive_run_rows_shown_once(self, client, test_db, sample_user_input):
+        """Rows archived but not yet deleted from the table appear once in /history."""
+        add_predictions(test_db, sample_user_input, [("user_a", datetime(2025, month, 1)) for month in range(1, 5)])
+        rows = [
+            {column.name: getattr(row, column.name) for column in Prediction.__table__.columns}
+            for row in test_db.query(Prediction).all()
+        ]
+        archive_predictions(sessionmaker(bind=test_db.get_bind()), datetime(2025, 3, 1))
+        # Put the archived rows back, as if the run had stopped before its deletes
+        test_db.add_all(Prediction(**row) for row in rows if row["created_at"] < datetime(2025, 3, 1))
+        test_db.commit()
+
+        seen, cursor = [], None
+        while True:
+            response = await client.get("/history/user_a", params={"limit": 3, **({"cursor": cursor} if cursor else {})})
+            seen += [row["id"] for row in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        assert sorted(seen) == sorted(row["id"] for row in rows)
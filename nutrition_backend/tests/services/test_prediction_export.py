@@ -0,0 +1,67 @@
+"""
+Tests for the bulk prediction export.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+import pyarrow.parquet as pq
+import pytest
+
+from database_models import Prediction
+from services.prediction_export import EXPORT_COLUMNS, ExportEncoder, export_predictions
+
+
+@pytest.fixture
+def saved_predictions(test_db, sample_user_input):
+    """Seven predictions of two users, one per day from 2026-01-01."""
+    for day in range(1, 8):
+        test_db.add(Prediction(
+            user_id="user_a" if day % 2 else "user_b", created_at=datetime(2026, 1, day),
+            daily_kcal_need=2000 + day, **sample_user_input
+        ))
+    test_db.commit()
+    return test_db
+
+
+class TestExportPredictions:
+    """Tests for the encoded export stream."""
+
+    def test_ndjson_in_batches(self, saved_predictions):
+        """Every row is one JSON line with all columns, fetched batch by batch."""
+        chunks = list(export_predictions(saved_predictions, "ndjson", batch_size=3))
+
+        # header, three batches (3 + 3 + 1 rows), footer
+        assert len(chunks) == 5
+        rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+        assert [row["daily_kcal_need"] for row in rows] == list(range(2001, 2008))
+        assert list(rows[0]) == EXPORT_COLUMNS
+        assert rows[0]["created_at"] == "2026-01-01T00:00:00"
+
+    def test_csv_with_filters(self, saved_predictions):
+        """CSV has a header row; user and date filters apply (end is exclusive)."""
+        data = b"".join(export_predictions(
+            saved_predictions, "csv", user_id="user_a", start=datetime(2026, 1, 2), end=datetime(2026, 1, 7)
+        )).decode()
+
+        rows = list(csv.DictReader(io.StringIO(data)))
+        assert [row["daily_kcal_need"] for row in rows] == ["2003", "2005"]
+        assert {row["user_id"] for row in rows} == {"user_a"}
+
+    def test_parquet_row_group_per_batch(self, saved_predictions):
+        """The Parquet stream is one valid file with one row group per batch."""
+        data = b"".join(export_predictions(saved_predictions, "parquet", batch_size=4))
+
+        parquet_file = pq.ParquetFile(io.BytesIO(data))
+        assert parquet_file.metadata.num_row_groups == 2
+        assert parquet_file.read().column("daily_kcal_need").to_pylist() == list(range(2001, 2008))
+
+    def test_empty_parquet_is_valid(self, test_db):
+        """An export without rows is still a readable Parquet file."""
+        data = b"".join(export_predictions(test_db, "parquet"))
+        assert pq.read_table(io.BytesIO(data)).num_rows == 0
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            ExportEncoder("xml")
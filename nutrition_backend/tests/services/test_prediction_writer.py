@@ -0,0 +1,145 @@
+"""
+Tests for the write-behind prediction writer.
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from sqlalchemy import MetaData, create_engine, text
+
+from database_models import (
+    Prediction, check_prediction_id_sequence, migrate_predictions_autoincrement, predictions_has_autoincrement,
+    reserve_prediction_ids
+)
+from services.prediction_writer import PredictionWriter
+
+
+PREDICTION = {"daily_kcal_need": 2000, "protein_g_per_day": 150.0, "carbs_g_per_day": 250.0, "fat_g_per_day": 65.0}
+
+
+class TestReservePredictionIds:
+    """Tests for id block reservation."""
+
+    @pytest.mark.asyncio
+    async def test_blocks_do_not_overlap_database_ids(self, async_test_db, test_db, sample_user_input):
+        """Reserved ids are skipped by later inserts that let the database pick the id."""
+        test_db.add(Prediction(**sample_user_input))
+        test_db.commit()
+
+        async with async_test_db() as db:
+            first = await reserve_prediction_ids(db, 5)
+            second = await reserve_prediction_ids(db, 3)
+            await db.commit()
+
+        assert first == [2, 3, 4, 5, 6]
+        assert second == [7, 8, 9]
+
+        row = Prediction(**sample_user_input)
+        test_db.add(row)
+        test_db.commit()
+        assert row.id == 10
+
+
+class TestPredictionsAutoincrement:
+    """Tests for SQLite predictions tables created before AUTOINCREMENT."""
+
+    @staticmethod
+    def create_legacy_table(url):
+        """A predictions table as created before sqlite_autoincrement, with two rows."""
+        legacy = Prediction.__table__.to_metadata(MetaData())
+        legacy.dialect_options["sqlite"]["autoincrement"] = False
+        engine = create_engine(url)
+        legacy.create(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(legacy.insert(), [{"id": 1, "user_id": "user_a"}, {"id": 2, "user_id": None}])
+        return engine
+
+    def test_detects_and_migrates_legacy_table(self, tmp_path, sample_user_input):
+        """The legacy table is refused, then rebuilt with its rows, indexes, trigger and id sequence."""
+        engine = self.create_legacy_table(f"sqlite:///{tmp_path / 'legacy.db'}")
+
+        with engine.begin() as connection:
+            assert not predictions_has_autoincrement(connection)
+            with pytest.raises(RuntimeError, match="init_db.py"):
+                check_prediction_id_sequence(connection)
+
+            migrate_predictions_autoincrement(connection)
+
+        with engine.begin() as connection:
+            assert predictions_has_autoincrement(connection)
+            check_prediction_id_sequence(connection)
+            assert connection.execute(text("SELECT id, user_id FROM predictions ORDER BY id")).all() == [
+                (1, "user_a"), (2, None)
+            ]
+            assert connection.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'predictions'")).scalar() == 2
+            indexes = {row.name for row in connection.execute(text("PRAGMA index_list('predictions')"))}
+            assert {index.name for index in Prediction.__table__.indexes} <= indexes
+
+            # New rows still get a user id from the trigger, and ids above the old max are never reused
+            connection.execute(Prediction.__table__.insert().values(**sample_user_input))
+            connection.execute(text("DELETE FROM predictions WHERE id = 3"))
+            connection.execute(Prediction.__table__.insert().values(**sample_user_input))
+            assert connection.execute(text("SELECT id, user_id FROM predictions WHERE id > 2")).all() == [
+                (4, "user_000004")
+            ]
+        engine.dispose()
+
+
+class TestPredictionWriter:
+    """Tests for queued prediction rows."""
+
+    @pytest.mark.asyncio
+    async def test_save_returns_ids_and_stop_drains(self, async_test_db, test_db, sample_user_input):
+        """Rows get their ids immediately and are all in the table after stop()."""
+        writer = PredictionWriter(flush_interval=10, batch_size=4, id_block_size=8)
+        writer.start(async_test_db)
+
+        saved = []
+        for age in range(20, 30):
+            saved += await writer.save([{**sample_user_input, "age": age, **PREDICTION}])
+        await writer.stop()
+
+        assert [row["saved_id"] for row in saved] == list(range(1, 11))
+        assert [row["user_id"] for row in saved] == [f"user_{i:06d}" for i in range(1, 11)]
+
+        stored = test_db.query(Prediction).order_by(Prediction.id).all()
+        assert [(row.id, row.user_id, row.age) for row in stored] == [
+            (row["saved_id"], row["user_id"], age) for row, age in zip(saved, range(20, 30))
+        ]
+        assert all(row.created_at is not None for row in stored)
+        assert writer.stats()["flushed_rows"] == 10
+        assert not writer.running
+
+    @pytest.mark.asyncio
+    async def test_flushes_in_background(self, async_test_db, test_db, sample_user_input):
+        """Queued rows are inserted after the flush interval without stopping the writer."""
+        writer = PredictionWriter(flush_interval=0.01, batch_size=100)
+        writer.start(async_test_db)
+        try:
+            await writer.save([{**sample_user_input, **PREDICTION}] * 3)
+            for _ in range(200):
+                if writer.flushed_rows == 3:
+                    break
+                await asyncio.sleep(0.01)
+            assert test_db.query(Prediction).count() == 3
+        finally:
+            await writer.stop()
+
+    @pytest.mark.asyncio
+    async def test_predict_and_save_uses_writer(self, client, async_test_db, test_db, sample_user_input, mock_nutrition_model):
+        """With the writer running, /predict-and-save returns ids before the row is written."""
+        writer = PredictionWriter(flush_interval=10)
+        writer.start(async_test_db)
+
+        with patch('app.model', mock_nutrition_model):
+            with patch('app.prediction_writer', writer):
+                response = await client.post("/predict-and-save", json=sample_user_input)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["user_id"] == f"user_{data['saved_id']:06d}"
+        assert test_db.query(Prediction).count() == 0
+
+        await writer.stop()
+        saved_prediction = test_db.query(Prediction).filter(Prediction.id == data["saved_id"]).one()
+        assert saved_prediction.user_id == data["user_id"]
+        assert saved_prediction.daily_kcal_need == 2000
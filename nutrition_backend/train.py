@@ -1,22 +1,26 @@
+import argparse
+import copy
+import io
 import os
+import time
+
 import joblib
 import numpy as np
 import pandas as pd
 
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import KFold, cross_validate, train_test_split
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.multioutput import MultiOutputRegressor
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
+from services.nutrition_model import FastNutritionPredictor
+
 
-# ✅ 1) Load clean dataset
 DATA_PATH = "sri_lanka_dataset_1000_inputs_outputs_only.csv"
-df = pd.read_csv(DATA_PATH)
 
-# ✅ 2) Inputs (X) and Outputs (y)
 feature_cols = [
     "age", "gender", "height_cm", "weight_kg", "goal",
     "has_diabetes", "has_hypertension",
@@ -31,24 +35,6 @@ target_cols = [
     "fat_g_per_day"
 ]
 
-# ✅ 3) Handle missing values (safe)
-df["stress_score"] = df["stress_score"].fillna(df["stress_score"].median())
-df["active_minutes"] = df["active_minutes"].fillna(df["active_minutes"].median())
-df["has_diabetes"] = df["has_diabetes"].fillna(0).astype(int)
-df["has_hypertension"] = df["has_hypertension"].fillna(0).astype(int)
-
-# Ensure targets exist
-df = df.dropna(subset=target_cols).reset_index(drop=True)
-
-X = df[feature_cols]
-y = df[target_cols]
-
-# ✅ 4) Split train/test
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
-
-# ✅ 5) Preprocess
 numeric_features = [
     "age", "height_cm", "weight_kg",
     "has_diabetes", "has_hypertension",
@@ -57,48 +43,230 @@ numeric_features = [
 ]
 categorical_features = ["gender", "goal"]
 
-preprocess = ColumnTransformer(
-    transformers=[
-        ("num", StandardScaler(), numeric_features),
-        ("cat", OneHotEncoder(handle_unknown="ignore"), categorical_features),
-    ]
-)
 
-# ✅ 6) Model (baseline, strong for PP1)
-rf = RandomForestRegressor(
-    n_estimators=400,
-    random_state=42,
-    n_jobs=-1
-)
+def load_dataset(path: str) -> pd.DataFrame:
+    """Load the clean dataset and fill missing values."""
+    df = pd.read_csv(path)
+
+    # ✅ Handle missing values (safe)
+    df["stress_score"] = df["stress_score"].fillna(df["stress_score"].median())
+    df["active_minutes"] = df["active_minutes"].fillna(df["active_minutes"].median())
+    df["has_diabetes"] = df["has_diabetes"].fillna(0).astype(int)
+    df["has_hypertension"] = df["has_hypertension"].fillna(0).astype(int)
+
+    # Ensure targets exist
+    return df.dropna(subset=target_cols).reset_index(drop=True)
+
+
+def build_pipeline(regressor) -> Pipeline:
+    """Wrap a regressor with the feature preprocessing used at serving time."""
+    preprocess = ColumnTransformer(
+        transformers=[
+            ("num", StandardScaler(), numeric_features),
+            ("cat", OneHotEncoder(handle_unknown="ignore"), categorical_features),
+        ]
+    )
+    return Pipeline(steps=[
+        ("preprocess", preprocess),
+        ("regressor", regressor)
+    ])
+
+
+def baseline_regressor(n_jobs: int = -1):
+    """The original model: one 400-tree forest per target."""
+    return MultiOutputRegressor(RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=n_jobs))
+
+
+def candidate_regressors(n_jobs: int = -1) -> dict:
+    """Regressors compared by --select (name -> unfitted regressor)."""
+    return {
+        "rf400_per_target": baseline_regressor(n_jobs),
+        # Native multi-output forests fit one forest for all four targets
+        "rf400": RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=n_jobs),
+        "rf200": RandomForestRegressor(n_estimators=200, random_state=42, n_jobs=n_jobs),
+        "rf100_depth12": RandomForestRegressor(n_estimators=100, max_depth=12, random_state=42, n_jobs=n_jobs),
+        "rf200_leaf3": RandomForestRegressor(n_estimators=200, min_samples_leaf=3, random_state=42, n_jobs=n_jobs),
+        "rf50_depth10": RandomForestRegressor(n_estimators=50, max_depth=10, random_state=42, n_jobs=n_jobs),
+        "hist_gbr": MultiOutputRegressor(HistGradientBoostingRegressor(max_iter=200, random_state=42)),
+    }
+
+
+def evaluate_on_test(model, X_test, y_test) -> dict:
+    """Print and return MAE/RMSE/R² per target on the held-out split."""
+    pred = model.predict(X_test)
+
+    print("\n=== Model Evaluation (Regression) ===")
+    metrics = {}
+    for i, col in enumerate(target_cols):
+        y_true = y_test[col].values
+        y_pred = pred[:, i]
+
+        mae = mean_absolute_error(y_true, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_true, y_pred))
+        r2 = r2_score(y_true, y_pred)
+        metrics[col] = {"mae": mae, "rmse": rmse, "r2": r2}
+
+        print(f"{col}: MAE={mae:.2f} | RMSE={rmse:.2f} | R2={r2:.3f}")
+
+    # Optional: one overall score across all outputs (avg)
+    overall_r2 = r2_score(y_test.values, pred, multioutput="uniform_average")
+    print(f"\nOverall R2 (average across outputs): {overall_r2:.3f}")
+    return metrics
+
+
+def cross_validate_candidate(name: str, regressor, X, y, folds: int) -> dict:
+    """Cross-validate one candidate pipeline, then refit it on all of X for latency and size."""
+    model = build_pipeline(regressor)
+    scores = cross_validate(
+        model, X, y,
+        cv=KFold(n_splits=folds, shuffle=True, random_state=42),
+        scoring={
+            "mae": "neg_mean_absolute_error",
+            "rmse": "neg_root_mean_squared_error",
+            "r2": "r2",
+        },
+    )
+    model.fit(X, y)
+    return {
+        "name": name,
+        "model": model,
+        "mae": -scores["test_mae"].mean(),
+        "rmse": -scores["test_rmse"].mean(),
+        "r2": scores["test_r2"].mean(),
+        "fit_seconds": scores["fit_time"].mean(),
+    }
+
+
+def measure_latency(model, X, batch_size: int = 256, repeat: int = 50) -> dict:
+    """Median single-row and batch latency (ms) through the serving path, plus artifact sizes."""
+    # Serve a copy with the same settings as the API (compiled forests when possible)
+    predictor = FastNutritionPredictor(copy.deepcopy(model), n_jobs=1)
+    rows = X.to_dict(orient="records")
+    batch = (rows * (batch_size // len(rows) + 1))[:batch_size]
+
+    def median_ms(func, runs):
+        func()  # warm-up
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return float(np.median(timings))
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return {
+        "single_ms": median_ms(lambda: predictor.predict(rows[0]), repeat),
+        "batch_ms": median_ms(lambda: predictor.predict_batch(batch), max(1, repeat // 10)),
+        "pickle_bytes": buffer.getbuffer().nbytes,
+        "compiled_bytes": predictor.compiled.nbytes if predictor.compiled is not None else None,
+    }
+
+
+def select_model(X_train, y_train, latency_budget_ms: float, folds: int = 5, n_jobs: int = -1,
+                 r2_tolerance: float = 0.002):
+    """
+    Evaluate every candidate and return the most accurate one within the latency budget.
+
+    Candidates whose CV R² is within r2_tolerance of the best are treated as equally
+    accurate, and the fastest of them is selected.
+
+    Candidates are cross-validated in parallel (one joblib worker per candidate, each
+    fitting single-threaded); latencies are measured afterwards, one candidate at a time.
+
+    Returns:
+        tuple: (selected result dict, list of all result dicts)
+    """
+    candidates = candidate_regressors(n_jobs=1)
+    results = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(cross_validate_candidate)(name, regressor, X_train, y_train, folds)
+        for name, regressor in candidates.items()
+    )
+
+    sample = X_train.head(64)
+    for result in results:
+        result.update(measure_latency(result["model"], sample))
+
+    print("\n=== Candidate Models (CV on training split) ===")
+    print(f"{'candidate':<18} {'MAE':>8} {'RMSE':>8} {'R2':>6} {'1-row ms':>9} {'256-row ms':>11} {'pickle MB':>10} {'compiled MB':>12}")
+    for result in results:
+        compiled_mb = f"{result['compiled_bytes'] / 2**20:12.1f}" if result["compiled_bytes"] else f"{'-':>12}"
+        print(
+            f"{result['name']:<18} {result['mae']:8.2f} {result['rmse']:8.2f} {result['r2']:6.3f} "
+            f"{result['single_ms']:9.2f} {result['batch_ms']:11.2f} {result['pickle_bytes'] / 2**20:10.1f} {compiled_mb}"
+        )
+
+    within_budget = [result for result in results if result["single_ms"] <= latency_budget_ms]
+    if within_budget:
+        best_r2 = max(result["r2"] for result in within_budget)
+        selected = min(
+            (result for result in within_budget if result["r2"] >= best_r2 - r2_tolerance),
+            key=lambda result: result["single_ms"]
+        )
+    else:
+        selected = min(results, key=lambda result: result["single_ms"])
+        print(f"\n⚠️ No candidate meets the {latency_budget_ms} ms budget; using the fastest one")
+
+    print(f"\n✅ Selected: {selected['name']} (CV R2={selected['r2']:.3f}, {selected['single_ms']:.2f} ms per row)")
+    return selected, results
+
+
+def save_model(model):
+    """Save the trained pipeline and, when its forests compile, the memory-mappable export."""
+    os.makedirs("artifacts", exist_ok=True)
+    joblib.dump(model, "artifacts/nutrition_model.pkl")
+    print("\n✅ Model saved to: artifacts/nutrition_model.pkl")
+
+    # Compiled flat-array export (memory-mapped by the API workers)
+    predictor = FastNutritionPredictor(model, n_jobs=1)
+    if predictor.compiled is not None:
+        predictor.save("artifacts/nutrition_model_compiled")
+        print("✅ Compiled model saved to: artifacts/nutrition_model_compiled/")
+    else:
+        print("ℹ️ Model is not a random forest; no compiled export written")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the nutrition model")
+    parser.add_argument("--data", default=DATA_PATH, help="Training CSV")
+    parser.add_argument("--select", action="store_true", help="Pick the model from the candidate list instead of the baseline")
+    parser.add_argument("--latency-budget-ms", type=float, default=5.0, help="Max single-row serving latency for --select")
+    parser.add_argument("--r2-tolerance", type=float, default=0.002, help="CV R2 difference treated as a tie (fastest wins)")
+    parser.add_argument("--cv", type=int, default=5, help="Cross-validation folds for --select")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Parallel workers")
+    args = parser.parse_args()
 
-model = Pipeline(steps=[
-    ("preprocess", preprocess),
-    ("regressor", MultiOutputRegressor(rf))
-])
+    # ✅ 1) Load clean dataset
+    df = load_dataset(args.data)
 
-# ✅ 7) Train
-model.fit(X_train, y_train)
+    # ✅ 2) Inputs (X) and Outputs (y)
+    X = df[feature_cols]
+    y = df[target_cols]
 
-# ✅ 8) Evaluate (Regression metrics: MAE, RMSE, R²)
-pred = model.predict(X_test)
+    # ✅ 3) Split train/test
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
 
-print("\n=== Model Evaluation (Regression) ===")
-for i, col in enumerate(target_cols):
-    y_true = y_test[col].values
-    y_pred = pred[:, i]
+    # ✅ 4) Model (baseline, strong for PP1), or the best candidate within the latency budget
+    if args.select:
+        selected, _ = select_model(
+            X_train, y_train, args.latency_budget_ms,
+            folds=args.cv, n_jobs=args.n_jobs, r2_tolerance=args.r2_tolerance
+        )
+        model = build_pipeline(candidate_regressors(n_jobs=args.n_jobs)[selected["name"]])
+    else:
+        model = build_pipeline(baseline_regressor(n_jobs=args.n_jobs))
 
-    mae = mean_absolute_error(y_true, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_true, y_pred))
-    r2 = r2_score(y_true, y_pred)
+    # ✅ 5) Train
+    model.fit(X_train, y_train)
 
-    print(f"{col}: MAE={mae:.2f} | RMSE={rmse:.2f} | R2={r2:.3f}")
+    # ✅ 6) Evaluate (Regression metrics: MAE, RMSE, R²)
+    evaluate_on_test(model, X_test, y_test)
 
-# Optional: one overall score across all outputs (avg)
-overall_r2 = r2_score(y_test.values, pred, multioutput="uniform_average")
-print(f"\nOverall R2 (average across outputs): {overall_r2:.3f}")
+    # ✅ 7) Save trained model
+    save_model(model)
 
-# ✅ 9) Save trained model
-os.makedirs("artifacts", exist_ok=True)
-joblib.dump(model, "artifacts/nutrition_model.pkl")
 
-print("\n✅ Model saved to: artifacts/nutrition_model.pkl")
+if __name__ == "__main__":
+    main()